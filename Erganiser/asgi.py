@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Erganiser.settings")
 
 application = get_asgi_application()
+
+if settings.C2_ASYNC_VIEWS:
+    # WhiteNoise is left out of the middleware with the async views
+    application = ASGIStaticFilesHandler(application)
@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "logbook.middleware.ViewMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -92,12 +93,44 @@ DATABASES = {
         "USER": os.environ.get("DB_USER", "test"),
         "PASSWORD": os.environ.get("DB_PASS", "test"),
         "HOST": os.environ.get("DB_HOST", "localhost"),
-        "PORT": "5432",
+        "PORT": os.environ.get("DB_PORT", "5432"),
+        # Keep the connection of a process open between requests instead of
+        # connecting for every one, and check it before it is reused.
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": os.environ.get("DB_CONN_HEALTH_CHECKS") != "False",
+        # pgbouncer in transaction pooling mode hands every transaction to
+        # another server connection, so server side cursors cannot be used.
+        "DISABLE_SERVER_SIDE_CURSORS": os.environ.get("DB_POOLER") == "pgbouncer",
+    }
+}
+
+# Caches
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# The local memory cache is only shared by the threads of one process. If the
+# app runs in several processes, use a shared backend such as
+# django.core.cache.backends.redis.RedisCache (redis://host:6379) or
+# django.core.cache.backends.filebased.FileBasedCache (/var/tmp/erganiser)
+# so that every process sees the invalidations of the dashboard cache.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "erganiser"),
+        "TIMEOUT": int(os.environ.get("CACHE_TIMEOUT", 300)),
     }
 }
 
 # AUTH_USER_MODEL = users.
 
+# The user of every request is loaded with its member and profile. Sessions
+# started before are still loaded by the ModelBackend they were logged in with.
+AUTHENTICATION_BACKENDS = [
+    "users.backends.MemberBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -194,6 +227,34 @@ USE_SES_V2 = True
 
 C2_CLIENT_SECRET = os.getenv("C2_CLIENT_SECRET")
 C2_CLIENT_ID = os.getenv("C2_CLIENT_ID")
+C2_API_BASE_URL = os.getenv("C2_API_BASE_URL", "https://log.concept2.com")
+# Settings of the shared http client in users/c2_client.py
+C2_API_CONNECT_TIMEOUT = float(os.getenv("C2_API_CONNECT_TIMEOUT", "3.05"))
+C2_API_READ_TIMEOUT = float(os.getenv("C2_API_READ_TIMEOUT", "30"))
+C2_API_RETRIES = int(os.getenv("C2_API_RETRIES", "3"))
+C2_API_RETRY_BACKOFF = float(os.getenv("C2_API_RETRY_BACKOFF", "0.5"))
+C2_API_POOL_SIZE = int(os.getenv("C2_API_POOL_SIZE", "10"))
+# Results per page requested from the concept2 logbook api and how many of
+# these pages are requested in parallel while syncing.
+C2_RESULTS_PAGE_SIZE = int(os.getenv("C2_RESULTS_PAGE_SIZE", "250"))
+C2_RESULTS_CONCURRENCY = int(os.getenv("C2_RESULTS_CONCURRENCY", "1"))
+# Serve the concept2 oauth and sync views as async views from an ASGI server,
+# see the README. WhiteNoise can only run synchronously and would make Django
+# run every request in a thread again, so Erganiser/asgi.py serves the static
+# files instead.
+C2_ASYNC_VIEWS = os.getenv("C2_ASYNC_VIEWS", "False").lower() in ("true", "1")
+if C2_ASYNC_VIEWS:
+    MIDDLEWARE.remove("whitenoise.middleware.WhiteNoiseMiddleware")
+    # Async requests run their database code in a new thread each, which
+    # would leave a persistent connection behind for every request.
+    if "DB_CONN_MAX_AGE" not in os.environ:
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+# Concept2 syncs are processed by `manage.py run_sync_worker`. Failed syncs are
+# retried with an exponential backoff starting at SYNC_JOB_RETRY_DELAY seconds
+# and running jobs are taken over by another worker after SYNC_JOB_TIMEOUT.
+SYNC_JOB_MAX_ATTEMPTS = int(os.getenv("SYNC_JOB_MAX_ATTEMPTS", "5"))
+SYNC_JOB_RETRY_DELAY = int(os.getenv("SYNC_JOB_RETRY_DELAY", "60"))
+SYNC_JOB_TIMEOUT = int(os.getenv("SYNC_JOB_TIMEOUT", "1800"))
 
 # Django-Verify-Email settings
 SUBJECT = "Verify Erganiser Logbook Account"
@@ -62,7 +62,13 @@ urlpatterns = [
         ),
         name="password_reset_complete",
     ),
-    path("oauth_with_c2", user_views.oauth_with_c2, name="oauth_with_c2"),
+    path(
+        "oauth_with_c2",
+        user_views.oauth_with_c2_async
+        if settings.C2_ASYNC_VIEWS
+        else user_views.oauth_with_c2,
+        name="oauth_with_c2",
+    ),
     path("verification/", include("verify_email.urls")),
 ]
 
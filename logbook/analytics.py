@@ -0,0 +1,218 @@
+"""
+Progress analytics of the erg history of members. The ergs are loaded with a
+single values_list query into numpy arrays, one per column, and all
+statistics are computed on the whole arrays instead of looping over ergs.
+"""
+import numpy as np
+
+from .models import FinishedErg
+
+STANDARD_DISTANCES = (500, 1000, 2000, 5000, 6000, 10000)
+ROLLING_WINDOW = 10
+DAYS_PER_MONTH = 30
+
+HISTORY_FIELDS = (
+    "completed_by_id",
+    "completed_at",
+    "distance",
+    "split_time",
+    "avg_spm",
+    "avg_heartrate",
+    "is_test",
+)
+
+
+class ErgHistory:
+    """
+    Columns of the ergs of one member, ordered by date. Missing stroke rates
+    and heart rates are NaN.
+    """
+
+    def __init__(self, dates, distances, splits, spm, heartrates, is_test):
+        self.dates = dates
+        self.distances = distances
+        self.splits = splits
+        self.spm = spm
+        self.heartrates = heartrates
+        self.is_test = is_test
+
+    def __len__(self):
+        return len(self.dates)
+
+    def take(self, indices):
+        return ErgHistory(
+            self.dates[indices],
+            self.distances[indices],
+            self.splits[indices],
+            self.spm[indices],
+            self.heartrates[indices],
+            self.is_test[indices],
+        )
+
+
+def load_erg_histories(member_ids):
+    """
+    This function loads the ergs of the given members in one query and
+    returns a dict mapping every member id to its ErgHistory.
+    """
+    rows = list(
+        FinishedErg.objects.filter(completed_by_id__in=member_ids)
+        .order_by("completed_by_id", "completed_at", "created_at")
+        .values_list(*HISTORY_FIELDS)
+    )
+    histories = {member_id: None for member_id in member_ids}
+    if rows:
+        member, dates, distances, splits, spm, heartrates, is_test = zip(*rows)
+        columns = ErgHistory(
+            np.array(dates, dtype="datetime64[D]"),
+            np.array(distances, dtype=np.int64),
+            np.array(splits, dtype="timedelta64[us]") / np.timedelta64(1, "s"),
+            # None becomes NaN in float arrays
+            np.array(spm, dtype=float),
+            np.array(heartrates, dtype=float),
+            np.array(is_test, dtype=bool),
+        )
+        member = np.array(member)
+        # The rows are ordered by member, so every member is one slice
+        member_ids_found, starts = np.unique(member, return_index=True)
+        ends = np.append(starts[1:], len(member))
+        for member_id, start, end in zip(member_ids_found, starts, ends):
+            histories[member_id.item()] = columns.take(slice(start, end))
+    empty = ErgHistory(
+        *[
+            np.array([], dtype)
+            for dtype in ["datetime64[D]", int, float, float, float, bool]
+        ]
+    )
+    return {
+        member_id: empty if history is None else history
+        for member_id, history in histories.items()
+    }
+
+
+def load_erg_history(member_id):
+    return load_erg_histories([member_id])[member_id]
+
+
+def get_rolling_average(values, window=ROLLING_WINDOW):
+    """
+    This function returns the average of every value and the window - 1
+    values before it, skipping NaN. The first values average over fewer.
+    """
+    present = ~np.isnan(values)
+    sums = np.cumsum(np.where(present, values, 0))
+    counts = np.cumsum(present)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+def format_split(seconds):
+    minutes, seconds = divmod(round(float(seconds), 1), 60)
+    return "{:d}:{:04.1f}".format(int(minutes), seconds)
+
+
+def get_personal_bests(history, distances=STANDARD_DISTANCES):
+    """
+    This function returns the best split and its date for every standard
+    distance the member has rowed.
+    """
+    personal_bests = {}
+    for distance in distances:
+        indices = np.flatnonzero(history.distances == distance)
+        if not len(indices):
+            continue
+        best = indices[np.argmin(history.splits[indices])]
+        personal_bests[distance] = {
+            "split": float(history.splits[best]),
+            "pace": format_split(history.splits[best]),
+            "date": str(history.dates[best]),
+        }
+    return personal_bests
+
+
+def get_monthly_volume(history):
+    """
+    This function returns the months with ergs together with the metres and
+    the number of ergs rowed in each of them.
+    """
+    months, month_index = np.unique(
+        history.dates.astype("datetime64[M]"), return_inverse=True
+    )
+    metres = np.bincount(month_index, weights=history.distances, minlength=len(months))
+    ergs = np.bincount(month_index, minlength=len(months))
+    return {
+        "months": np.datetime_as_string(months).tolist(),
+        "metres": metres.astype(int).tolist(),
+        "ergs": ergs.tolist(),
+    }
+
+
+def get_split_trends(history, distances=STANDARD_DISTANCES):
+    """
+    This function fits a line through the splits of every standard distance
+    and returns how many seconds the split changes per month. A negative
+    trend means the member is getting faster.
+    """
+    trends = {}
+    days = history.dates.astype(np.int64)
+    for distance in distances:
+        mask = history.distances == distance
+        if np.count_nonzero(mask) < 2 or np.ptp(days[mask]) == 0:
+            continue
+        slope, _ = np.polyfit(days[mask], history.splits[mask], 1)
+        trends[distance] = round(float(slope) * DAYS_PER_MONTH, 2)
+    return trends
+
+
+def nan_to_none(values):
+    return np.where(np.isnan(values), None, np.round(values, 1)).tolist()
+
+
+def get_progress(history, window=ROLLING_WINDOW):
+    """
+    This function returns all statistics of an erg history as a dict which
+    can be sent as JSON to the charts.
+    """
+    personal_bests = get_personal_bests(history)
+    split_trends = get_split_trends(history)
+    return {
+        "ergs": len(history),
+        "dates": np.datetime_as_string(history.dates).tolist(),
+        "splits": nan_to_none(history.splits),
+        "rolling_splits": nan_to_none(get_rolling_average(history.splits, window)),
+        "rolling_spm": nan_to_none(get_rolling_average(history.spm, window)),
+        "rolling_heartrates": nan_to_none(
+            get_rolling_average(history.heartrates, window)
+        ),
+        "personal_bests": personal_bests,
+        "monthly_volume": get_monthly_volume(history),
+        "split_trends": split_trends,
+        # One row per distance for the table of the progress view
+        "summary": [
+            dict(best, distance=distance, trend=split_trends.get(distance))
+            for distance, best in personal_bests.items()
+        ],
+    }
+
+
+def get_squad_progress(members):
+    """
+    This function returns the personal bests, the split trends and the total
+    metres of every given member, loaded with a single query.
+    """
+    histories = load_erg_histories([member.pk for member in members])
+    squad_progress = []
+    for member in members:
+        history = histories[member.pk]
+        squad_progress.append(
+            {
+                "member": str(member),
+                "ergs": len(history),
+                "metres": int(history.distances.sum()),
+                "personal_bests": get_personal_bests(history),
+                "split_trends": get_split_trends(history),
+            }
+        )
+    return squad_progress
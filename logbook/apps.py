@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LogbookConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "logbook"
+
+    def ready(self):
+        import logbook.signals
+        from logbook.quotes import get_quotes
+
+        get_quotes()
@@ -0,0 +1,477 @@
+"""
+Synthetic club data and a benchmark runner for the views of the logbook, so
+the cost of a change can be compared across commits.
+
+    python3 manage.py seed_benchmark_data --squads 8 --members 200 --ergs 50000
+    python3 manage.py run_benchmarks --output benchmark.json
+"""
+import datetime
+import math
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+
+from users import c2_client
+from users.models import Member, Squad
+from .club_leaderboard import refresh_club_leaderboards
+from .jobs import claim_sync_job, run_sync_job
+from .leaderboard import rebuild_leaderboards
+from .models import FinishedErg, SquadMonthlyLeaderboard, SyncJob
+from .pace import (
+    calculate_calories_per_hour,
+    calculate_split_time,
+    calculate_watts,
+    convert_c2_workouts,
+    convert_date_field,
+    format_duration,
+)
+from .pagination import NEXT, encode_cursor
+from .personal_bests import rebuild_personal_bests
+from .testing import C2StubServer, make_c2_workout
+
+BENCHMARK_USERNAME_PREFIX = "benchmark-"
+BENCHMARK_SQUAD_PREFIX = "Benchmark Squad "
+BENCHMARK_PASSWORD = "benchmark"
+BENCHMARK_COACH = BENCHMARK_USERNAME_PREFIX + "coach"
+BENCHMARK_SYNC_MEMBER = BENCHMARK_USERNAME_PREFIX + "sync"
+BENCHMARK_C2_USER_ID = 1553112
+
+# (distance, weight) of the tests and of the other ergs people log
+TEST_DISTANCES = [(2000, 6), (5000, 3), (6000, 2), (500, 2), (10000, 1)]
+STEADY_STATE_DISTANCES = [(6000, 3), (8000, 2), (10000, 3), (12000, 1), (16000, 1)]
+TEST_SHARE = 0.1
+HISTORY_DAYS = 365
+ERG_BATCH_SIZE = 1000
+PERSISTENT_CONN_MAX_AGE = 60
+
+
+def get_split_seconds(two_k_split, distance, is_test):
+    """
+    This function estimates the split of an erg from the 2k split of the
+    athlete with Paul's law, which adds five seconds per 500m for every
+    doubling of the distance. Steady state pieces are rowed slower.
+    """
+    split = two_k_split + 5 * math.log2(distance / 2000)
+    if not is_test:
+        split += 12
+    return split
+
+
+def build_benchmark_erg(rng, member, two_k_split, today):
+    is_test = rng.random() < TEST_SHARE
+    distances = TEST_DISTANCES if is_test else STEADY_STATE_DISTANCES
+    distance = rng.choices(
+        [distance for distance, _ in distances],
+        weights=[weight for _, weight in distances],
+    )[0]
+    split_seconds = round(
+        get_split_seconds(two_k_split, distance, is_test) + rng.gauss(0, 2), 1
+    )
+    erg = FinishedErg(
+        name=f"{distance}m. Row",
+        distance=distance,
+        is_test=is_test,
+        completed_by=member,
+        completed_at=today - datetime.timedelta(days=rng.randrange(HISTORY_DAYS)),
+        split_time=datetime.timedelta(seconds=split_seconds),
+        result_time=datetime.timedelta(seconds=split_seconds * distance / 500),
+        avg_spm=rng.randint(18, 32),
+        avg_heartrate=rng.randint(120, 190),
+    )
+    erg.set_derived_metrics()
+    return erg
+
+
+def create_benchmark_user(username, password, squad=None, is_coach=False):
+    # Saving the user one by one lets users/signals.py create the member and
+    # the profile just like on sign up.
+    user = User(username=username, email=f"{username}@example.com", password=password)
+    user.save()
+    Member.objects.filter(pk=user.pk).update(squad=squad, is_coach=is_coach)
+    return user
+
+
+def clear_benchmark_data():
+    """
+    This function deletes everything seed_benchmark_data has created.
+    """
+    members = Member.objects.filter(
+        user__username__startswith=BENCHMARK_USERNAME_PREFIX
+    )
+    squads = Squad.objects.filter(squad_name__startswith=BENCHMARK_SQUAD_PREFIX)
+    SquadMonthlyLeaderboard.objects.filter(squad__in=squads).delete()
+    # Without a squad the signals do not need to refresh any leaderboard for
+    # every deleted erg.
+    members.update(squad=None)
+    FinishedErg.objects.filter(completed_by__in=members).delete()
+    User.objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX).delete()
+    squads.delete()
+    refresh_club_leaderboards()
+    cache.clear()
+
+
+def seed_benchmark_data(squads=8, members=200, ergs=50000, seed=2000):
+    """
+    This function replaces the benchmark data with the given number of squads,
+    members and ergs. The same seed always creates the same club, only the
+    dates move along with the current day.
+    """
+    rng = random.Random(seed)
+    clear_benchmark_data()
+    password = make_password(BENCHMARK_PASSWORD)
+    squad_objects = [
+        Squad.objects.create(squad_name=f"{BENCHMARK_SQUAD_PREFIX}{number + 1}")
+        for number in range(squads)
+    ]
+    create_benchmark_user(BENCHMARK_COACH, password, is_coach=True)
+    create_benchmark_user(BENCHMARK_SYNC_MEMBER, password, squad=squad_objects[0])
+    athletes = []
+    for number in range(members):
+        user = create_benchmark_user(
+            f"{BENCHMARK_USERNAME_PREFIX}member{number + 1}",
+            password,
+            squad=squad_objects[number % squads],
+        )
+        athletes.append((user.member, rng.uniform(95, 130)))
+    today = now().date()
+    batch = []
+    for _ in range(ergs):
+        member, two_k_split = rng.choice(athletes)
+        batch.append(build_benchmark_erg(rng, member, two_k_split, today))
+        if len(batch) == ERG_BATCH_SIZE:
+            FinishedErg.objects.bulk_create(batch)
+            batch = []
+    FinishedErg.objects.bulk_create(batch)
+    # bulk_create does not send signals, so the leaderboards, the personal
+    # bests and the dashboard cache are rebuilt once at the end.
+    rebuild_leaderboards()
+    rebuild_personal_bests()
+    refresh_club_leaderboards()
+    cache.clear()
+
+
+def get_percentile(values, percentile):
+    """
+    This function returns the nearest rank percentile of the values.
+    """
+    values = sorted(values)
+    index = max(0, math.ceil(percentile / 100 * len(values)) - 1)
+    return values[index]
+
+
+def summarise(timings, **counts):
+    """
+    This function returns the percentiles of the timings in milliseconds and
+    the highest value of every count, e.g. the database queries per run.
+    """
+    milliseconds = [seconds * 1000 for seconds in timings]
+    summary = {
+        "runs": len(milliseconds),
+        "p50_ms": round(get_percentile(milliseconds, 50), 2),
+        "p90_ms": round(get_percentile(milliseconds, 90), 2),
+        "p99_ms": round(get_percentile(milliseconds, 99), 2),
+        "mean_ms": round(statistics.mean(milliseconds), 2),
+        "min_ms": round(min(milliseconds), 2),
+        "max_ms": round(max(milliseconds), 2),
+    }
+    for name, values in counts.items():
+        summary[name] = max(values)
+    return summary
+
+
+def measure(run, iterations, warmup=1, before_each=None):
+    """
+    This function calls run the given number of times and returns the
+    summary of its wall time and database queries. The warmup runs fill the
+    caches and are not measured.
+    """
+    timings = []
+    query_counts = []
+    for iteration in range(warmup + iterations):
+        if before_each is not None:
+            before_each()
+        with CaptureQueriesContext(connection) as queries:
+            started_at = time.perf_counter()
+            response = run()
+            seconds = time.perf_counter() - started_at
+        if getattr(response, "status_code", 200) >= 400:
+            raise RuntimeError(
+                "Benchmark request failed with {}".format(response.status_code)
+            )
+        if iteration >= warmup:
+            timings.append(seconds)
+            query_counts.append(len(queries))
+    return summarise(timings, queries=query_counts)
+
+
+def get_benchmark_member():
+    """
+    This function returns the first seeded athlete, whose views are measured.
+    """
+    member = (
+        Member.objects.filter(
+            user__username__startswith=BENCHMARK_USERNAME_PREFIX + "member"
+        )
+        .order_by("user__username")
+        .first()
+    )
+    if member is None:
+        raise RuntimeError("Run seed_benchmark_data before the benchmarks.")
+    return member
+
+
+def get_deep_history_cursor(member):
+    """
+    This function returns the cursor of the erg history page of the member
+    which shows the oldest tenth of the ergs, or None if the member has no
+    ergs.
+    """
+    ergs = FinishedErg.objects.filter(completed_by=member).order_by(
+        "-completed_at", "-id"
+    )
+    count = ergs.count()
+    if not count:
+        return None
+    return encode_cursor(ergs[count * 9 // 10], NEXT)
+
+
+def benchmark_sync(client, member, iterations, workouts_per_sync):
+    """
+    This function measures a full sync of the member against a local stub of
+    the concept2 api, from queueing it in the view to storing the workouts in
+    the worker. The synced ergs are deleted before every run.
+    """
+    workouts = [
+        make_c2_workout(
+            workout_id=100000 + number,
+            distance=6000,
+            time=15000 + number,
+            date=f"2023-03-{number % 28 + 1:02d} 09:00:00",
+        )
+        for number in range(workouts_per_sync)
+    ]
+    profile = member.user.profile
+    profile.c2_logbook_id = str(BENCHMARK_C2_USER_ID)
+    profile.c2_api_key = "benchmark"
+    profile.save()
+    url = reverse("logbook:sync_c2_erg_data")
+
+    def delete_synced_ergs():
+        FinishedErg.objects.filter(completed_by=member).delete()
+
+    def sync():
+        response = client.get(url)
+        # Only the job of the member is run, not the queue of the database
+        job = SyncJob.objects.filter(member=member, status=SyncJob.QUEUED).first()
+        if job is not None:
+            job = claim_sync_job(job)
+        if job is None:
+            raise RuntimeError("The sync view did not queue a sync job.")
+        if run_sync_job(job).stored_ergs:
+            refresh_club_leaderboards()
+        return response
+
+    with C2StubServer(workouts) as server:
+        with override_settings(C2_API_BASE_URL=server.base_url):
+            c2_client.reset_session()
+            try:
+                return measure(sync, iterations, before_each=delete_synced_ergs)
+            finally:
+                c2_client.reset_session()
+
+
+def benchmark_workout_conversion(iterations, workouts_per_page):
+    """
+    This function measures converting a page of workouts of the concept2
+    logbook api one workout at a time and with the batch conversion of
+    logbook/pace.py. Both run in memory, without the database.
+    """
+    workouts = [
+        make_c2_workout(
+            workout_id=number,
+            distance=6000,
+            time=15000 + number,
+            date=f"2023-03-{number % 28 + 1:02d} 09:00:00",
+        )
+        for number in range(workouts_per_page)
+    ]
+
+    def convert_one_by_one():
+        for workout in workouts:
+            split_time = calculate_split_time(workout["time"], workout["distance"])
+            convert_date_field(workout["date"])
+            format_duration(workout["time"])
+            calculate_watts(split_time)
+            calculate_calories_per_hour(split_time)
+
+    def convert_batch():
+        convert_c2_workouts(workouts)
+
+    results = {}
+    for name, convert in (("one_by_one", convert_one_by_one), ("batch", convert_batch)):
+        timings = []
+        # The first run is not measured
+        for iteration in range(1 + iterations):
+            started_at = time.perf_counter()
+            convert()
+            if iteration:
+                timings.append(time.perf_counter() - started_at)
+        results[name] = summarise(timings)
+    return results
+
+
+def measure_connect(iterations):
+    """
+    This function measures how long opening a database connection takes.
+    """
+    timings = []
+    for _ in range(iterations):
+        connection.close()
+        started_at = time.perf_counter()
+        connection.ensure_connection()
+        timings.append(time.perf_counter() - started_at)
+    return summarise(timings)
+
+
+def benchmark_connection_overhead(client, url, iterations):
+    """
+    This function measures a view with a new database connection per request,
+    like CONN_MAX_AGE=0, and with a persistent connection. The test client
+    does not close connections after a request, so this is done here like the
+    request_finished signal does it on a server. Every summary counts the
+    connections opened per request. It cannot run inside a transaction, as
+    the connection is closed in between.
+    """
+    connects = []
+
+    def count_connect(sender, **kwargs):
+        connects.append(kwargs["connection"].alias)
+
+    def get_like_a_server():
+        response = client.get(url)
+        close_old_connections()
+        return response
+
+    results = {}
+    conn_max_age = connection.settings_dict["CONN_MAX_AGE"]
+    connection_created.connect(count_connect)
+    try:
+        for mode, max_age in (
+            ("new_connection", 0),
+            ("persistent_connection", PERSISTENT_CONN_MAX_AGE),
+        ):
+            connection.settings_dict["CONN_MAX_AGE"] = max_age
+            connection.close()
+            timings = []
+            connect_counts = []
+            # The first request warms up the caches and is not measured
+            for iteration in range(1 + iterations):
+                del connects[:]
+                started_at = time.perf_counter()
+                response = get_like_a_server()
+                seconds = time.perf_counter() - started_at
+                if response.status_code >= 400:
+                    raise RuntimeError(
+                        "Benchmark request failed with {}".format(response.status_code)
+                    )
+                if iteration:
+                    timings.append(seconds)
+                    connect_counts.append(len(connects))
+            results[mode] = summarise(timings, connections=connect_counts)
+        results["connect"] = measure_connect(iterations)
+    finally:
+        connection_created.disconnect(count_connect)
+        connection.settings_dict["CONN_MAX_AGE"] = conn_max_age
+        connection.close()
+    return results
+
+
+def run_benchmarks(iterations=20, workouts_per_sync=200):
+    """
+    This function times the main views with the seeded data and returns the
+    results as a dict, which can be written to a JSON file.
+    """
+    member = get_benchmark_member()
+    coach = User.objects.get(username=BENCHMARK_COACH)
+    sync_member = User.objects.get(username=BENCHMARK_SYNC_MEMBER).member
+    today = now().date()
+    scoreboard_url = reverse(
+        "logbook:squad-scoreboard",
+        kwargs={"year": today.year, "month": today.month},
+    )
+    member_client = Client()
+    member_client.force_login(member.user)
+    coach_client = Client()
+    coach_client.force_login(coach)
+    sync_client = Client()
+    sync_client.force_login(sync_member.user)
+
+    cases = {
+        "index_member": (member_client, reverse("logbook:index")),
+        "index_coach": (
+            coach_client,
+            reverse("logbook:index") + "?squad={}".format(member.squad_id),
+        ),
+        "erg_history": (member_client, reverse("logbook:erg-history")),
+        "erg_history_last_page": (
+            member_client,
+            reverse("logbook:erg-history") + "?page=last",
+        ),
+        "squad_scoreboard_member": (member_client, scoreboard_url),
+        "squad_scoreboard_coach": (coach_client, scoreboard_url),
+        "club_leaderboard": (
+            member_client,
+            reverse("logbook:club-leaderboard") + "?period=all-time",
+        ),
+    }
+    deep_history_cursor = get_deep_history_cursor(member)
+    if deep_history_cursor is not None:
+        cases["erg_history_deep_cursor"] = (
+            member_client,
+            reverse("logbook:erg-history") + "?cursor={}".format(deep_history_cursor),
+        )
+    results = {}
+    with override_settings(ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ["testserver"]):
+        for name, (client, url) in cases.items():
+            results[name] = measure(lambda: client.get(url), iterations)
+        results["sync_c2_erg_data"] = benchmark_sync(
+            sync_client, sync_member, iterations, workouts_per_sync
+        )
+        conversion = benchmark_workout_conversion(iterations, workouts_per_sync)
+        for mode, result in conversion.items():
+            results["convert_c2_workouts_" + mode] = result
+        # Inside a transaction, e.g. in the tests, the connection stays open
+        if not connection.in_atomic_block:
+            overhead = benchmark_connection_overhead(
+                member_client, reverse("logbook:index"), iterations
+            )
+            for mode, result in overhead.items():
+                name = mode if mode == "connect" else "index_member_" + mode
+                results[name] = result
+    return {
+        "created_at": now().isoformat(),
+        "database": connection.vendor,
+        "iterations": iterations,
+        "data": {
+            "squads": Squad.objects.filter(
+                squad_name__startswith=BENCHMARK_SQUAD_PREFIX
+            ).count(),
+            "members": Member.objects.filter(
+                user__username__startswith=BENCHMARK_USERNAME_PREFIX
+            ).count(),
+            "ergs": FinishedErg.objects.count(),
+            "workouts_per_sync": workouts_per_sync,
+        },
+        "results": results,
+    }
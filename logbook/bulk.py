@@ -0,0 +1,88 @@
+"""
+Bulk changes to the ergs of one member from the erg history, e.g. to clean up
+after a sync which stored the wrong workouts. Every change is limited to the
+ergs of the member. The signals of logbook/signals.py would refresh the
+leaderboards once per erg, so they are paused and the squad leaderboards,
+personal bests and club leaderboards the ergs are part of are refreshed once
+afterwards.
+"""
+from django.db import transaction
+
+from .cache import invalidate_member, invalidate_squad
+from .club_leaderboard import refresh_club_leaderboards
+from .leaderboard import get_leaderboard_bucket, refresh_squad_leaderboard
+from .models import FinishedErg
+from .personal_bests import refresh_personal_bests
+from .signals import pause_per_erg_updates
+
+BULK_UPDATE_FIELDS = ["is_test", "effort"]
+
+
+def get_member_ergs(member_id, erg_ids):
+    return FinishedErg.objects.filter(completed_by_id=member_id, pk__in=erg_ids)
+
+
+def get_affected_leaderboards(ergs, is_test=None):
+    """
+    This function returns the leaderboard buckets and the distances of the
+    ergs, before and, if is_test changes, after the change.
+    """
+    buckets = set()
+    distances = set()
+    for squad_id, completed_at, distance, was_test in ergs.values_list(
+        "completed_by__squad_id", "completed_at", "distance", "is_test"
+    ):
+        buckets.add(get_leaderboard_bucket(squad_id, completed_at, distance, was_test))
+        if is_test is not None:
+            buckets.add(
+                get_leaderboard_bucket(squad_id, completed_at, distance, is_test)
+            )
+        distances.add(distance)
+    return buckets - {None}, distances
+
+
+def refresh_squad_leaderboards(buckets):
+    for bucket in buckets:
+        refresh_squad_leaderboard(*bucket)
+        invalidate_squad(bucket[0])
+
+
+def delete_ergs(member_id, erg_ids):
+    """
+    This function deletes the given ergs of the member and returns how many
+    were deleted. Ergs of other members are left alone.
+    """
+    ergs = get_member_ergs(member_id, erg_ids)
+    with transaction.atomic():
+        buckets, distances = get_affected_leaderboards(ergs)
+        with pause_per_erg_updates():
+            _, deleted_by_model = ergs.delete()
+        deleted = deleted_by_model.get(FinishedErg._meta.label, 0)
+        refresh_squad_leaderboards(buckets)
+        refresh_personal_bests(member_id, distances)
+        invalidate_member(member_id)
+    if deleted:
+        refresh_club_leaderboards()
+    return deleted
+
+
+def update_ergs(member_id, erg_ids, **changes):
+    """
+    This function sets the given fields, one of BULK_UPDATE_FIELDS, on the
+    given ergs of the member and returns how many were updated.
+    """
+    unknown_fields = set(changes) - set(BULK_UPDATE_FIELDS)
+    if unknown_fields:
+        raise ValueError(
+            "Cannot update {} in bulk.".format(", ".join(sorted(unknown_fields)))
+        )
+    ergs = get_member_ergs(member_id, erg_ids)
+    with transaction.atomic():
+        # Of the fields only is_test matters, for the squad leaderboards
+        buckets = set()
+        if "is_test" in changes:
+            buckets, _ = get_affected_leaderboards(ergs, changes["is_test"])
+        updated = ergs.update(**changes)
+        refresh_squad_leaderboards(buckets)
+        invalidate_member(member_id)
+    return updated
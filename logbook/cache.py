@@ -0,0 +1,143 @@
+"""
+Cache for the data shown on the dashboard. Every squad has a generation
+counter which is part of the keys of its cached leaderboards, so all of them
+are invalidated at once by bumping the counter instead of deleting each key.
+The entries are refreshed by the signals in logbook/signals.py. Members and
+the list of squads have generation counters as well, which together with
+the ones of the squads version the pages for conditional requests (see
+logbook/etags.py).
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from users.models import Squad
+from .leaderboard import get_leaderboard_distance, get_top_entries_and_member_entry
+
+SQUADS_KEY = "logbook:squads"
+SQUADS_GENERATION_KEY = "logbook:squads-generation"
+SQUAD_GENERATION_KEY = "logbook:squad-generation:{squad_id}"
+MEMBER_GENERATION_KEY = "logbook:member-generation:{member_id}"
+LEADERBOARD_DISTANCE_KEY = (
+    "logbook:leaderboard-distance:{squad_id}:{generation}:{year}:{month}"
+)
+LEADERBOARD_KEY = (
+    "logbook:leaderboard:{squad_id}:{generation}:{year}:{month}:{distance}"
+)
+
+
+def get_generation(key):
+    """
+    This function returns the current value of a generation counter. A new
+    counter starts at the current time, so a cache which lost the counter
+    does not hand out entries of an earlier generation again.
+    """
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_generation_on_commit(key):
+    """
+    This function bumps a generation counter now and again once the
+    transaction is committed, otherwise a request reading in between could
+    cache the old rows under the new generation.
+    """
+    bump_generation(key)
+    transaction.on_commit(lambda: bump_generation(key))
+
+
+def get_squad_generation(squad_id):
+    return get_generation(SQUAD_GENERATION_KEY.format(squad_id=squad_id))
+
+
+def get_member_generation(member_id):
+    return get_generation(MEMBER_GENERATION_KEY.format(member_id=member_id))
+
+
+def get_squads_generation():
+    return get_generation(SQUADS_GENERATION_KEY)
+
+
+def invalidate_squad(squad_id):
+    """
+    This function invalidates the cached leaderboards of a squad.
+    """
+    if squad_id is None:
+        return
+    bump_generation_on_commit(SQUAD_GENERATION_KEY.format(squad_id=squad_id))
+
+
+def invalidate_member(member_id):
+    """
+    This function marks the ergs, personal bests and syncs of a member as
+    changed.
+    """
+    if member_id is None:
+        return
+    bump_generation_on_commit(MEMBER_GENERATION_KEY.format(member_id=member_id))
+
+
+def invalidate_squads():
+    cache.delete(SQUADS_KEY)
+    transaction.on_commit(lambda: cache.delete(SQUADS_KEY))
+    bump_generation_on_commit(SQUADS_GENERATION_KEY)
+
+
+def get_cached_squads():
+    """
+    This function returns all squads ordered by name.
+    """
+    squads = cache.get(SQUADS_KEY)
+    if squads is None:
+        squads = list(Squad.objects.order_by("squad_name"))
+        cache.set(SQUADS_KEY, squads)
+    return squads
+
+
+def get_cached_leaderboard_distance(squad_id, year, month):
+    """
+    This function returns the cached distance of the erg test of the month for
+    a squad.
+    """
+    key = LEADERBOARD_DISTANCE_KEY.format(
+        squad_id=squad_id,
+        generation=get_squad_generation(squad_id),
+        year=year,
+        month=month,
+    )
+    # The distance is None as long as nobody has tested, so it is wrapped to
+    # tell it apart from a cache miss.
+    cached = cache.get(key)
+    if cached is None:
+        cached = (get_leaderboard_distance(squad_id, year, month),)
+        cache.set(key, cached)
+    return cached[0]
+
+
+def get_cached_top_entries(squad_id, year, month, distance):
+    """
+    This function returns the cached top three entries of a leaderboard.
+    """
+    key = LEADERBOARD_KEY.format(
+        squad_id=squad_id,
+        generation=get_squad_generation(squad_id),
+        year=year,
+        month=month,
+        distance=distance,
+    )
+    top_three = cache.get(key)
+    if top_three is None:
+        top_three, _ = get_top_entries_and_member_entry(squad_id, year, month, distance)
+        cache.set(key, top_three)
+    return top_three
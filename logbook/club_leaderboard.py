@@ -0,0 +1,147 @@
+"""
+Club wide leaderboards over all time, the current season and the last 30 and
+90 days, per distance and optionally per sex or squad. Like the rankings of
+the concept2 logbook they include every erg over a ranked distance, synced or
+logged, not only the erg tests. The best erg of every member is precomputed
+in ClubLeaderboardEntry, a materialized view on PostgreSQL which is refreshed
+concurrently, so reading a leaderboard never sorts the ergs of the whole club.
+Other databases, which cannot have materialized views, get a table which is
+filled from python.
+
+The leaderboards are refreshed after every batch of syncs and imports. Ergs
+logged by hand show up with the next refresh, which `python3 manage.py
+refresh_club_leaderboards` also does, e.g. every night from cron to move the
+rolling windows along.
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ClubLeaderboardEntry, FinishedErg
+from .personal_bests import PERSONAL_BEST_ORDERING
+
+CLUB_LEADERBOARD_SIZE = 50
+DEFAULT_DISTANCE = 2000
+SEASON_START_MONTH = 9
+# The distances of the concept2 rankings, which the materialized view uses too
+RANKED_DISTANCES = (100, 500, 1000, 2000, 5000, 6000, 10000, 21097, 42195)
+
+ENTRY_FIELDS = [
+    "id",
+    "completed_by_id",
+    "completed_by__squad_id",
+    "completed_by__sex",
+    "distance",
+    "split_time",
+    "result_time",
+    "completed_at",
+]
+
+
+def get_season_start(today):
+    """
+    This function returns the first day of the rowing season the given day
+    belongs to. The season starts on the 1st of September.
+    """
+    year = today.year if today.month >= SEASON_START_MONTH else today.year - 1
+    return datetime.date(year, SEASON_START_MONTH, 1)
+
+
+def get_period_starts(today):
+    """
+    This function returns the first day of every leaderboard period, None
+    meaning all time. It mirrors the periods of the materialized view.
+    """
+    return {
+        ClubLeaderboardEntry.ALL_TIME: None,
+        ClubLeaderboardEntry.SEASON: get_season_start(today),
+        ClubLeaderboardEntry.LAST_90_DAYS: today - datetime.timedelta(days=90),
+        ClubLeaderboardEntry.LAST_30_DAYS: today - datetime.timedelta(days=30),
+    }
+
+
+def build_club_leaderboard_entries(rows, today):
+    """
+    This function keeps the best erg of every member and distance of the
+    ordered rows for every period and returns them as unsaved entries.
+    """
+    period_starts = get_period_starts(today)
+    entries = {}
+    for erg_id, member_id, squad_id, sex, distance, *times in rows:
+        split_time, result_time, completed_at = times
+        for period, since in period_starts.items():
+            key = (period, member_id, distance)
+            if key in entries or (since is not None and completed_at < since):
+                continue
+            entries[key] = ClubLeaderboardEntry(
+                id="{}:{}".format(period, erg_id),
+                period=period,
+                member_id=member_id,
+                squad_id=squad_id,
+                sex=sex,
+                distance=distance,
+                erg_id=erg_id,
+                split_time=split_time,
+                result_time=result_time,
+                completed_at=completed_at,
+            )
+    return list(entries.values())
+
+
+def refresh_club_leaderboards():
+    """
+    This function recomputes the club leaderboards. The materialized view is
+    refreshed concurrently, so the leaderboards can still be read meanwhile.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "REFRESH MATERIALIZED VIEW CONCURRENTLY "
+                + connection.ops.quote_name(ClubLeaderboardEntry._meta.db_table)
+            )
+        return
+    rows = (
+        FinishedErg.objects.filter(
+            distance__in=RANKED_DISTANCES, completed_by__isnull=False
+        )
+        .order_by("completed_by_id", "distance", *PERSONAL_BEST_ORDERING)
+        .values_list(*ENTRY_FIELDS)
+    )
+    # The date of the database connection, which is UTC like CURRENT_DATE of
+    # the materialized view
+    entries = build_club_leaderboard_entries(rows, timezone.now().date())
+    with transaction.atomic():
+        ClubLeaderboardEntry.objects.all().delete()
+        ClubLeaderboardEntry.objects.bulk_create(entries)
+
+
+def get_club_leaderboard_distances(period):
+    return list(
+        ClubLeaderboardEntry.objects.filter(period=period)
+        .order_by("distance")
+        .values_list("distance", flat=True)
+        .distinct()
+    )
+
+
+def get_club_leaderboard(
+    period, distance, sex=None, squad_id=None, size=CLUB_LEADERBOARD_SIZE
+):
+    """
+    This function returns the fastest members of the club over a period and
+    distance, optionally only of one sex or squad, numbered by their rank.
+    """
+    entries = ClubLeaderboardEntry.objects.filter(period=period, distance=distance)
+    if sex:
+        entries = entries.filter(sex=sex)
+    if squad_id:
+        entries = entries.filter(squad_id=squad_id)
+    entries = list(
+        entries.select_related("member__user", "squad").order_by(
+            "split_time", "completed_at"
+        )[:size]
+    )
+    for rank, entry in enumerate(entries, start=1):
+        entry.rank = rank
+    return entries
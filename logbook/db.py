@@ -0,0 +1,84 @@
+"""
+Reading large querysets without holding all rows in memory. QuerySet.iterator()
+streams them through a server side cursor, which is not available behind
+pgbouncer in transaction pooling mode (DB_POOLER=pgbouncer), so there the rows
+are read in pages, every page continuing after the last row of the previous one
+in the ordering of the queryset (keyset pagination).
+"""
+from django.db import connections
+from django.db.models import F, Q
+
+
+def uses_server_side_cursors(using):
+    return not connections[using].settings_dict.get("DISABLE_SERVER_SIDE_CURSORS")
+
+
+def get_keyset_ordering(queryset):
+    """
+    This function returns the ordering of the queryset as (field, descending)
+    pairs, ending with the primary key so every row has its own position.
+    """
+    ordering = []
+    for field in queryset.query.order_by:
+        if not isinstance(field, str):
+            raise ValueError("Only field names can be paged by keyset.")
+        descending = field.startswith("-")
+        field = field.lstrip("-")
+        if field in ("pk", queryset.model._meta.pk.name):
+            return ordering + [("pk", descending)]
+        ordering.append((field, descending))
+    return ordering + [("pk", False)]
+
+
+def get_keyset_order_by(ordering):
+    # NULL comes last in ascending and first in descending order, like on
+    # PostgreSQL, so get_rows_after can tell which rows follow.
+    return [
+        F(field).desc(nulls_first=True) if descending else F(field).asc(nulls_last=True)
+        for field, descending in ordering
+    ]
+
+
+def get_rows_after(ordering, values):
+    """
+    This function returns the filter of the rows which follow the row with
+    the given values of the ordering fields.
+    """
+    after = Q(pk__in=[])
+    same = Q()
+    for (field, descending), value in zip(ordering, values):
+        if value is None:
+            # Only in descending order rows follow NULL, those not NULL
+            follows = Q(**{field + "__isnull": False}) if descending else None
+            equal = Q(**{field + "__isnull": True})
+        else:
+            follows = Q(**{field + ("__lt" if descending else "__gt"): value})
+            if not descending:
+                follows |= Q(**{field + "__isnull": True})
+            equal = Q(**{field: value})
+        if follows is not None:
+            after |= same & follows
+        same &= equal
+    return after
+
+
+def iterate_values(queryset, fields, chunk_size):
+    """
+    This function yields the values_list rows of the given fields of the
+    queryset in its order, chunk_size rows at a time.
+    """
+    if uses_server_side_cursors(queryset.db):
+        yield from queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+        return
+    ordering = get_keyset_ordering(queryset)
+    keys = [field for field, _ in ordering]
+    width = len(fields)
+    page = queryset.order_by(*get_keyset_order_by(ordering))
+    rows = page
+    while True:
+        chunk = list(rows.values_list(*fields, *keys)[:chunk_size])
+        for row in chunk:
+            yield row[:width]
+        if len(chunk) < chunk_size:
+            return
+        rows = page.filter(get_rows_after(ordering, chunk[-1][width:]))
@@ -0,0 +1,76 @@
+"""
+ETags of the dashboard, the erg history and the squad scoreboard, so a
+browser reloading an unchanged page gets a 304 Not Modified without the
+leaderboards being queried or the template being rendered. They are built
+from the generation counters of logbook/cache.py, which are bumped whenever
+the ergs of a member or the leaderboards of a squad change, so computing an
+ETag only reads the cache.
+"""
+import hashlib
+
+from django.contrib import messages
+from django.utils.timezone import localdate
+
+from .cache import (
+    get_cached_squads,
+    get_member_generation,
+    get_squad_generation,
+    get_squads_generation,
+)
+
+
+def has_pending_messages(request):
+    # Messages are shown by the next page which is rendered, so it must not
+    # be answered with a 304.
+    return len(messages.get_messages(request)) > 0
+
+
+def build_etag(request, *versions):
+    """
+    This function returns the ETag of a page of the user from the versions of
+    the data it shows, or None if the page has to be rendered anyway.
+    """
+    if has_pending_messages(request):
+        return None
+    # The session changes on login, and with it the csrf token the forms of a
+    # page were rendered with
+    parts = [request.user.pk, request.session.session_key, *versions]
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+
+
+def get_index_etag(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    member = request.user.member
+    # The dashboard shows the current month and, for coaches, the list of
+    # squads.
+    versions = [localdate(), get_member_generation(member.pk), get_squads_generation()]
+    if member.is_coach:
+        squad_id = request.GET.get("squad")
+        if not squad_id:
+            # Coaches without a squad get a random one
+            return None
+        versions.append(get_squad_generation(squad_id))
+    elif member.squad_id:
+        versions.append(get_squad_generation(member.squad_id))
+    return build_etag(request, *versions)
+
+
+def get_erg_history_etag(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    return build_etag(request, get_member_generation(request.user.pk))
+
+
+def get_squad_scoreboard_etag(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    member = request.user.member
+    versions = [localdate(), get_member_generation(member.pk)]
+    if member.is_coach:
+        # Coaches see the erg tests of every squad
+        versions.append(get_squads_generation())
+        versions += [get_squad_generation(squad.id) for squad in get_cached_squads()]
+    elif member.squad_id:
+        versions.append(get_squad_generation(member.squad_id))
+    return build_etag(request, *versions)
@@ -0,0 +1,90 @@
+"""
+Streaming exports of erg workouts as csv or newline delimited json. The rows
+are read in chunks (see logbook/db.py) and written while the response is sent, so
+the memory used does not grow with the number of ergs. The columns match the
+generic schema of logbook/importer.py, so an export can be imported again.
+"""
+import csv
+import datetime
+import json
+
+from django.http import StreamingHttpResponse
+
+from .db import iterate_values
+
+EXPORT_CHUNK_SIZE = 2000
+
+HISTORY_COLUMNS = [
+    ("completed_at", "completed_at"),
+    ("name", "name"),
+    ("distance", "distance"),
+    ("result_time", "result_time"),
+    ("split_time", "split_time"),
+    ("is_test", "is_test"),
+    ("avg_spm", "avg_spm"),
+    ("avg_heartrate", "avg_heartrate"),
+    ("c2_logbook_id", "c2_logbook_id"),
+]
+SQUAD_COLUMNS = [
+    ("username", "completed_by__user__username"),
+    ("squad", "completed_by__squad__squad_name"),
+] + HISTORY_COLUMNS
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class Echo:
+    """
+    File like object which returns what is written to it, so the csv writer
+    can produce one line at a time.
+    https://docs.djangoproject.com/en/4.1/howto/outputting-csv/#streaming-large-csv-files
+    """
+
+    def write(self, value):
+        return value
+
+
+def format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return str(value)
+    return value
+
+
+def iter_csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in columns])
+    for row in rows:
+        yield writer.writerow([format_value(value) for value in row])
+
+
+def iter_ndjson_lines(columns, rows):
+    names = [name for name, _ in columns]
+    for row in rows:
+        yield json.dumps(
+            dict(zip(names, (format_value(value) for value in row)))
+        ) + "\n"
+
+
+def stream_ergs(queryset, columns, export_format, filename):
+    """
+    This function returns a streaming response with the ergs of the queryset
+    in the given format ("csv" or "ndjson"). Only the values of the columns
+    are fetched, no erg objects are built.
+    """
+    rows = iterate_values(queryset, [field for _, field in columns], EXPORT_CHUNK_SIZE)
+    if export_format == "ndjson":
+        lines = iter_ndjson_lines(columns, rows)
+    else:
+        lines = iter_csv_lines(columns, rows)
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[export_format])
+    response["Content-Disposition"] = 'attachment; filename="{}.{}"'.format(
+        filename, export_format
+    )
+    return response
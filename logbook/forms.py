@@ -4,6 +4,7 @@ from django import forms
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.forms import ModelForm
 
+from .bulk import BULK_UPDATE_FIELDS
 from .models import FinishedErg
 
 
@@ -172,3 +173,56 @@ class UpdateErgForm(BaseForm):
         self.fields["completed_at"].widget.attrs[
             "value"
         ] = self.instance.completed_at.strftime("%d/%m/%Y")
+
+
+class ImportErgsForm(forms.Form):
+    file = forms.FileField(
+        label="CSV file",
+        help_text="The export of your Concept2 logbook or a csv file with the "
+        "columns completed_at, distance and result_time.",
+    )
+
+
+class BulkEditErgsForm(forms.Form):
+    """
+    Form to delete or update several ergs of the erg history at once. Only
+    the ergs of the given member can be selected.
+    """
+
+    DELETE = "delete"
+    UPDATE = "update"
+
+    ergs = forms.ModelMultipleChoiceField(
+        queryset=FinishedErg.objects.none(), widget=forms.MultipleHiddenInput
+    )
+    action = forms.ChoiceField(choices=[(DELETE, "Delete"), (UPDATE, "Update")])
+    is_test = forms.TypedChoiceField(
+        choices=[("", "Unchanged"), ("true", "Erg Test"), ("false", "No Erg Test")],
+        coerce=lambda value: value == "true",
+        empty_value=None,
+        required=False,
+        label="Erg Test",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    effort = forms.ChoiceField(
+        choices=[("", "Unchanged")] + FinishedErg._meta.get_field("effort").choices,
+        required=False,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+
+    def __init__(self, *args, member=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["ergs"].queryset = FinishedErg.objects.filter(completed_by=member)
+
+    def get_changes(self):
+        return {
+            field: self.cleaned_data.get(field)
+            for field in BULK_UPDATE_FIELDS
+            if self.cleaned_data.get(field) not in (None, "")
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("action") == self.UPDATE and not self.get_changes():
+            raise forms.ValidationError("Choose what to change.")
+        return cleaned_data
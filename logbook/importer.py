@@ -0,0 +1,283 @@
+"""
+Import of erg workouts from csv files, either the export of the concept2
+logbook (https://log.concept2.com/ > History > Export) or the generic schema:
+
+    completed_at,distance,result_time,split_time,name,is_test,avg_spm,avg_heartrate
+    2023-04-10,2000,0:07:00,,2k Test,true,28,180
+
+completed_at, distance and result_time are required, the split time is
+calculated if it is missing. An optional c2_logbook_id column is used like the
+log id of the concept2 export, and imports run from the command line can add a
+username column to import the ergs of a whole club from one file.
+
+The file is read row by row and stored in batches, so the memory used does not
+grow with the size of the file.
+"""
+import csv
+import hashlib
+from collections import namedtuple
+from itertools import islice
+
+from django.db import transaction
+from django.utils.dateparse import parse_duration
+
+from users.models import Member
+from .cache import invalidate_member, invalidate_squad
+from .club_leaderboard import refresh_club_leaderboards
+from .forms import LogErgForm
+from .leaderboard import get_leaderboard_bucket, refresh_squad_leaderboard
+from .models import FinishedErg
+from .pace import calculate_split_time, format_duration
+from .personal_bests import refresh_personal_bests
+
+CSV_IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 20
+
+C2_EXPORT_COLUMNS = {"Log ID", "Date", "Work Distance", "Work Time (Seconds)"}
+GENERIC_COLUMNS = {"completed_at", "distance", "result_time"}
+TRUE_VALUES = {"1", "true", "yes", "y", "x"}
+
+ImportResult = namedtuple(
+    "ImportResult", ["rows", "stored_ergs", "duplicates", "invalid", "errors"]
+)
+
+
+class CSVImportError(Exception):
+    pass
+
+
+def get_csv_format(columns):
+    """
+    This function returns "c2" for the concept2 logbook export and "generic"
+    for the generic schema and raises a CSVImportError for other files.
+    """
+    columns = set(columns or [])
+    if C2_EXPORT_COLUMNS <= columns:
+        return "c2"
+    if GENERIC_COLUMNS <= columns:
+        return "generic"
+    raise CSVImportError(
+        "The file is neither a Concept2 logbook export nor has the columns "
+        "{}.".format(", ".join(sorted(GENERIC_COLUMNS)))
+    )
+
+
+def is_row_workout(row):
+    # The concept2 export contains the workouts of all machines
+    machine = row.get("Type", "").lower()
+    return not machine or "row" in machine
+
+
+def convert_c2_export_row(row):
+    """
+    This function maps a row of the concept2 logbook export onto the fields
+    of the LogErgForm.
+    """
+    distance = int(float(row["Work Distance"]))
+    time = round(float(row["Work Time (Seconds)"]) * 10)
+    return {
+        "c2_logbook_id": row["Log ID"].strip() or None,
+        "name": row.get("Description") or "Concept2 {}m. Row".format(distance),
+        "completed_at": row["Date"][:10],
+        "distance": distance,
+        "result_time": format_duration(time),
+        "split_time": calculate_split_time(time, distance) if distance else "",
+        "avg_spm": row.get("Stroke Rate/Cadence") or None,
+        "avg_heartrate": row.get("Avg Heart Rate") or None,
+    }
+
+
+def convert_generic_row(row):
+    """
+    This function maps a row of the generic schema onto the fields of the
+    LogErgForm and calculates a missing split time from the result time.
+    """
+    data = {
+        field: (row.get(field) or "").strip()
+        for field in LogErgForm.Meta.fields + ["c2_logbook_id"]
+    }
+    data["is_test"] = data["is_test"].lower() in TRUE_VALUES
+    data["c2_logbook_id"] = data["c2_logbook_id"] or None
+    if not data["split_time"]:
+        result_time = parse_duration(data["result_time"])
+        if result_time and data["distance"].isdigit() and int(data["distance"]):
+            data["split_time"] = calculate_split_time(
+                result_time.total_seconds() * 10, int(data["distance"])
+            )
+    return data
+
+
+def get_import_hash(erg):
+    """
+    This function hashes what identifies a workout, so the same workout of
+    the same member is only imported once.
+    """
+    content = "|".join(
+        str(value)
+        for value in [
+            erg.completed_by_id,
+            erg.completed_at,
+            erg.distance,
+            erg.result_time,
+            erg.split_time,
+        ]
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class ErgImporter:
+    """
+    Validates the rows of a csv file with the rules of the LogErgForm and
+    stores the valid ones in batches. Ergs which were synced or imported
+    before are skipped. With allow_usernames a username column selects the
+    member of a row, otherwise all ergs belong to the given member.
+    """
+
+    def __init__(self, member=None, allow_usernames=False, batch_size=None):
+        self.member = member
+        self.allow_usernames = allow_usernames
+        self.batch_size = batch_size or CSV_IMPORT_BATCH_SIZE
+        self.members_by_username = {}
+        self.leaderboards = set()
+        self.personal_bests = {}
+        self.rows = 0
+        self.stored_ergs = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+
+    def get_member(self, row):
+        username = (row.get("username") or "").strip()
+        if not (self.allow_usernames and username):
+            return self.member
+        if username not in self.members_by_username:
+            self.members_by_username[username] = Member.objects.filter(
+                user__username=username
+            ).first()
+        return self.members_by_username[username]
+
+    def add_error(self, row_number, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append("Row {}: {}".format(row_number, message))
+
+    def build_erg(self, row_number, row, csv_format):
+        member = self.get_member(row)
+        if member is None:
+            self.add_error(row_number, "Unknown member.")
+            return None
+        try:
+            if csv_format == "c2":
+                data = convert_c2_export_row(row)
+            else:
+                data = convert_generic_row(row)
+        except (KeyError, TypeError, ValueError) as error:
+            self.add_error(row_number, "Could not read the row ({}).".format(error))
+            return None
+        form = LogErgForm(data=data)
+        if not form.is_valid():
+            self.add_error(
+                row_number,
+                " ".join(
+                    "{}: {}".format(field, " ".join(messages))
+                    for field, messages in form.errors.items()
+                ),
+            )
+            return None
+        erg = form.save(commit=False)
+        erg.completed_by = member
+        erg.c2_logbook_id = data["c2_logbook_id"]
+        if not erg.name:
+            erg.name = f"{erg.distance}m. Row"
+        if erg.c2_logbook_id is None:
+            erg.import_hash = get_import_hash(erg)
+        # The ergs are stored with bulk_create, which does not call save()
+        erg.set_derived_metrics()
+        return erg
+
+    def store_batch(self, ergs):
+        # Log ids are only unique per member
+        c2_ids = {
+            (erg.completed_by_id, erg.c2_logbook_id)
+            for erg in ergs
+            if erg.c2_logbook_id
+        }
+        hashes = {erg.import_hash for erg in ergs if erg.import_hash}
+        stored_c2_ids = set(
+            FinishedErg.objects.filter(
+                completed_by_id__in={member_id for member_id, _ in c2_ids},
+                c2_logbook_id__in={c2_id for _, c2_id in c2_ids},
+            ).values_list("completed_by_id", "c2_logbook_id")
+        )
+        stored_hashes = set(
+            FinishedErg.objects.filter(import_hash__in=hashes).values_list(
+                "import_hash", flat=True
+            )
+        )
+        new_ergs = []
+        for erg in ergs:
+            if erg.c2_logbook_id:
+                key, seen = (erg.completed_by_id, erg.c2_logbook_id), stored_c2_ids
+            else:
+                key, seen = erg.import_hash, stored_hashes
+            if key in seen:
+                self.duplicates += 1
+                continue
+            seen.add(key)
+            new_ergs.append(erg)
+            self.personal_bests.setdefault(erg.completed_by_id, set()).add(erg.distance)
+            if erg.is_test:
+                self.leaderboards.add(
+                    get_leaderboard_bucket(
+                        erg.completed_by.squad_id, erg.completed_at, erg.distance
+                    )
+                )
+        FinishedErg.objects.bulk_create(new_ergs, ignore_conflicts=True)
+        self.stored_ergs += len(new_ergs)
+
+    def refresh_leaderboards(self):
+        # bulk_create does not send the signals which keep the leaderboards
+        # and personal bests up to date, so every leaderboard with an imported
+        # test, every personal best and the club leaderboards are refreshed
+        # once at the end.
+        for bucket in self.leaderboards - {None}:
+            refresh_squad_leaderboard(*bucket)
+            invalidate_squad(bucket[0])
+        for member_id, distances in self.personal_bests.items():
+            refresh_personal_bests(member_id, distances)
+            invalidate_member(member_id)
+        if self.stored_ergs:
+            refresh_club_leaderboards()
+        self.leaderboards = set()
+        self.personal_bests = {}
+
+    def run(self, lines):
+        """
+        This function imports the csv rows of the given lines, e.g. an open
+        file, and returns an ImportResult.
+        """
+        reader = csv.DictReader(lines)
+        csv_format = get_csv_format(reader.fieldnames)
+        rows = enumerate(reader, start=2)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.rows += len(batch)
+            ergs = []
+            for row_number, row in batch:
+                if csv_format == "c2" and not is_row_workout(row):
+                    continue
+                erg = self.build_erg(row_number, row, csv_format)
+                if erg is not None:
+                    ergs.append(erg)
+            with transaction.atomic():
+                self.store_batch(ergs)
+        self.refresh_leaderboards()
+        return ImportResult(
+            self.rows, self.stored_ergs, self.duplicates, self.invalid, self.errors
+        )
+
+
+def import_ergs(lines, member=None, allow_usernames=False, batch_size=None):
+    return ErgImporter(member, allow_usernames, batch_size).run(lines)
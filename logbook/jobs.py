@@ -0,0 +1,199 @@
+import logging
+from datetime import timedelta
+from functools import partial
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from .club_leaderboard import refresh_club_leaderboards
+from .models import SyncJob
+from .sync import C2APIError, get_c2_error_message, sync_member, sync_member_async
+
+CONNECTION_ERRORS = (requests.RequestException, httpx.HTTPError)
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_sync_job(member, latest=None):
+    """
+    This function queues a concept2 sync for the member. If the member already
+    has a sync waiting or running, that job is returned instead of queueing
+    another one.
+    """
+    with transaction.atomic():
+        job = (
+            SyncJob.objects.select_for_update()
+            .filter(member=member, status__in=[SyncJob.QUEUED, SyncJob.RUNNING])
+            .first()
+        )
+        if job is None:
+            job = SyncJob.objects.create(member=member, latest=latest)
+    return job
+
+
+def claim_next_sync_job():
+    """
+    This function marks the next due job as running and returns it. Jobs which
+    have been running for longer than SYNC_JOB_TIMEOUT are assumed to belong
+    to a crashed worker and are claimed again, until SYNC_JOB_MAX_ATTEMPTS is
+    reached and they fail. Rows locked by other workers are skipped, so
+    several workers can share the queue.
+    """
+    current_time = now()
+    stale_before = current_time - timedelta(seconds=settings.SYNC_JOB_TIMEOUT)
+    max_attempts = settings.SYNC_JOB_MAX_ATTEMPTS
+    SyncJob.objects.filter(
+        status=SyncJob.RUNNING,
+        updated_at__lt=stale_before,
+        attempts__gte=max_attempts,
+    ).update(
+        status=SyncJob.FAILED,
+        error="The sync did not finish.",
+        finished_at=current_time,
+        updated_at=current_time,
+    )
+    with transaction.atomic():
+        job = (
+            SyncJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=SyncJob.QUEUED, run_after__lte=current_time)
+                | Q(
+                    status=SyncJob.RUNNING,
+                    updated_at__lt=stale_before,
+                    attempts__lt=max_attempts,
+                )
+            )
+            .order_by("run_after")
+            .first()
+        )
+        return start_sync_job(job)
+
+
+def claim_sync_job(job):
+    """
+    This function marks the given queued job as running and returns it with
+    the member, user and profile loaded, or None if a worker got it first.
+    """
+    with transaction.atomic():
+        job = (
+            SyncJob.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("member__user__profile")
+            .filter(pk=job.pk, status=SyncJob.QUEUED)
+            .first()
+        )
+        return start_sync_job(job)
+
+
+def start_sync_job(job):
+    if job is None:
+        return None
+    job.status = SyncJob.RUNNING
+    job.attempts += 1
+    job.save(update_fields=["status", "attempts", "updated_at"])
+    return job
+
+
+def get_retry_delay(attempts):
+    """
+    This function returns the exponential backoff before the next attempt.
+    """
+    return timedelta(seconds=settings.SYNC_JOB_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def is_retryable(error):
+    if isinstance(error, C2APIError):
+        return error.status_code == 429 or str(error.status_code).startswith("5")
+    return isinstance(error, CONNECTION_ERRORS)
+
+
+def report_sync_progress(job, stored_ergs, synced_workouts):
+    job.stored_ergs = stored_ergs
+    job.synced_workouts = synced_workouts
+    job.save(update_fields=["stored_ergs", "synced_workouts", "updated_at"])
+
+
+def finish_sync_job(job, error=None):
+    """
+    This function records the outcome of a sync job. Rate limits, server
+    errors and connection problems are retried with a backoff until
+    SYNC_JOB_MAX_ATTEMPTS is reached, any other error fails the job right
+    away.
+    """
+    if error is None:
+        job.status = SyncJob.DONE
+        job.error = None
+        job.finished_at = now()
+    else:
+        if isinstance(error, C2APIError):
+            job.error = get_c2_error_message(error)[:500]
+        elif isinstance(error, CONNECTION_ERRORS):
+            job.error = "Connection Error: {error}".format(error=error)[:500]
+        else:
+            job.error = "Sync Error: {error}".format(error=error)[:500]
+        if is_retryable(error) and job.attempts < settings.SYNC_JOB_MAX_ATTEMPTS:
+            job.status = SyncJob.QUEUED
+            job.run_after = now() + get_retry_delay(job.attempts)
+        else:
+            job.status = SyncJob.FAILED
+            job.finished_at = now()
+    job.save()
+    return job
+
+
+def run_sync_job(job):
+    """
+    This function runs a claimed sync job and records its progress after
+    every stored batch.
+    """
+    try:
+        sync_member(job.member, job.latest, on_batch=partial(report_sync_progress, job))
+    except (C2APIError,) + CONNECTION_ERRORS as error:
+        return finish_sync_job(job, error)
+    except Exception as error:
+        # A bug or bad data must not leave the job running or stop the worker
+        logger.exception("Sync job %s failed", job.pk)
+        return finish_sync_job(job, error)
+    return finish_sync_job(job)
+
+
+async def run_sync_job_async(job):
+    """
+    This function is the async version of run_sync_job for the async views.
+    The job has to be claimed with claim_sync_job. As it does not run in the
+    worker, the club leaderboards are refreshed right after it.
+    """
+    try:
+        await sync_member_async(
+            job.member, job.latest, on_batch=partial(report_sync_progress, job)
+        )
+    except (C2APIError,) + CONNECTION_ERRORS as error:
+        return await sync_to_async(finish_sync_job)(job, error)
+    except Exception as error:
+        logger.exception("Sync job %s failed", job.pk)
+        return await sync_to_async(finish_sync_job)(job, error)
+    job = await sync_to_async(finish_sync_job)(job)
+    if job.stored_ergs:
+        await sync_to_async(refresh_club_leaderboards)()
+    return job
+
+
+def run_pending_sync_jobs(max_jobs=None):
+    """
+    This function processes due jobs until the queue is empty or max_jobs have
+    been run and returns the processed jobs. The club leaderboards are
+    refreshed once after the whole batch.
+    """
+    processed_jobs = []
+    while max_jobs is None or len(processed_jobs) < max_jobs:
+        job = claim_next_sync_job()
+        if job is None:
+            break
+        processed_jobs.append(run_sync_job(job))
+    if any(job.stored_ergs for job in processed_jobs):
+        refresh_club_leaderboards()
+    return processed_jobs
@@ -0,0 +1,186 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_date
+
+from .models import FinishedErg, SquadMonthlyLeaderboard
+
+
+def get_month_range(year, month):
+    """
+    This function returns the first day of the given month and the first day
+    of the following month, so the month can be queried as a date range.
+    """
+    first_day = datetime.date(year, month, 1)
+    if month == 12:
+        next_first_day = datetime.date(year + 1, 1, 1)
+    else:
+        next_first_day = datetime.date(year, month + 1, 1)
+    return first_day, next_first_day
+
+
+def get_leaderboard_bucket(squad_id, completed_at, distance, is_test=True):
+    """
+    This function returns the (squad, year, month, distance) key of the
+    leaderboard an erg belongs to, or None if the erg is not ranked at all.
+    """
+    if not is_test or squad_id is None or completed_at is None:
+        return None
+    if isinstance(completed_at, str):
+        completed_at = parse_date(completed_at[:10])
+    return squad_id, completed_at.year, completed_at.month, int(distance)
+
+
+def refresh_squad_leaderboard(squad_id, year, month, distance):
+    """
+    This function recomputes one leaderboard bucket from the erg tests of the
+    squad. Only the best test of every member is kept and the positions are
+    assigned by split time, earlier tests winning a tie.
+    """
+    first_day, next_first_day = get_month_range(year, month)
+    erg_tests = (
+        FinishedErg.objects.filter(
+            is_test=True,
+            completed_by__squad_id=squad_id,
+            distance=distance,
+            completed_at__gte=first_day,
+            completed_at__lt=next_first_day,
+        )
+        .order_by("split_time", "completed_at", "created_at")
+        .values_list("id", "completed_by_id", "split_time")
+    )
+    entries = []
+    ranked_members = set()
+    for erg_id, member_id, split_time in erg_tests:
+        if member_id in ranked_members:
+            continue
+        ranked_members.add(member_id)
+        entries.append(
+            SquadMonthlyLeaderboard(
+                squad_id=squad_id,
+                year=year,
+                month=month,
+                distance=distance,
+                member_id=member_id,
+                erg_id=erg_id,
+                split_time=split_time,
+                rank=len(entries) + 1,
+            )
+        )
+    with transaction.atomic():
+        SquadMonthlyLeaderboard.objects.filter(
+            squad_id=squad_id, year=year, month=month, distance=distance
+        ).delete()
+        SquadMonthlyLeaderboard.objects.bulk_create(entries)
+
+
+def refresh_member_leaderboards(member_id, squad_ids):
+    """
+    This function refreshes every leaderboard bucket a member has an erg test
+    in for the given squads. It is used when a member changes their squad.
+    """
+    tests = (
+        FinishedErg.objects.filter(completed_by_id=member_id, is_test=True)
+        .values_list("completed_at", "distance")
+        .distinct()
+    )
+    buckets = {
+        (completed_at.year, completed_at.month, distance)
+        for completed_at, distance in tests
+    }
+    for squad_id in squad_ids:
+        if squad_id is None:
+            continue
+        for year, month, distance in buckets:
+            refresh_squad_leaderboard(squad_id, year, month, distance)
+
+
+def rebuild_leaderboards():
+    """
+    This function drops and recomputes all leaderboards from the erg tests.
+    """
+    SquadMonthlyLeaderboard.objects.all().delete()
+    tests = (
+        FinishedErg.objects.filter(is_test=True, completed_by__squad__isnull=False)
+        .values_list("completed_by__squad_id", "completed_at", "distance")
+        .distinct()
+    )
+    buckets = {
+        get_leaderboard_bucket(squad_id, completed_at, distance)
+        for squad_id, completed_at, distance in tests
+    }
+    for bucket in buckets:
+        refresh_squad_leaderboard(*bucket)
+    return len(buckets)
+
+
+def get_leaderboard_distance(squad_id, year, month):
+    """
+    This function returns the distance of the erg test of the month for a
+    squad, which is the longest distance anyone in the squad has tested.
+    """
+    return SquadMonthlyLeaderboard.objects.filter(
+        squad_id=squad_id, year=year, month=month
+    ).aggregate(distance=Max("distance"))["distance"]
+
+
+def get_top_entries_and_member_entry(squad_id, year, month, distance, member=None):
+    """
+    This function reads the top three of a leaderboard and, if given, the
+    entry of the member in a single indexed query.
+    """
+    condition = Q(rank__lte=3)
+    if member is not None:
+        condition |= Q(member=member)
+    entries = SquadMonthlyLeaderboard.objects.filter(
+        condition,
+        squad_id=squad_id,
+        year=year,
+        month=month,
+        distance=distance,
+    ).select_related("erg__completed_by__user")
+    top_three = []
+    member_entry = None
+    for entry in entries:
+        if entry.rank <= 3:
+            top_three.append(entry)
+        if member is not None and entry.member_id == member.pk:
+            member_entry = entry
+    return top_three, member_entry
+
+
+def get_member_entry(squad_id, year, month, distance, member):
+    """
+    This function returns the entry of the member on a leaderboard or None if
+    the member has not entered an erg test for it.
+    """
+    return (
+        SquadMonthlyLeaderboard.objects.filter(
+            squad_id=squad_id,
+            year=year,
+            month=month,
+            distance=distance,
+            member=member,
+        )
+        .select_related("erg__completed_by__user")
+        .first()
+    )
+
+
+def get_member_rank(squad_id, year, month, distance, member):
+    """
+    This function returns the position of the member on a leaderboard or None
+    if the member has not entered an erg test for it.
+    """
+    return (
+        SquadMonthlyLeaderboard.objects.filter(
+            squad_id=squad_id,
+            year=year,
+            month=month,
+            distance=distance,
+            member=member,
+        )
+        .values_list("rank", flat=True)
+        .first()
+    )
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from logbook.importer import CSVImportError, import_ergs
+from users.models import Member
+
+
+class Command(BaseCommand):
+    help = (
+        "Import erg workouts from the csv export of the Concept2 logbook or a "
+        "generic csv file. Rows with a username column are imported for that "
+        "member, all other rows for --user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path of the csv file.")
+        parser.add_argument("--user", help="Username of the member.")
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        member = None
+        if options["user"]:
+            member = Member.objects.filter(user__username=options["user"]).first()
+            if member is None:
+                raise CommandError("Unknown user {}".format(options["user"]))
+        try:
+            with open(options["path"], encoding="utf-8-sig", newline="") as lines:
+                result = import_ergs(
+                    lines,
+                    member,
+                    allow_usernames=True,
+                    batch_size=options["batch_size"],
+                )
+        except (OSError, CSVImportError) as error:
+            raise CommandError(error)
+        for error in result.errors:
+            self.stderr.write(error)
+        self.stdout.write(
+            "Imported {stored} ergs from {rows} rows, {duplicates} duplicates, "
+            "{invalid} invalid".format(
+                stored=result.stored_ergs,
+                rows=result.rows,
+                duplicates=result.duplicates,
+                invalid=result.invalid,
+            )
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from logbook.leaderboard import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Recompute the monthly squad leaderboards from all logged erg tests."
+
+    def handle(self, *args, **options):
+        bucket_count = rebuild_leaderboards()
+        self.stdout.write(
+            self.style.SUCCESS("Rebuilt {} leaderboards".format(bucket_count))
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from logbook.personal_bests import rebuild_personal_bests
+
+
+class Command(BaseCommand):
+    help = "Recompute the personal bests of all members from their ergs."
+
+    def handle(self, *args, **options):
+        count = rebuild_personal_bests()
+        self.stdout.write(self.style.SUCCESS("Rebuilt {} personal bests".format(count)))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from logbook.club_leaderboard import refresh_club_leaderboards
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the club wide leaderboards, e.g. every night from cron to "
+        "move the rolling windows along."
+    )
+
+    def handle(self, *args, **options):
+        refresh_club_leaderboards()
+        self.stdout.write(self.style.SUCCESS("Refreshed the club leaderboards"))
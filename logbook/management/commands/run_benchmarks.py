@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from logbook.benchmark import run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the main views against the data of seed_benchmark_data and "
+        "print the latency percentiles and query counts as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=20,
+            help="Number of measured requests per view.",
+        )
+        parser.add_argument(
+            "--workouts",
+            type=int,
+            default=200,
+            help="Number of workouts served by the stub api per sync.",
+        )
+        parser.add_argument("--output", help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(
+            iterations=options["iterations"],
+            workouts_per_sync=options["workouts"],
+        )
+        report = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                output_file.write(report + "\n")
+        self.stdout.write(report)
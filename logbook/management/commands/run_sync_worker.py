@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from logbook.jobs import run_pending_sync_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Process the queued Concept2 syncs. Runs until it is stopped unless "
+        "--once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the jobs which are due right now and exit.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait before looking for new jobs again.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            for job in run_pending_sync_jobs():
+                self.stdout.write(
+                    "{job}: {stored} of {synced} workouts stored{error}".format(
+                        job=job,
+                        stored=job.stored_ergs,
+                        synced=job.synced_workouts,
+                        error=" ({})".format(job.error) if job.error else "",
+                    )
+                )
+            if options["once"]:
+                return
+            time.sleep(options["poll_interval"])
+            # Don't keep a broken or outdated connection for the next jobs
+            close_old_connections()
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from logbook.benchmark import clear_benchmark_data, seed_benchmark_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a synthetic club with squads, members and ergs for "
+        "run_benchmarks. Existing benchmark data is replaced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--squads", type=int, default=8)
+        parser.add_argument("--members", type=int, default=200)
+        parser.add_argument("--ergs", type=int, default=50000)
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=2000,
+            help="The same seed always creates the same data.",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Only delete the benchmark data.",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            clear_benchmark_data()
+            self.stdout.write("Deleted the benchmark data")
+            return
+        seed_benchmark_data(
+            squads=options["squads"],
+            members=options["members"],
+            ergs=options["ergs"],
+            seed=options["seed"],
+        )
+        self.stdout.write(
+            "Created {squads} squads, {members} members and {ergs} ergs".format(
+                **options
+            )
+        )
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from logbook.sync import sync_all_accounts
+
+
+class Command(BaseCommand):
+    help = (
+        "Sync the latest workouts of every member who connected their Concept2 "
+        "Logbook, e.g. every morning from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of accounts which are synced in parallel.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=2.0,
+            help="Maximum number of Concept2 API requests per second and account.",
+        )
+
+    def handle(self, *args, **options):
+        started_at = time.monotonic()
+        results = sync_all_accounts(
+            workers=options["workers"],
+            max_requests_per_second=options["rate"],
+            on_result=self.report_failure,
+        )
+        seconds = time.monotonic() - started_at
+        failed = [result for result in results if result.error]
+        synced_workouts = sum(result.synced_workouts for result in results)
+        self.stdout.write(
+            "Synced {accounts} accounts in {seconds:.1f}s: {stored} new ergs from "
+            "{workouts} workouts ({rate:.1f} workouts/s, {accounts_rate:.1f} "
+            "accounts/min), {failed} failed".format(
+                accounts=len(results),
+                seconds=seconds,
+                stored=sum(result.stored_ergs for result in results),
+                workouts=synced_workouts,
+                rate=synced_workouts / seconds if seconds else 0,
+                accounts_rate=60 * len(results) / seconds if seconds else 0,
+                failed=len(failed),
+            )
+        )
+
+    def report_failure(self, result):
+        if result.error:
+            self.stderr.write("{}: {}".format(result.member, result.error))
@@ -0,0 +1,120 @@
+"""
+Request metrics recorded by the ViewMetricsMiddleware. They are aggregated
+per resolved view name in memory and exported in the Prometheus text format
+by the metrics view. Every process keeps its own metrics, so with several
+gunicorn workers each scrape only sees the worker which answered it.
+"""
+import threading
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = {
+    # name: (help, buckets)
+    "erganiser_view_duration_seconds": (
+        "Wall time of the request",
+        DURATION_BUCKETS,
+    ),
+    "erganiser_view_db_duration_seconds": (
+        "Time spent in SQL queries",
+        DURATION_BUCKETS,
+    ),
+    "erganiser_view_template_duration_seconds": (
+        "Time spent rendering template responses",
+        DURATION_BUCKETS,
+    ),
+    "erganiser_view_queries": (
+        "Number of SQL queries",
+        QUERY_BUCKETS,
+    ),
+}
+
+
+class Histogram:
+    """
+    Cumulative histogram like the one of the Prometheus client libraries.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.counts[index] += 1
+
+    def get_samples(self):
+        for upper_bound, count in zip(self.buckets, self.counts):
+            yield "bucket", {"le": str(upper_bound)}, count
+        yield "bucket", {"le": "+Inf"}, self.count
+        yield "sum", {}, self.sum
+        yield "count", {}, self.count
+
+
+class ViewMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, view_name, queries, db_seconds, template_seconds, seconds):
+        values = {
+            "erganiser_view_duration_seconds": seconds,
+            "erganiser_view_db_duration_seconds": db_seconds,
+            "erganiser_view_template_duration_seconds": template_seconds,
+            "erganiser_view_queries": queries,
+        }
+        with self._lock:
+            for name, value in values.items():
+                key = (name, view_name)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram(METRICS[name][1])
+                self._histograms[key].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def export(self):
+        """
+        This function returns all histograms in the Prometheus text format.
+        """
+        lines = []
+        with self._lock:
+            for name, (help_text, _) in METRICS.items():
+                lines.append("# HELP {} {}".format(name, help_text))
+                lines.append("# TYPE {} histogram".format(name))
+                views = sorted(view for key, view in self._histograms if key == name)
+                for view_name in views:
+                    histogram = self._histograms[(name, view_name)]
+                    for suffix, labels, value in histogram.get_samples():
+                        labels = dict(view=view_name, **labels)
+                        lines.append(
+                            "{}_{}{{{}}} {}".format(
+                                name,
+                                suffix,
+                                ",".join(
+                                    '{}="{}"'.format(label, escape_label(text))
+                                    for label, text in labels.items()
+                                ),
+                                format_value(value),
+                            )
+                        )
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+view_metrics = ViewMetrics()
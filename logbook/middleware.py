@@ -0,0 +1,150 @@
+import asyncio
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+from .metrics import view_metrics
+
+
+class QueryTimer:
+    """
+    Execute wrapper counting the SQL queries of a request and their time.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started_at
+
+
+class ViewMetricsMiddleware:
+    """
+    Records the number of SQL queries, the time spent in them and in rendering
+    the template and the wall time of every request. They are added to the
+    response as Server-Timing header, which the browser dev tools show in the
+    network tab, and aggregated per view for the metrics view. It runs both
+    synchronously and asynchronously, so the async views are not pushed into
+    a thread because of it. The rows of streaming responses, e.g. the
+    exports, are queried while the response is sent, so their metrics are
+    recorded once it is closed and they get no Server-Timing header, which
+    is sent before them.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Makes the handler await this middleware, like MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        request._template_seconds = 0
+        started_at = time.perf_counter()
+        stack = self.wrap_connections(timer)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+        if response.streaming:
+            return self.record_when_closed(request, response, timer, started_at, stack)
+        stack.close()
+        return self.record(request, response, timer, started_at)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        request._template_seconds = 0
+        started_at = time.perf_counter()
+        # The connections belong to the thread sync_to_async runs the
+        # database code of the request in, so they are wrapped in there.
+        stack = await sync_to_async(self.wrap_connections)(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        if response.streaming:
+            # The handler reads the stream outside of the thread whose
+            # connections are wrapped, so its queries cannot be counted.
+            return response
+        return self.record(request, response, timer, started_at)
+
+    def wrap_connections(self, timer):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        return stack
+
+    def observe(self, request, timer, started_at):
+        seconds = time.perf_counter() - started_at
+        if request.resolver_match:
+            view_name = request.resolver_match.view_name
+        else:
+            view_name = "unresolved"
+        view_metrics.observe(
+            view_name, timer.queries, timer.seconds, request._template_seconds, seconds
+        )
+        return seconds
+
+    def record(self, request, response, timer, started_at):
+        seconds = self.observe(request, timer, started_at)
+        response["Server-Timing"] = (
+            'db;desc="{queries} queries";dur={db:.1f}, tpl;dur={tpl:.1f}, '
+            "total;dur={total:.1f}".format(
+                queries=timer.queries,
+                db=timer.seconds * 1000,
+                tpl=request._template_seconds * 1000,
+                total=seconds * 1000,
+            )
+        )
+        return response
+
+    def record_when_closed(self, request, response, timer, started_at, stack):
+        """
+        This function keeps counting the queries of the streaming response
+        until all of it is sent or the server closes it, whichever comes
+        first, and records its metrics then.
+        """
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            stack.close()
+            self.observe(request, timer, started_at)
+
+        def stream(content):
+            try:
+                yield from content
+            finally:
+                finish()
+
+        response.streaming_content = stream(response.streaming_content)
+        response._resource_closers.append(finish)
+        return response
+
+    def process_template_response(self, request, response):
+        # Template responses are rendered by the handler right after this
+        # hook, so the render time ends in the post render callback.
+        started_at = time.perf_counter()
+
+        def record_render_time(rendered_response):
+            request._template_seconds += time.perf_counter() - started_at
+
+        response.add_post_render_callback(record_render_time)
+        return response
@@ -0,0 +1,69 @@
+# Generated by Django 4.1.3 on 2026-10-18 06:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0001_initial"),
+        ("logbook", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SquadMonthlyLeaderboard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.PositiveSmallIntegerField()),
+                ("month", models.PositiveSmallIntegerField()),
+                ("distance", models.PositiveIntegerField()),
+                ("split_time", models.DurationField()),
+                ("rank", models.PositiveIntegerField()),
+                (
+                    "erg",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="logbook.finishederg",
+                    ),
+                ),
+                (
+                    "member",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="users.member"
+                    ),
+                ),
+                (
+                    "squad",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="users.squad"
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["rank"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="squadmonthlyleaderboard",
+            index=models.Index(
+                fields=["squad", "year", "month", "distance", "rank"],
+                name="squad_leaderboard_rank_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="squadmonthlyleaderboard",
+            constraint=models.UniqueConstraint(
+                fields=("squad", "year", "month", "distance", "member"),
+                name="unique_member_per_squad_leaderboard",
+            ),
+        ),
+    ]
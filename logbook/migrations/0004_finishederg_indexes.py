@@ -0,0 +1,34 @@
+# Generated by Django 4.1.3 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logbook", "0003_squadmonthlyleaderboard"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="finishederg",
+            index=models.Index(
+                fields=["completed_by", "-completed_at"], name="erg_member_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="finishederg",
+            index=models.Index(
+                condition=models.Q(("is_test", True)),
+                fields=["completed_by", "-completed_at"],
+                name="erg_member_recent_test_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="finishederg",
+            index=models.Index(
+                condition=models.Q(("is_test", True)),
+                fields=["completed_at", "distance", "result_time"],
+                name="erg_test_month_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.1.3 on 2026-10-18 06:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0001_initial"),
+        ("logbook", "0004_finishederg_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("latest", models.CharField(blank=True, max_length=50, null=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "queued"),
+                            ("running", "running"),
+                            ("done", "done"),
+                            ("failed", "failed"),
+                        ],
+                        default="queued",
+                        max_length=8,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("run_after", models.DateTimeField(default=django.utils.timezone.now)),
+                ("synced_workouts", models.PositiveIntegerField(default=0)),
+                ("stored_ergs", models.PositiveIntegerField(default=0)),
+                ("error", models.CharField(blank=True, max_length=500, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "member",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="users.member"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="syncjob",
+            index=models.Index(
+                fields=["status", "run_after"], name="sync_job_queue_idx"
+            ),
+        ),
+    ]
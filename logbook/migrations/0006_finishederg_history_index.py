@@ -0,0 +1,23 @@
+# Generated by Django 4.1.3 on 2026-10-18 06:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logbook", "0005_syncjob"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="finishederg",
+            name="erg_member_recent_idx",
+        ),
+        migrations.AddIndex(
+            model_name="finishederg",
+            index=models.Index(
+                fields=["completed_by", "-completed_at", "-id"],
+                name="erg_member_history_idx",
+            ),
+        ),
+    ]
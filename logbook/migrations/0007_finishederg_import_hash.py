@@ -0,0 +1,19 @@
+# Generated by Django 4.1.3 on 2026-10-18 06:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logbook", "0006_finishederg_history_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="finishederg",
+            name="import_hash",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, null=True, unique=True
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.3 on 2026-10-18 06:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0001_initial"),
+        ("logbook", "0007_finishederg_import_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PersonalBest",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("distance", models.PositiveIntegerField()),
+                ("split_time", models.DurationField()),
+                ("result_time", models.DurationField(null=True)),
+                ("completed_at", models.DateField()),
+                (
+                    "erg",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="logbook.finishederg",
+                    ),
+                ),
+                (
+                    "member",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="users.member"
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["distance"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="personalbest",
+            constraint=models.UniqueConstraint(
+                fields=("member", "distance"), name="unique_personal_best_per_distance"
+            ),
+        ),
+    ]
@@ -0,0 +1,139 @@
+# Generated by Django 4.1.3 on 2026-10-18 07:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The best erg of every member and ranked distance per period. The season starts
+# on the 1st of September, so it is found by going back 8 months, truncating
+# to the year and going forward 8 months again.
+CREATE_VIEW = """
+CREATE MATERIALIZED VIEW logbook_clubleaderboardentry AS
+SELECT DISTINCT ON (periods.period, erg.completed_by_id, erg.distance)
+    periods.period || ':' || erg.id AS id,
+    periods.period,
+    erg.completed_by_id AS member_id,
+    member.squad_id,
+    member.sex,
+    erg.distance,
+    erg.id AS erg_id,
+    erg.split_time,
+    erg.result_time,
+    erg.completed_at
+FROM logbook_finishederg erg
+JOIN users_member member ON member.user_id = erg.completed_by_id
+CROSS JOIN (
+    VALUES
+        ('all-time', NULL::date),
+        (
+            'season',
+            (
+                date_trunc('year', CURRENT_DATE - interval '8 months')
+                + interval '8 months'
+            )::date
+        ),
+        ('90-days', CURRENT_DATE - 90),
+        ('30-days', CURRENT_DATE - 30)
+) AS periods (period, since)
+WHERE erg.distance IN (100, 500, 1000, 2000, 5000, 6000, 10000, 21097, 42195)
+AND (periods.since IS NULL OR erg.completed_at >= periods.since)
+ORDER BY
+    periods.period,
+    erg.completed_by_id,
+    erg.distance,
+    erg.split_time,
+    erg.completed_at,
+    erg.created_at
+WITH DATA
+"""
+
+# REFRESH MATERIALIZED VIEW CONCURRENTLY needs a unique index
+CREATE_INDEXES = [
+    "CREATE UNIQUE INDEX club_leaderboard_member_idx "
+    "ON logbook_clubleaderboardentry (period, member_id, distance)",
+    "CREATE INDEX club_leaderboard_rank_idx "
+    "ON logbook_clubleaderboardentry (period, distance, split_time)",
+]
+
+
+def create_club_leaderboard(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_VIEW)
+    else:
+        # Other databases get a table which is refreshed from python
+        schema_editor.create_model(apps.get_model("logbook", "ClubLeaderboardEntry"))
+    for statement in CREATE_INDEXES:
+        schema_editor.execute(statement)
+
+
+def drop_club_leaderboard(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP MATERIALIZED VIEW logbook_clubleaderboardentry")
+    else:
+        schema_editor.delete_model(apps.get_model("logbook", "ClubLeaderboardEntry"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0001_initial"),
+        ("logbook", "0008_personalbest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClubLeaderboardEntry",
+            fields=[
+                (
+                    "id",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[
+                            ("all-time", "All time"),
+                            ("season", "This season"),
+                            ("90-days", "Last 90 days"),
+                            ("30-days", "Last 30 days"),
+                        ],
+                        max_length=8,
+                    ),
+                ),
+                ("sex", models.CharField(max_length=1, null=True)),
+                ("distance", models.PositiveIntegerField()),
+                ("split_time", models.DurationField()),
+                ("result_time", models.DurationField(null=True)),
+                ("completed_at", models.DateField()),
+                (
+                    "erg",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="logbook.finishederg",
+                    ),
+                ),
+                (
+                    "member",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="users.member",
+                    ),
+                ),
+                (
+                    "squad",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="users.squad",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "logbook_clubleaderboardentry",
+                "ordering": ["split_time", "completed_at"],
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(create_club_leaderboard, drop_club_leaderboard),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.1.3 on 2026-10-18 07:51
+
+from django.db import migrations, models
+
+from logbook.pace import calculate_calories_per_hour, calculate_watts
+
+BATCH_SIZE = 2000
+
+
+def set_derived_metrics(apps, schema_editor):
+    FinishedErg = apps.get_model("logbook", "FinishedErg")
+    ergs = FinishedErg.objects.only("split_time").order_by("pk")
+    batch = []
+    for erg in ergs.iterator(chunk_size=BATCH_SIZE):
+        erg.watts = calculate_watts(erg.split_time)
+        erg.calories_per_hour = calculate_calories_per_hour(erg.split_time)
+        batch.append(erg)
+        if len(batch) == BATCH_SIZE:
+            FinishedErg.objects.bulk_update(batch, ["watts", "calories_per_hour"])
+            batch = []
+    FinishedErg.objects.bulk_update(batch, ["watts", "calories_per_hour"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logbook", "0009_clubleaderboardentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="finishederg",
+            name="calories_per_hour",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="finishederg",
+            name="watts",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(set_derived_metrics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logbook", "0010_finishederg_watts_calories_per_hour"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="finishederg",
+            name="c2_logbook_id",
+            field=models.CharField(blank=True, max_length=250, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="finishederg",
+            constraint=models.UniqueConstraint(
+                fields=("completed_by", "c2_logbook_id"),
+                name="erg_member_c2_logbook_id_unique",
+            ),
+        ),
+    ]
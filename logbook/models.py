@@ -2,13 +2,15 @@ import uuid
 
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from users.models import Member
+from users.models import Member, Squad
+from .pace import calculate_calories_per_hour, calculate_watts
 
 
 class Erg(models.Model):
-    c2_logbook_id = models.CharField(max_length=250, blank=True, null=True, unique=True)
+    c2_logbook_id = models.CharField(max_length=250, blank=True, null=True)
     id = models.UUIDField("ID", primary_key=True, default=uuid.uuid4, editable=False)
     description = models.CharField(max_length=5000, blank=True, null=True)
     distance = models.PositiveIntegerField()
@@ -63,23 +65,234 @@ class FinishedErg(Erg):
     completed_by = models.ForeignKey(
         Member, on_delete=models.CASCADE, null=True
     )  # This should never be null
+    # Hash of the content of ergs imported from a csv file without a concept2
+    # logbook id, so importing the same file twice does not duplicate them
+    import_hash = models.CharField(
+        max_length=64, blank=True, null=True, unique=True, editable=False
+    )
+    # Derived from the split time when the erg is saved
+    watts = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    calories_per_hour = models.PositiveIntegerField(
+        null=True, blank=True, editable=False
+    )
 
     # planned_erg = models.ForeignKey(to=PlannedErg,
     #                                 on_delete=models.CASCADE, blank=True,
     #                                 null=True)
 
+    class Meta:
+        constraints = [
+            # The log ids come from csv files as well, so they are only unique
+            # per member. Otherwise one member could claim the workouts of
+            # another one, whose sync would then skip them.
+            models.UniqueConstraint(
+                fields=["completed_by", "c2_logbook_id"],
+                name="erg_member_c2_logbook_id_unique",
+            ),
+        ]
+        indexes = [
+            # Recent ergs and the keyset paginated erg history of a member
+            models.Index(
+                fields=["completed_by", "-completed_at", "-id"],
+                name="erg_member_history_idx",
+            ),
+            # Recent erg tests of a member
+            models.Index(
+                fields=["completed_by", "-completed_at"],
+                name="erg_member_recent_test_idx",
+                condition=models.Q(is_test=True),
+            ),
+            # Erg tests of a month for the scoreboards and leaderboards
+            models.Index(
+                fields=["completed_at", "distance", "result_time"],
+                name="erg_test_month_idx",
+                condition=models.Q(is_test=True),
+            ),
+        ]
+
     def __str__(self):
         return "Completed Erg %s" % self.name
 
     def get_absolute_url(self):
         return reverse("logbook:erg-detail", kwargs={"pk": self.pk})
 
+    def set_derived_metrics(self):
+        self.watts = calculate_watts(self.split_time)
+        self.calories_per_hour = calculate_calories_per_hour(self.split_time)
+
     def save(self, *args, **kwargs):
         if not self.name:
             self.name = f"{self.distance}m. Row"
+        self.set_derived_metrics()
         super().save(*args, **kwargs)
 
 
+class SquadMonthlyLeaderboard(models.Model):
+    """
+    Denormalised leaderboard holding the best erg test of every squad member
+    for one month and distance, together with its position in the squad.
+    The rows are kept up to date by the signals in logbook/signals.py, so the
+    dashboard can read the top three and the users position in one lookup.
+    """
+
+    squad = models.ForeignKey(Squad, on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    distance = models.PositiveIntegerField()
+    member = models.ForeignKey(Member, on_delete=models.CASCADE)
+    erg = models.ForeignKey(FinishedErg, on_delete=models.CASCADE)
+    split_time = models.DurationField()
+    rank = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["rank"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["squad", "year", "month", "distance", "member"],
+                name="unique_member_per_squad_leaderboard",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["squad", "year", "month", "distance", "rank"],
+                name="squad_leaderboard_rank_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return "%s. %s (%sm %s/%s)" % (
+            self.rank,
+            self.member_id,
+            self.distance,
+            self.month,
+            self.year,
+        )
+
+
+class PersonalBest(models.Model):
+    """
+    The fastest erg of every member and distance by split time. The rows are
+    kept up to date by the signals in logbook/signals.py and after every bulk
+    insert, so a personal best is looked up instead of searched for in the
+    whole history of a member.
+    """
+
+    member = models.ForeignKey(Member, on_delete=models.CASCADE)
+    distance = models.PositiveIntegerField()
+    erg = models.ForeignKey(FinishedErg, on_delete=models.CASCADE)
+    split_time = models.DurationField()
+    result_time = models.DurationField(null=True)
+    completed_at = models.DateField()
+
+    class Meta:
+        ordering = ["distance"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["member", "distance"],
+                name="unique_personal_best_per_distance",
+            ),
+        ]
+
+    def __str__(self):
+        return "%s %sm %s" % (self.member_id, self.distance, self.split_time)
+
+
+class ClubLeaderboardEntry(models.Model):
+    """
+    The best erg of every member and ranked distance over a period (all time,
+    the current season or the last 30 or 90 days). On PostgreSQL this is a
+    materialized view, elsewhere a table, which logbook/club_leaderboard.py
+    refreshes after syncs and imports, so the club wide rankings are read
+    from a small precomputed set instead of sorting all ergs of the club.
+    """
+
+    ALL_TIME = "all-time"
+    SEASON = "season"
+    LAST_90_DAYS = "90-days"
+    LAST_30_DAYS = "30-days"
+    PERIOD_CHOICES = [
+        (ALL_TIME, _("All time")),
+        (SEASON, _("This season")),
+        (LAST_90_DAYS, _("Last 90 days")),
+        (LAST_30_DAYS, _("Last 30 days")),
+    ]
+
+    # The period and the id of the erg, as one erg can lead several periods
+    id = models.CharField(max_length=50, primary_key=True)
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES)
+    member = models.ForeignKey(Member, on_delete=models.DO_NOTHING, db_constraint=False)
+    squad = models.ForeignKey(
+        Squad, on_delete=models.DO_NOTHING, db_constraint=False, null=True
+    )
+    sex = models.CharField(max_length=1, null=True)
+    distance = models.PositiveIntegerField()
+    erg = models.ForeignKey(
+        FinishedErg, on_delete=models.DO_NOTHING, db_constraint=False
+    )
+    split_time = models.DurationField()
+    result_time = models.DurationField(null=True)
+    completed_at = models.DateField()
+
+    class Meta:
+        managed = False
+        db_table = "logbook_clubleaderboardentry"
+        ordering = ["split_time", "completed_at"]
+
+    def __str__(self):
+        return "%s %s %sm %s" % (
+            self.period,
+            self.member_id,
+            self.distance,
+            self.split_time,
+        )
+
+
+class SyncJob(models.Model):
+    """
+    A sync of the concept2 logbook of a member, which is queued by the sync
+    view and processed by the run_sync_worker management command outside of
+    the request.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    id = models.UUIDField("ID", primary_key=True, default=uuid.uuid4, editable=False)
+    member = models.ForeignKey(Member, on_delete=models.CASCADE)
+    latest = models.CharField(max_length=50, blank=True, null=True)
+    status = models.CharField(
+        max_length=8,
+        choices=[
+            (QUEUED, _("queued")),
+            (RUNNING, _("running")),
+            (DONE, _("done")),
+            (FAILED, _("failed")),
+        ],
+        default=QUEUED,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    synced_workouts = models.PositiveIntegerField(default=0)
+    stored_ergs = models.PositiveIntegerField(default=0)
+    error = models.CharField(max_length=500, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="sync_job_queue_idx"),
+        ]
+
+    def __str__(self):
+        return "Sync Job %s (%s)" % (self.id, self.status)
+
+    def get_absolute_url(self):
+        return reverse("logbook:sync-status", kwargs={"pk": self.pk})
+
+
 # class PlannedWorkout(models.Model):
 #     """
 #     2nd stage: You can plan multiple ergs for one workout
@@ -0,0 +1,118 @@
+"""
+Pace arithmetic of ergs. The concept2 logbook api reports the time of a
+workout in tenths of seconds, the split is the time per 500m and the power
+and the calories burned are derived from it with the formulas of the concept2
+pace calculator (https://www.concept2.com/indoor-rowers/training/calculators).
+The functions for one erg have a batch version which converts the columns of
+a whole page of workouts at once with numpy, like logbook/analytics.py.
+"""
+import datetime
+from collections import namedtuple
+
+import numpy as np
+
+SPLIT_DISTANCE = 500
+WATTS_PER_PACE_CUBED = 2.80
+CALORIES_PER_WATT = 4 * 0.8604
+RESTING_CALORIES_PER_HOUR = 300
+
+WorkoutColumns = namedtuple(
+    "WorkoutColumns",
+    ["completed_at", "result_time", "split_time", "watts", "calories_per_hour"],
+)
+
+
+def convert_date_field(date):
+    """
+    This function converts a date string of the concept2 logbook api, e.g.
+    "2020-02-14 09:30:15", into a date.
+    """
+    return datetime.date.fromisoformat(date[:10])
+
+
+def calculate_split_time(total_time, distance):
+    """
+    This function calculates the split time for a given distance and total time.
+    """
+    split_in_sec = SPLIT_DISTANCE * ((total_time * 0.1) / distance)
+    split = datetime.timedelta(seconds=round(split_in_sec))
+    return split
+
+
+def format_duration(time):
+    """
+    This function formats the duration of a workout into a timedelta object.
+    """
+    formatted_time = datetime.timedelta(seconds=round(time * 0.1))
+    return formatted_time
+
+
+def get_watts(split_seconds):
+    # The pace is in seconds per meter. This works on numbers and arrays.
+    return WATTS_PER_PACE_CUBED / (split_seconds / SPLIT_DISTANCE) ** 3
+
+
+def get_calories_per_hour(watts):
+    return watts * CALORIES_PER_WATT + RESTING_CALORIES_PER_HOUR
+
+
+def calculate_watts(split_time):
+    """
+    This function returns the average power in watts of an erg rowed at the
+    given split, or None if the split is empty.
+    """
+    if not split_time:
+        return None
+    return round(get_watts(split_time.total_seconds()))
+
+
+def calculate_calories_per_hour(split_time):
+    """
+    This function returns the calories per hour burned by rowing at the given
+    split, or None if the split is empty.
+    """
+    if not split_time:
+        return None
+    return round(get_calories_per_hour(get_watts(split_time.total_seconds())))
+
+
+def to_integers(values):
+    # NaN and infinity, e.g. of workouts without a distance, become None
+    finite = np.isfinite(values)
+    integers = np.rint(np.where(finite, values, 0)).astype(np.int64).tolist()
+    if finite.all():
+        return integers
+    return [value if ok else None for value, ok in zip(integers, finite.tolist())]
+
+
+def convert_c2_workouts(workouts):
+    """
+    This function converts the dates, times and distances of a page of
+    workouts of the concept2 logbook api at once and returns WorkoutColumns
+    of lists in the order of the workouts. The values are the same as the
+    functions for one workout return.
+    """
+    count = len(workouts)
+    times = np.fromiter(
+        (workout["time"] for workout in workouts), dtype=float, count=count
+    )
+    distances = np.fromiter(
+        (workout["distance"] for workout in workouts), dtype=float, count=count
+    )
+    dates = np.array(
+        [workout["date"][:10] for workout in workouts], dtype="datetime64[D]"
+    )
+    # np.rint rounds halves to even like round()
+    result_seconds = np.rint(times * 0.1)
+    # Workouts without a distance get no split, watts and calories
+    with np.errstate(divide="ignore", invalid="ignore"):
+        split_seconds = np.rint(SPLIT_DISTANCE * ((times * 0.1) / distances))
+        watts = np.where(np.isfinite(split_seconds), get_watts(split_seconds), np.nan)
+        split_times = split_seconds.astype("timedelta64[s]").tolist()
+    return WorkoutColumns(
+        completed_at=dates.tolist(),
+        result_time=result_seconds.astype("timedelta64[s]").tolist(),
+        split_time=split_times,
+        watts=to_integers(np.rint(watts)),
+        calories_per_hour=to_integers(np.rint(get_calories_per_hour(watts))),
+    )
@@ -0,0 +1,107 @@
+"""
+Keyset pagination for the erg history. Instead of counting all ergs and
+skipping the earlier pages with OFFSET, every page continues after the last
+erg of the previous one, which the erg_member_history_idx index finds right
+away, no matter how deep the page is.
+"""
+import base64
+import binascii
+import datetime
+import json
+import uuid
+
+from django.db.models import Q
+from django.http import Http404
+
+NEXT = "n"
+PREVIOUS = "p"
+
+
+def encode_cursor(erg, direction):
+    """
+    This function returns the opaque token of the page after (NEXT) or before
+    (PREVIOUS) the given erg.
+    """
+    payload = json.dumps([direction, erg.completed_at.isoformat(), str(erg.pk)])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, completed_at, pk = json.loads(payload)
+        if direction not in (NEXT, PREVIOUS):
+            raise ValueError(direction)
+        return direction, datetime.date.fromisoformat(completed_at), uuid.UUID(pk)
+    except (binascii.Error, TypeError, ValueError):
+        raise Http404("Invalid cursor")
+
+
+class KeysetPage:
+    """
+    Page of ergs ordered by completed_at and id, newest first. It has no page
+    number and no count, only the tokens of the neighbouring pages.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginate_by_keyset(queryset, page_size, cursor=None):
+    """
+    This function returns the page of the queryset the cursor points to, or
+    the first page without a cursor. One extra row is fetched to know whether
+    there is another page in that direction.
+    """
+    if cursor is None:
+        direction = NEXT
+        ergs = queryset.order_by("-completed_at", "-id")
+    else:
+        direction, completed_at, pk = decode_cursor(cursor)
+        # The first filter bounds the index scan, the second one breaks the
+        # tie between ergs of the same day.
+        if direction == NEXT:
+            ergs = (
+                queryset.filter(completed_at__lte=completed_at)
+                .filter(Q(completed_at__lt=completed_at) | Q(id__lt=pk))
+                .order_by("-completed_at", "-id")
+            )
+        else:
+            ergs = (
+                queryset.filter(completed_at__gte=completed_at)
+                .filter(Q(completed_at__gt=completed_at) | Q(id__gt=pk))
+                .order_by("completed_at", "id")
+            )
+    ergs = list(ergs[: page_size + 1])
+    has_more = len(ergs) > page_size
+    ergs = ergs[:page_size]
+    if direction == PREVIOUS:
+        ergs.reverse()
+    if not ergs:
+        return KeysetPage(ergs)
+    if direction == NEXT:
+        has_next, has_previous = has_more, cursor is not None
+    else:
+        has_next, has_previous = True, has_more
+    return KeysetPage(
+        ergs,
+        next_cursor=encode_cursor(ergs[-1], NEXT) if has_next else None,
+        previous_cursor=encode_cursor(ergs[0], PREVIOUS) if has_previous else None,
+    )
@@ -0,0 +1,92 @@
+from django.db import transaction
+
+from users.models import Member
+from .db import iterate_values
+from .models import FinishedErg, PersonalBest
+
+PERSONAL_BEST_ORDERING = ["split_time", "completed_at", "created_at"]
+PERSONAL_BEST_FIELDS = ["id", "split_time", "result_time", "completed_at"]
+REBUILD_CHUNK_SIZE = 2000
+
+
+def build_personal_bests(member_id, rows):
+    """
+    This function keeps the first erg of every distance of the ordered rows,
+    which is the personal best, and returns them as unsaved PersonalBest
+    objects.
+    """
+    personal_bests = {}
+    for distance, erg_id, split_time, result_time, completed_at in rows:
+        if distance in personal_bests:
+            continue
+        personal_bests[distance] = PersonalBest(
+            member_id=member_id,
+            distance=distance,
+            erg_id=erg_id,
+            split_time=split_time,
+            result_time=result_time,
+            completed_at=completed_at,
+        )
+    return list(personal_bests.values())
+
+
+def refresh_personal_bests(member_id, distances):
+    """
+    This function recomputes the personal bests of a member for the given
+    distances. The member row is locked, so concurrent saves of the same
+    member cannot interleave and leave an outdated personal best behind.
+    """
+    distances = {int(distance) for distance in distances if distance}
+    if member_id is None or not distances:
+        return
+    with transaction.atomic():
+        locked_member = Member.objects.select_for_update().filter(pk=member_id)
+        if not locked_member.values_list("pk", flat=True):
+            return
+        rows = (
+            FinishedErg.objects.filter(
+                completed_by_id=member_id, distance__in=distances
+            )
+            .order_by("distance", *PERSONAL_BEST_ORDERING)
+            .values_list("distance", *PERSONAL_BEST_FIELDS)
+        )
+        PersonalBest.objects.filter(
+            member_id=member_id, distance__in=distances
+        ).delete()
+        PersonalBest.objects.bulk_create(build_personal_bests(member_id, rows))
+
+
+def rebuild_personal_bests():
+    """
+    This function drops and recomputes the personal bests of all members and
+    returns their number.
+    """
+    rows = iterate_values(
+        FinishedErg.objects.filter(completed_by__isnull=False).order_by(
+            "completed_by_id", "distance", *PERSONAL_BEST_ORDERING
+        ),
+        ["completed_by_id", "distance", *PERSONAL_BEST_FIELDS],
+        REBUILD_CHUNK_SIZE,
+    )
+    count = 0
+    with transaction.atomic():
+        PersonalBest.objects.all().delete()
+        member_id = None
+        member_rows = []
+        for row in rows:
+            if row[0] != member_id:
+                count += store_personal_bests(member_id, member_rows)
+                member_id, member_rows = row[0], []
+            member_rows.append(row[1:])
+        count += store_personal_bests(member_id, member_rows)
+    return count
+
+
+def store_personal_bests(member_id, rows):
+    personal_bests = build_personal_bests(member_id, rows)
+    PersonalBest.objects.bulk_create(personal_bests)
+    return len(personal_bests)
+
+
+def is_personal_best(erg):
+    return PersonalBest.objects.filter(erg=erg).exists()
@@ -0,0 +1,26 @@
+import json
+from functools import lru_cache
+from types import MappingProxyType
+
+from django.conf import settings
+
+QUOTES_FILE = (
+    settings.BASE_DIR / "Erganiser" / "static" / "assets" / "data" / "quotes.json"
+)
+
+
+@lru_cache(maxsize=None)
+def get_quotes():
+    """
+    This function reads the quotes file once per process and returns the
+    quotes of every category as an immutable tuple, so a random quote can be
+    picked without touching the disk. It is called in LogbookConfig.ready().
+    """
+    with open(QUOTES_FILE) as json_file:
+        data = json.load(json_file)
+    return MappingProxyType(
+        {
+            category: tuple(MappingProxyType(quote) for quote in quotes)
+            for category, quotes in data.items()
+        }
+    )
@@ -0,0 +1,166 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from users.models import Member, Squad
+from .cache import invalidate_member, invalidate_squad, invalidate_squads
+from .leaderboard import (
+    get_leaderboard_bucket,
+    refresh_member_leaderboards,
+    refresh_squad_leaderboard,
+)
+from .models import FinishedErg, SyncJob
+from .personal_bests import refresh_personal_bests
+
+
+# Set while bulk changes refresh the leaderboards once themselves
+per_erg_updates_paused = ContextVar("per_erg_updates_paused", default=False)
+
+
+@contextmanager
+def pause_per_erg_updates():
+    """
+    Context manager in which saving or deleting ergs does not refresh their
+    leaderboards and personal bests one erg at a time. The caller has to
+    refresh them afterwards, see logbook/bulk.py.
+    """
+    token = per_erg_updates_paused.set(True)
+    try:
+        yield
+    finally:
+        per_erg_updates_paused.reset(token)
+
+
+def get_squad_id_of_member(member_id):
+    if member_id is None:
+        return None
+    return (
+        Member.objects.filter(pk=member_id).values_list("squad_id", flat=True).first()
+    )
+
+
+def update_personal_bests(member_distances):
+    distances_by_member = {}
+    for member_distance in member_distances - {None}:
+        member_id, distance = member_distance
+        distances_by_member.setdefault(member_id, set()).add(distance)
+    for member_id, distances in distances_by_member.items():
+        refresh_personal_bests(member_id, distances)
+
+
+@receiver(pre_save, sender=FinishedErg)
+def remember_previous_leaderboard(sender, instance, raw=False, **kwargs):
+    # The erg might move to another leaderboard, e.g. if the distance or the
+    # date gets corrected, so the old one needs to be refreshed as well.
+    instance._previous_leaderboard = None
+    instance._previous_personal_best = None
+    if raw or instance._state.adding or per_erg_updates_paused.get():
+        return
+    previous = (
+        FinishedErg.objects.filter(pk=instance.pk)
+        .values(
+            "is_test",
+            "completed_by_id",
+            "completed_by__squad_id",
+            "completed_at",
+            "distance",
+        )
+        .first()
+    )
+    if previous:
+        instance._previous_personal_best = (
+            previous["completed_by_id"],
+            previous["distance"],
+        )
+        instance._previous_leaderboard = get_leaderboard_bucket(
+            previous["completed_by__squad_id"],
+            previous["completed_at"],
+            previous["distance"],
+            previous["is_test"],
+        )
+
+
+@receiver(post_save, sender=FinishedErg)
+def update_leaderboard_on_save(sender, instance, raw=False, **kwargs):
+    if raw or per_erg_updates_paused.get():
+        return
+    buckets = {
+        getattr(instance, "_previous_leaderboard", None),
+        get_leaderboard_bucket(
+            get_squad_id_of_member(instance.completed_by_id),
+            instance.completed_at,
+            instance.distance,
+            instance.is_test,
+        ),
+    }
+    for bucket in buckets - {None}:
+        refresh_squad_leaderboard(*bucket)
+        invalidate_squad(bucket[0])
+    invalidate_member(instance.completed_by_id)
+    update_personal_bests(
+        {
+            getattr(instance, "_previous_personal_best", None),
+            (instance.completed_by_id, instance.distance),
+        }
+    )
+
+
+@receiver(post_delete, sender=FinishedErg)
+def update_leaderboard_on_delete(sender, instance, **kwargs):
+    if per_erg_updates_paused.get():
+        return
+    bucket = get_leaderboard_bucket(
+        get_squad_id_of_member(instance.completed_by_id),
+        instance.completed_at,
+        instance.distance,
+        instance.is_test,
+    )
+    if bucket:
+        refresh_squad_leaderboard(*bucket)
+        invalidate_squad(bucket[0])
+    refresh_personal_bests(instance.completed_by_id, [instance.distance])
+    invalidate_member(instance.completed_by_id)
+
+
+@receiver(pre_save, sender=Member)
+def remember_previous_squad(sender, instance, raw=False, **kwargs):
+    instance._previous_squad_id = None
+    if raw or instance._state.adding:
+        return
+    instance._previous_squad_id = get_squad_id_of_member(instance.pk)
+
+
+@receiver(post_save, sender=Member)
+def update_leaderboards_on_squad_change(sender, instance, raw=False, **kwargs):
+    previous_squad_id = getattr(instance, "_previous_squad_id", None)
+    if raw:
+        return
+    invalidate_squad(instance.squad_id)
+    invalidate_member(instance.pk)
+    if previous_squad_id == instance.squad_id:
+        return
+    refresh_member_leaderboards(instance.pk, {previous_squad_id, instance.squad_id})
+    invalidate_squad(previous_squad_id)
+
+
+@receiver(post_delete, sender=Member)
+def invalidate_cache_on_member_delete(sender, instance, **kwargs):
+    invalidate_squad(instance.squad_id)
+
+
+@receiver(post_save, sender=SyncJob)
+def invalidate_member_on_sync_progress(sender, instance, raw=False, **kwargs):
+    # The erg history shows the progress of running syncs
+    if not raw:
+        invalidate_member(instance.member_id)
+
+
+@receiver(post_save, sender=Squad)
+@receiver(post_delete, sender=Squad)
+def invalidate_cache_on_squad_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_squads()
+    invalidate_squad(instance.pk)
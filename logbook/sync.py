@@ -0,0 +1,493 @@
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce, Greatest
+from django.utils.timezone import make_aware, now
+
+from users import c2_client
+from users.models import Member, Profile
+from .cache import invalidate_member
+from .club_leaderboard import refresh_club_leaderboards
+from .models import FinishedErg
+from .pace import convert_c2_workouts
+from .personal_bests import refresh_personal_bests
+
+logger = logging.getLogger(__name__)
+
+C2_SYNC_BATCH_SIZE = 500
+C2_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def build_erg_objects(workouts, member):
+    """
+    This function maps a page of workouts of the concept2 logbook api onto
+    unsaved erg objects of the given member.
+    https://log.concept2.com/developers/documentation/#logbook-users-results
+    """
+    columns = convert_c2_workouts(workouts)
+    return [
+        FinishedErg(
+            name="Concept2 {distance}m. Row".format(distance=workout["distance"]),
+            c2_logbook_id=str(workout["id"]),
+            completed_by=member,
+            distance=workout["distance"],
+            avg_spm=workout["stroke_rate"] if "stroke_rate" in workout else None,
+            completed_at=columns.completed_at[index],
+            result_time=columns.result_time[index],
+            split_time=columns.split_time[index],
+            watts=columns.watts[index],
+            calories_per_hour=columns.calories_per_hour[index],
+            avg_heartrate=workout["heart_rate"]["average"]
+            if "heart_rate" in workout and "average" in workout["heart_rate"]
+            else None,
+        )
+        for index, workout in enumerate(workouts)
+    ]
+
+
+def build_erg_object(workout, member):
+    return build_erg_objects([workout], member)[0]
+
+
+def get_workout_date(workout):
+    # The dates of the concept2 logbook api have no time zone. They are kept
+    # as UTC, so they are sent back to the api unchanged.
+    return make_aware(datetime.fromisoformat(workout["date"]), dt_timezone.utc)
+
+
+def get_newest_workout_date(workouts, newest=None):
+    for workout in workouts:
+        date = get_workout_date(workout)
+        if newest is None or date > newest:
+            newest = date
+    return newest
+
+
+def advance_synced_until(profile, newest):
+    """
+    This function moves the high water mark of the synced workouts of the
+    profile forward to the given date. It never moves it back, e.g. if an
+    older sync finishes last.
+    """
+    if newest is None:
+        return
+    Profile.objects.filter(pk=profile.pk).update(
+        c2_synced_until=Greatest(Coalesce(F("c2_synced_until"), newest), newest)
+    )
+    profile.refresh_from_db(fields=["c2_synced_until"])
+
+
+def is_valid_workout(workout):
+    # Without a distance or a time there is no split, which every erg needs
+    return workout["distance"] > 0 and workout["time"] > 0
+
+
+def store_c2_batch(batch, member):
+    synced_ids = set(
+        FinishedErg.objects.filter(
+            completed_by=member,
+            c2_logbook_id__in=[str(workout["id"]) for workout in batch],
+        ).values_list("c2_logbook_id", flat=True)
+    )
+    new_workouts = []
+    for workout in batch:
+        if str(workout["id"]) in synced_ids or not is_valid_workout(workout):
+            continue
+        synced_ids.add(str(workout["id"]))
+        new_workouts.append(workout)
+    new_ergs = build_erg_objects(new_workouts, member)
+    # Conflicts can still happen if the same workouts are synced in
+    # parallel, the database then keeps the first one.
+    FinishedErg.objects.bulk_create(new_ergs, ignore_conflicts=True)
+    # bulk_create does not send the signals which keep the personal
+    # bests up to date.
+    refresh_personal_bests(member.pk, {erg.distance for erg in new_ergs})
+    if new_ergs:
+        invalidate_member(member.pk)
+    return len(new_ergs)
+
+
+def store_c2_workouts(
+    workouts, member, batch_size=C2_SYNC_BATCH_SIZE, on_batch=None, profile=None
+):
+    """
+    This function stores the workouts of a concept2 logbook api call in the
+    database. The workouts are inserted in batches, skipping every workout
+    which has already been synced before, so a sync can safely be repeated.
+    Given the profile, the date of the newest workout is stored as its high
+    water mark in the transaction of the last batch, as only then all
+    workouts up to it are stored, whatever order the api returns them in.
+    It returns the number of newly stored ergs and the number of workouts
+    it has been given.
+    """
+    workouts = iter(workouts)
+    stored_ergs = 0
+    given_workouts = 0
+    newest = None
+    batch = list(islice(workouts, batch_size))
+    while batch:
+        # The next batch is read first to know whether this is the last one
+        next_batch = list(islice(workouts, batch_size))
+        given_workouts += len(batch)
+        newest = get_newest_workout_date(batch, newest)
+        with transaction.atomic():
+            stored_ergs += store_c2_batch(batch, member)
+            if profile is not None and not next_batch:
+                advance_synced_until(profile, newest)
+        if on_batch is not None:
+            on_batch(stored_ergs, given_workouts)
+        batch = next_batch
+    return stored_ergs, given_workouts
+
+
+def get_results_api_call_url(user_profile, has_latest):
+    """
+    This function returns the url for the api call to get either all the
+    workouts of a user or only the latest ones, which is determined by the
+    has_latest parameter. The latest workouts are the ones since the newest
+    synced workout, the high water mark of the profile. Profiles which have
+    not been synced since it was introduced fall back to the time of the
+    last sync and profiles which have never been synced get all workouts.
+    """
+    url = "{base_url}/api/users/{c2_logbook_id}/results?type=rower".format(
+        base_url=settings.C2_API_BASE_URL,
+        c2_logbook_id=user_profile.c2_logbook_id,
+    )
+    synced_until = user_profile.c2_synced_until or user_profile.last_c2_sync
+    if has_latest is not None and synced_until is not None:
+        # The workouts at the mark are requested again, but are not stored
+        # twice, so none of a second workout at the same time is missed.
+        url += "&from={synced_until}".format(
+            synced_until=synced_until.strftime(C2_DATE_FORMAT)
+        )
+    return url
+
+
+def get_api_header(user_profile):
+    headers = {"Authorization": "Bearer {token}".format(token=user_profile.c2_api_key)}
+    return headers
+
+
+def send_get_request_to_c2_api(url, headers):
+    response = c2_client.get(url, headers=headers)
+    return response
+
+
+class RateLimiter:
+    """
+    Spaces out the requests of one account, so there are never more than
+    max_requests_per_second requests to the concept2 logbook api. It is
+    shared by all threads fetching pages for that account.
+    """
+
+    def __init__(self, max_requests_per_second):
+        self.interval = 1.0 / max_requests_per_second
+        self.next_request_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            request_at = max(self.next_request_at, time.monotonic())
+            self.next_request_at = request_at + self.interval
+        delay = request_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class C2APIError(Exception):
+    """
+    Raised if the concept2 logbook api answers with an error or without any
+    workout data.
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def get_c2_page(url, headers, rate_limiter=None):
+    """
+    This function requests one page of results from the concept2 logbook api
+    and returns the decoded json of it.
+    """
+    if rate_limiter is not None:
+        rate_limiter.wait()
+    return get_c2_response_data(send_get_request_to_c2_api(url, headers))
+
+
+async def get_c2_page_async(url, headers):
+    return get_c2_response_data(await c2_client.aget(url, headers=headers))
+
+
+def get_c2_response_data(response):
+    """
+    This function returns the decoded json of a response of the concept2
+    logbook api or raises a C2APIError with the message of the api.
+    """
+    if str(response.status_code).startswith("4") or str(
+        response.status_code
+    ).startswith("5"):
+        try:
+            message = response.json()["message"]
+        except (ValueError, KeyError, TypeError):
+            message = "HTTP {}".format(response.status_code)
+        raise C2APIError(message, response.status_code)
+    data = response.json()
+    if "data" not in data:
+        raise C2APIError("No data in response")
+    return data
+
+
+def get_c2_pagination(data):
+    return data.get("meta", {}).get("pagination", {})
+
+
+def set_url_params(url, **params):
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    query_params = dict(parse_qsl(query))
+    query_params.update({key: str(value) for key, value in params.items()})
+    return urlunsplit((scheme, netloc, path, urlencode(query_params), fragment))
+
+
+def iter_c2_result_pages(
+    url, headers, page_size=None, concurrency=None, rate_limiter=None
+):
+    """
+    This generator yields the workouts of a concept2 logbook api results call
+    page by page. Without concurrency it follows the next links of the
+    pagination meta data. With a concurrency greater than one the remaining
+    pages are requested in parallel once the first page tells how many pages
+    there are, but never more than that many pages are held at once.
+    https://log.concept2.com/developers/documentation/#pagination
+    """
+    page_size = page_size or settings.C2_RESULTS_PAGE_SIZE
+    concurrency = concurrency or settings.C2_RESULTS_CONCURRENCY
+    url = set_url_params(url, number=page_size)
+    data = get_c2_page(url, headers, rate_limiter)
+    yield data["data"]
+    pagination = get_c2_pagination(data)
+    if concurrency > 1 and pagination.get("total_pages"):
+        yield from iter_c2_pages_concurrently(
+            url, headers, pagination["total_pages"], concurrency, rate_limiter
+        )
+        return
+    requested_urls = {url}
+    while True:
+        next_url = pagination.get("links", {}).get("next")
+        if (
+            not next_url
+            or next_url in requested_urls
+            or pagination.get("current_page", 0) >= pagination.get("total_pages", 0)
+        ):
+            return
+        requested_urls.add(next_url)
+        data = get_c2_page(next_url, headers, rate_limiter)
+        yield data["data"]
+        pagination = get_c2_pagination(data)
+
+
+async def iter_c2_result_pages_async(url, headers, page_size=None):
+    """
+    This async generator yields the workouts of a concept2 logbook api results
+    call page by page, following the next links of the pagination meta data.
+    The event loop serves other requests while a page is on its way.
+    """
+    url = set_url_params(url, number=page_size or settings.C2_RESULTS_PAGE_SIZE)
+    requested_urls = set()
+    while url and url not in requested_urls:
+        requested_urls.add(url)
+        data = await get_c2_page_async(url, headers)
+        yield data["data"]
+        pagination = get_c2_pagination(data)
+        if pagination.get("current_page", 0) >= pagination.get("total_pages", 0):
+            return
+        url = pagination.get("links", {}).get("next")
+
+
+def iter_c2_pages_concurrently(
+    url, headers, total_pages, concurrency, rate_limiter=None
+):
+    page_urls = (set_url_params(url, page=page) for page in range(2, total_pages + 1))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque(
+            executor.submit(get_c2_page, page_url, headers, rate_limiter)
+            for page_url in islice(page_urls, concurrency)
+        )
+        while pending:
+            data = pending.popleft().result()
+            for page_url in islice(page_urls, 1):
+                pending.append(
+                    executor.submit(get_c2_page, page_url, headers, rate_limiter)
+                )
+            yield data["data"]
+
+
+def iter_c2_workouts(url, headers, page_size=None, concurrency=None, rate_limiter=None):
+    """
+    This generator yields the single workouts of all pages of a concept2
+    logbook api results call.
+    """
+    for page in iter_c2_result_pages(
+        url, headers, page_size, concurrency, rate_limiter
+    ):
+        yield from page
+
+
+def get_c2_error_message(error):
+    """
+    This function returns the message shown to the user for a failed call to
+    the concept2 logbook api.
+    """
+    if error.status_code == 401:
+        return (
+            "Connection Error: {error}: If this error persists try to delete "
+            "the API Key in your profile and authorize yourself again."
+            "".format(error=error.message)
+        )
+    elif error.status_code:
+        return "Connection Error: {error}.".format(error=error.message)
+    return "C2 API Error: {error}".format(error=error.message)
+
+
+def sync_member(member, latest=None, on_batch=None, rate_limiter=None):
+    """
+    This function syncs the erg data of a member from the concept2 logbook api.
+    It requests either all or just the latest workouts, stores them and adds
+    the time of the syncing to the last synced parameter of the profile.
+    It returns the number of newly stored ergs and of synced workouts and
+    raises a C2APIError if the api call fails.
+    """
+    profile = member.user.profile
+    url = get_results_api_call_url(profile, latest)
+    headers = get_api_header(profile)
+    stored_ergs, synced_workouts = store_c2_workouts(
+        iter_c2_workouts(url, headers, rate_limiter=rate_limiter),
+        member,
+        on_batch=on_batch,
+        profile=profile,
+    )
+    profile.last_c2_sync = now()
+    profile.save(update_fields=["last_c2_sync"])
+    return stored_ergs, synced_workouts
+
+
+async def sync_member_async(member, latest=None, on_batch=None):
+    """
+    This function is the async version of sync_member for the async views.
+    The member has to come with its user and profile, as the database can
+    only be used through sync_to_async here. Every page of workouts is stored
+    with one sync_to_async call, which also reports the progress to on_batch.
+    """
+    profile = member.user.profile
+    url = get_results_api_call_url(profile, latest)
+    headers = get_api_header(profile)
+    stored_ergs = synced_workouts = 0
+    newest = None
+
+    def store_page(page, is_last=False):
+        nonlocal stored_ergs, synced_workouts
+        with transaction.atomic():
+            stored, synced = store_c2_workouts(page, member)
+            if is_last:
+                advance_synced_until(profile, newest)
+        stored_ergs += stored
+        synced_workouts += synced
+        if on_batch is not None:
+            on_batch(stored_ergs, synced_workouts)
+
+    # Like in store_c2_workouts every page is only stored once the next one
+    # has arrived, so the high water mark moves with the last one.
+    previous_page = None
+    async for page in iter_c2_result_pages_async(url, headers):
+        if previous_page is not None:
+            await sync_to_async(store_page)(previous_page)
+        newest = get_newest_workout_date(page, newest)
+        previous_page = page
+    if previous_page is not None:
+        await sync_to_async(store_page)(previous_page, is_last=True)
+    profile.last_c2_sync = now()
+    await sync_to_async(profile.save)(update_fields=["last_c2_sync"])
+    return stored_ergs, synced_workouts
+
+
+SyncResult = namedtuple(
+    "SyncResult", ["member", "stored_ergs", "synced_workouts", "seconds", "error"]
+)
+
+
+def sync_account(member, max_requests_per_second):
+    """
+    This function syncs the latest workouts of one member for the bulk sync
+    and returns a SyncResult instead of raising, so one failing account does
+    not stop the others. Members who have never synced get their full
+    history.
+    """
+    started_at = time.monotonic()
+    profile = member.user.profile
+    latest = "latest" if profile.c2_synced_until or profile.last_c2_sync else None
+    try:
+        stored_ergs, synced_workouts = sync_member(
+            member, latest, rate_limiter=RateLimiter(max_requests_per_second)
+        )
+    except C2APIError as error:
+        return SyncResult(
+            member, 0, 0, time.monotonic() - started_at, get_c2_error_message(error)
+        )
+    except requests.RequestException as error:
+        return SyncResult(
+            member, 0, 0, time.monotonic() - started_at, "Connection Error: %s" % error
+        )
+    except Exception as error:
+        logger.exception("Sync of member %s failed", member.pk)
+        return SyncResult(
+            member, 0, 0, time.monotonic() - started_at, "Sync Error: %s" % error
+        )
+    finally:
+        # Every thread of the pool opens its own database connection
+        connection.close()
+    return SyncResult(
+        member, stored_ergs, synced_workouts, time.monotonic() - started_at, None
+    )
+
+
+def sync_all_accounts(workers=4, max_requests_per_second=2.0, on_result=None):
+    """
+    This function syncs every member who connected their concept2 logbook,
+    fanned out over a pool of worker threads, and returns the SyncResult of
+    every account. The club leaderboards are refreshed once at the end.
+    """
+    members = (
+        Member.objects.filter(
+            user__profile__c2_api_key__isnull=False,
+            user__profile__c2_logbook_id__isnull=False,
+        )
+        .exclude(user__profile__c2_api_key="")
+        .exclude(user__profile__c2_logbook_id="")
+        .select_related("user__profile")
+    )
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(sync_account, member, max_requests_per_second)
+            for member in members
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    if any(result.stored_ergs for result in results):
+        refresh_club_leaderboards()
+    return results
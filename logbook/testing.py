@@ -0,0 +1,183 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def make_c2_workout(workout_id, distance=2000, time=4200, date="2023-04-10 09:00:00"):
+    """
+    This function returns a workout as it is returned by the concept2 logbook
+    results api.
+    """
+    return {
+        "id": workout_id,
+        "user_id": 1553112,
+        "date": date,
+        "distance": distance,
+        "type": "rower",
+        "time": time,
+        "stroke_rate": 24,
+        "heart_rate": {"average": 150},
+    }
+
+
+class C2StubServer:
+    """
+    A local http server answering like the results endpoint of the concept2
+    logbook api. It serves the given workouts in pages of the requested size
+    and records every request path, so tests and benchmarks can sync against
+    it instead of the real api. Like the api it only returns the workouts
+    since the date of the from parameter. The workouts can also be given as a
+    dict mapping concept2 user ids to the workouts of that user.
+
+    with C2StubServer(workouts) as server:
+        url = server.base_url + "/api/users/1/results?type=rower"
+    """
+
+    def __init__(self, workouts, default_page_size=50, status_code=200, failures=0):
+        if isinstance(workouts, dict):
+            self.workouts_by_user = {
+                str(user_id): list(user_workouts)
+                for user_id, user_workouts in workouts.items()
+            }
+        else:
+            self.workouts_by_user = None
+            self.workouts = list(workouts)
+        self.default_page_size = default_page_size
+        self.status_code = status_code
+        # Number of requests answered with 503 before the stub recovers
+        self.failures = failures
+        self.requested_paths = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def get_workouts(self, path):
+        if self.workouts_by_user is None:
+            return self.workouts
+        # /api/users/{user_id}/results
+        user_id = path.split("/")[3]
+        return self.workouts_by_user.get(user_id, [])
+
+    def get_page(self, path):
+        parts = urlsplit(path)
+        params = parse_qs(parts.query)
+        all_workouts = self.get_workouts(parts.path)
+        if "from" in params:
+            all_workouts = [
+                workout
+                for workout in all_workouts
+                if workout["date"] >= params["from"][0]
+            ]
+        page_size = int(params.get("number", [self.default_page_size])[0])
+        current_page = int(params.get("page", ["1"])[0])
+        total_pages = max(1, -(-len(all_workouts) // page_size))
+        start = (current_page - 1) * page_size
+        workouts = all_workouts[start:][:page_size]
+        links = {}
+        if current_page < total_pages:
+            params["page"] = [str(current_page + 1)]
+            query = "&".join(
+                "{}={}".format(key, value[0]) for key, value in params.items()
+            )
+            links["next"] = "{}{}?{}".format(self.base_url, parts.path, query)
+        return {
+            "data": workouts,
+            "meta": {
+                "pagination": {
+                    "total": len(all_workouts),
+                    "count": len(workouts),
+                    "per_page": page_size,
+                    "current_page": current_page,
+                    "total_pages": total_pages,
+                    "links": links,
+                }
+            },
+        }
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.requested_paths.append(self.path)
+                    status_code = stub.status_code
+                    if stub.failures:
+                        stub.failures -= 1
+                        status_code = 503
+                if status_code == 200:
+                    body = stub.get_page(self.path)
+                else:
+                    body = {"message": "Stub error", "status_code": status_code}
+                payload = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin failing a test if a view runs more SQL queries than its
+    budget in query_budgets, which maps view names to the maximum number of
+    queries. Budgets should not depend on the number of rows shown, so an N+1
+    query in a template or view fails the test.
+
+    class ScoreboardTest(QueryBudgetMixin, TestCase):
+        query_budgets = {"logbook:squad-scoreboard": 8}
+    """
+
+    query_budgets = {}
+
+    def get_within_query_budget(self, path, client=None, **kwargs):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(path, **kwargs)
+        view_name = response.resolver_match.view_name
+        self.assertIn(
+            view_name, self.query_budgets, "No query budget for {}".format(view_name)
+        )
+        budget = self.query_budgets[view_name]
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            "{view} ran {count} queries, its budget is {budget}:\n{sql}".format(
+                view=view_name,
+                count=len(queries),
+                budget=budget,
+                sql="\n".join(query["sql"] for query in queries.captured_queries),
+            ),
+        )
+        return response
@@ -1,28 +1,107 @@
 # Create your tests here.
+import csv
 import datetime
+import json
 import os
 import random
+import tempfile
+import unittest
+from io import StringIO
 from unittest.mock import Mock, patch
 
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth.middleware import AuthenticationMiddleware
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
 from django.contrib.messages import get_messages
 from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.http import HttpResponse
-from django.test import Client, RequestFactory, TestCase
+from django.db import connection
+from django.db.models import F
+from django.test import (
+    AsyncRequestFactory,
+    Client,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from logbook.models import FinishedErg
-from logbook.views import (
+from logbook.analytics import (
+    get_progress,
+    get_rolling_average,
+    load_erg_histories,
+    load_erg_history,
+)
+from logbook.benchmark import (
+    benchmark_connection_overhead,
+    run_benchmarks,
+    seed_benchmark_data,
+)
+from logbook.club_leaderboard import (
+    ENTRY_FIELDS,
+    RANKED_DISTANCES,
+    build_club_leaderboard_entries,
+    get_club_leaderboard,
+    get_club_leaderboard_distances,
+    get_season_start,
+    refresh_club_leaderboards,
+)
+from logbook.bulk import update_ergs
+from logbook.db import iterate_values
+from logbook.importer import import_ergs
+from logbook.jobs import enqueue_sync_job, run_pending_sync_jobs
+from logbook.leaderboard import rebuild_leaderboards
+from logbook.models import (
+    ClubLeaderboardEntry,
+    FinishedErg,
+    PersonalBest,
+    SquadMonthlyLeaderboard,
+    SyncJob,
+)
+from logbook.metrics import view_metrics
+from logbook.middleware import ViewMetricsMiddleware
+from logbook.pace import (
+    calculate_calories_per_hour,
     calculate_split_time,
+    calculate_watts,
+    convert_c2_workouts,
     convert_date_field,
-    create_erg_object,
     format_duration,
+)
+from logbook.personal_bests import (
+    PERSONAL_BEST_ORDERING,
+    rebuild_personal_bests,
+    refresh_personal_bests,
+)
+from logbook.signals import per_erg_updates_paused
+from logbook.pagination import NEXT, encode_cursor, paginate_by_keyset
+from logbook.testing import C2StubServer, QueryBudgetMixin, make_c2_workout
+from logbook.sync import (
+    C2APIError,
+    RateLimiter,
+    advance_synced_until,
+    build_erg_object,
     get_api_header,
     get_results_api_call_url,
+    iter_c2_result_pages,
+    iter_c2_workouts,
+    store_c2_workouts,
+    sync_all_accounts,
+    sync_member,
+)
+from logbook.quotes import get_quotes
+from logbook.views import (
+    get_rndm_motiv_quote,
     sync_c2_erg_data,
+    sync_c2_erg_data_async,
 )
 from users.models import Profile, Squad
 
@@ -98,13 +177,10 @@ class CreateErgObjectDuplicateTest(TestCase):
         self.user2.profile.c2_logbook_id = 1553112
         self.user2.save()
 
-    def test_create_erg_object(self):
-        request = self.client.get("/get-erg-data/")
-        http_request = request.wsgi_request
-        http_request.user = self.user
-        erg = create_erg_object(self.workout, http_request)
+    def test_build_erg_object(self):
+        erg = build_erg_object(self.workout, self.user.member)
         self.assertEqual(erg.name, "Concept2 826m. Row")
-        self.assertEqual(erg.c2_logbook_id, 1)
+        self.assertEqual(erg.c2_logbook_id, "1")
         self.assertEqual(erg.completed_by, self.user.member)
         self.assertEqual(erg.distance, 826)
         self.assertEqual(erg.avg_spm, 24)
@@ -113,20 +189,16 @@ class CreateErgObjectDuplicateTest(TestCase):
         self.assertEqual(erg.split_time, datetime.timedelta(seconds=129))
         self.assertEqual(erg.avg_heartrate, 160)
 
-    def test_format_duration(self):
-        self.assertEqual(format_duration(10), datetime.timedelta(seconds=1))
-
-    def test_calculate_split_time(self):
-        # Checks that the time in tenth of seconds is calculating the right
-        # split time in the right format.
+    def test_store_c2_workouts_skips_synced_workouts(self):
+        workouts = [dict(self.workout, id=workout_id) for workout_id in range(5)]
+        stored = store_c2_workouts(workouts[:3], self.user.member, batch_size=2)
+        self.assertEqual(stored, (3, 3))
+        stored = store_c2_workouts(workouts + workouts, self.user.member)
+        self.assertEqual(stored, (2, 10))
         self.assertEqual(
-            calculate_split_time(4200, 2000), datetime.timedelta(seconds=105)
+            FinishedErg.objects.filter(completed_by=self.user.member).count(), 5
         )
 
-    def test_convert_date_field(self):
-        date = "2020-02-14 09:30:15"
-        self.assertEqual(convert_date_field(date), datetime.date(2020, 2, 14))
-
     def test_get_api_header(self):
         self.user.profile.c2_api_key = os.getenv("C2_API_KEY")
         self.user.save()
@@ -145,8 +217,103 @@ class CreateErgObjectDuplicateTest(TestCase):
         )
 
 
+class PaceTest(TestCase):
+    def test_format_duration(self):
+        self.assertEqual(format_duration(10), datetime.timedelta(seconds=1))
+
+    def test_calculate_split_time(self):
+        # Checks that the time in tenth of seconds is calculating the right
+        # split time in the right format.
+        self.assertEqual(
+            calculate_split_time(4200, 2000), datetime.timedelta(seconds=105)
+        )
+
+    def test_convert_date_field(self):
+        date = "2020-02-14 09:30:15"
+        self.assertEqual(convert_date_field(date), datetime.date(2020, 2, 14))
+
+    def test_calculate_watts_and_calories(self):
+        split_time = datetime.timedelta(minutes=2)
+        self.assertEqual(calculate_watts(split_time), 203)
+        self.assertEqual(calculate_calories_per_hour(split_time), 997)
+        self.assertIsNone(calculate_watts(datetime.timedelta()))
+
+    def test_convert_c2_workouts_like_one_by_one(self):
+        workouts = [
+            make_c2_workout(
+                number,
+                distance=distance,
+                time=time,
+                date="2023-03-{:02d} 23:59:59".format(number + 1),
+            )
+            for number, (distance, time) in enumerate(
+                [(2000, 4200), (826, 2124), (6000, 15005), (500, 905), (21097, 51234)]
+            )
+        ]
+        columns = convert_c2_workouts(workouts)
+        for index, workout in enumerate(workouts):
+            split_time = calculate_split_time(workout["time"], workout["distance"])
+            self.assertEqual(
+                [column[index] for column in columns],
+                [
+                    convert_date_field(workout["date"]),
+                    format_duration(workout["time"]),
+                    split_time,
+                    calculate_watts(split_time),
+                    calculate_calories_per_hour(split_time),
+                ],
+            )
+        self.assertIsInstance(columns.watts[0], int)
+
+    def test_convert_c2_workouts_without_distance(self):
+        columns = convert_c2_workouts([make_c2_workout(1, distance=0)])
+        self.assertEqual(columns.result_time, [datetime.timedelta(seconds=420)])
+        self.assertEqual(columns.split_time, [None])
+        self.assertEqual(columns.watts, [None])
+        self.assertEqual(columns.calories_per_hour, [None])
+
+    def test_saving_an_erg_stores_the_derived_metrics(self):
+        user = User.objects.create_user(username="testuser", password="testpass")
+        erg = FinishedErg.objects.create(
+            completed_by=user.member,
+            completed_at=datetime.date(2023, 3, 1),
+            distance=2000,
+            split_time=datetime.timedelta(minutes=2),
+            result_time=datetime.timedelta(minutes=8),
+        )
+        erg.refresh_from_db()
+        self.assertEqual((erg.watts, erg.calories_per_hour), (203, 997))
+        erg.split_time = datetime.timedelta(seconds=105)
+        erg.save()
+        erg.refresh_from_db()
+        self.assertEqual(erg.watts, 302)
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(reverse("logbook:erg-detail", args=[erg.pk]))
+        self.assertContains(response, "<p>302</p>")
+
+    def test_synced_ergs_store_the_derived_metrics(self):
+        user = User.objects.create_user(username="testuser", password="testpass")
+        store_c2_workouts([make_c2_workout(1)], user.member)
+        erg = FinishedErg.objects.get(c2_logbook_id="1")
+        self.assertEqual(erg.split_time, datetime.timedelta(seconds=105))
+        self.assertEqual((erg.watts, erg.calories_per_hour), (302, 1341))
+
+    def test_sync_skips_workouts_without_distance_or_time(self):
+        user = User.objects.create_user(username="testuser", password="testpass")
+        workouts = [
+            make_c2_workout(1),
+            make_c2_workout(2, distance=0),
+            make_c2_workout(3, time=0),
+        ]
+        self.assertEqual(store_c2_workouts(workouts, user.member), (1, 3))
+        self.assertEqual(
+            list(FinishedErg.objects.values_list("c2_logbook_id", flat=True)), ["1"]
+        )
+
+
 class IndexViewTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username="testuser", email="test@test.com", password="testpass"
@@ -176,6 +343,20 @@ class IndexViewTest(TestCase):
             is_test=False,
         )
 
+    def create_teammate(self, username, split_seconds):
+        teammate = User.objects.create_user(
+            username=username, email=f"{username}@test.com", password="testpass"
+        )
+        teammate.member.squad = self.squad
+        teammate.member.save()
+        return FinishedErg.objects.create(
+            completed_by=teammate.member,
+            completed_at=get_random_date_of_current_month(self),
+            distance=2000,
+            split_time=timezone.timedelta(seconds=split_seconds),
+            is_test=True,
+        )
+
     def test_index_template_for_anonymous_user(self):
         response = self.client.get(reverse("logbook:index"))
         self.assertTemplateUsed(response, "logbook/login_required.html")
@@ -197,11 +378,12 @@ class IndexViewTest(TestCase):
         self.client.login(username="testuser", password="testpass")
         self.user.member.is_coach = True
         self.user.member.save()
-        self.finished_erg3.is_test = True
-        self.finished_erg3.distance = 2000
-        self.finished_erg3.save()
+        self.create_teammate("teammate1", 200)
+        self.create_teammate("teammate2", 220)
+        self.create_teammate("teammate3", 240)
         response = self.client.get(reverse("logbook:index"))
         self.assertEqual(len(response.context["splits_to_display"]), 3)
+        self.assertEqual(response.context["splits_to_display"][0], self.finished_erg1)
         self.assertIsNotNone(response.context["current_squad"])
 
     def test_context_data_for_user_with_no_test(self):
@@ -222,11 +404,132 @@ class IndexViewTest(TestCase):
         self.finished_erg1.save()
         self.finished_erg2.save()
         self.finished_erg3.save()
+        self.create_teammate("teammate1", 200)
+        self.create_teammate("teammate2", 220)
         response = self.client.get(reverse("logbook:index"))
         self.assertEqual(len(response.context["splits_to_display"]), 3)
         self.assertEqual(response.context["users_best_split"].id, self.finished_erg1.id)
         self.assertEqual(response.context["users_position"], 1)
 
+    def test_context_data_for_user_outside_top_three(self):
+        self.client.login(username="testuser", password="testpass")
+        self.create_teammate("teammate1", 100)
+        self.create_teammate("teammate2", 110)
+        self.create_teammate("teammate3", 120)
+        response = self.client.get(reverse("logbook:index"))
+        self.assertEqual(len(response.context["splits_to_display"]), 4)
+        self.assertEqual(response.context["splits_to_display"][3], self.finished_erg1)
+        self.assertEqual(response.context["users_position"], 4)
+
+    def test_leaderboard_is_served_from_cache(self):
+        self.client.login(username="testuser", password="testpass")
+        self.client.get(reverse("logbook:index"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("logbook:index"))
+        self.assertFalse(
+            [
+                query
+                for query in queries.captured_queries
+                if "logbook_squadmonthlyleaderboard" in query["sql"]
+            ]
+        )
+        self.assertEqual(response.context["users_position"], 1)
+
+    def test_new_erg_test_invalidates_cached_leaderboard(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(reverse("logbook:index"))
+        self.assertEqual(response.context["users_position"], 1)
+        self.create_teammate("teammate1", 100)
+        response = self.client.get(reverse("logbook:index"))
+        self.assertEqual(response.context["users_position"], 2)
+        self.assertEqual(len(response.context["splits_to_display"]), 2)
+
+    def test_new_squad_invalidates_cached_squads(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(reverse("logbook:index"))
+        self.assertEqual(list(response.context["squads"]), [self.squad])
+        new_squad = Squad.objects.create(squad_name="Another Squad")
+        response = self.client.get(reverse("logbook:index"))
+        self.assertIn(new_squad, response.context["squads"])
+
+
+class MotivationalQuoteTest(TestCase):
+    def test_quotes_are_read_only_once(self):
+        with patch("builtins.open") as mock_open:
+            quote = get_rndm_motiv_quote(4)
+            get_rndm_motiv_quote(1)
+        mock_open.assert_not_called()
+        self.assertIn(quote, get_quotes()["motivational_quotes"])
+
+    def test_quotes_do_not_depend_on_working_directory(self):
+        cwd = os.getcwd()
+        os.chdir("/")
+        self.addCleanup(os.chdir, cwd)
+        get_quotes.cache_clear()
+        self.assertTrue(get_quotes()["motivational_quotes"])
+
+
+class SquadMonthlyLeaderboardTest(TestCase):
+    def setUp(self):
+        self.squad = Squad.objects.create(squad_name="Test Squad")
+        self.user = User.objects.create_user(username="rower1", password="testpass")
+        self.user.member.squad = self.squad
+        self.user.member.save()
+        self.user2 = User.objects.create_user(username="rower2", password="testpass")
+        self.user2.member.squad = self.squad
+        self.user2.member.save()
+        self.erg1 = self.create_test(self.user, 110)
+        self.erg2 = self.create_test(self.user, 100)
+        self.erg3 = self.create_test(self.user2, 105)
+
+    def create_test(self, user, split_seconds, distance=2000):
+        return FinishedErg.objects.create(
+            completed_by=user.member,
+            completed_at=datetime.date(2023, 4, 10),
+            distance=distance,
+            split_time=timezone.timedelta(seconds=split_seconds),
+            is_test=True,
+        )
+
+    def get_ranking(self):
+        return list(
+            SquadMonthlyLeaderboard.objects.filter(
+                squad=self.squad, year=2023, month=4, distance=2000
+            ).values_list("erg_id", "rank")
+        )
+
+    def test_only_best_test_of_member_is_ranked(self):
+        self.assertEqual(self.get_ranking(), [(self.erg2.id, 1), (self.erg3.id, 2)])
+
+    def test_leaderboard_updated_on_change(self):
+        self.erg2.split_time = timezone.timedelta(seconds=120)
+        self.erg2.save()
+        self.assertEqual(self.get_ranking(), [(self.erg3.id, 1), (self.erg1.id, 2)])
+        self.erg2.distance = 5000
+        self.erg2.split_time = timezone.timedelta(seconds=90)
+        self.erg2.save()
+        self.assertEqual(self.get_ranking(), [(self.erg3.id, 1), (self.erg1.id, 2)])
+
+    def test_leaderboard_updated_on_delete(self):
+        self.erg3.delete()
+        self.assertEqual(self.get_ranking(), [(self.erg2.id, 1)])
+
+    def test_leaderboard_updated_on_squad_change(self):
+        other_squad = Squad.objects.create(squad_name="Other Squad")
+        self.user2.member.squad = other_squad
+        self.user2.member.save()
+        self.assertEqual(self.get_ranking(), [(self.erg2.id, 1)])
+        self.assertTrue(
+            SquadMonthlyLeaderboard.objects.filter(
+                squad=other_squad, erg=self.erg3, rank=1
+            ).exists()
+        )
+
+    def test_rebuild_leaderboards(self):
+        SquadMonthlyLeaderboard.objects.all().delete()
+        self.assertEqual(rebuild_leaderboards(), 1)
+        self.assertEqual(self.get_ranking(), [(self.erg2.id, 1), (self.erg3.id, 2)])
+
 
 class SquadScoreBoardTestCase(TestCase):
     def setUp(self):
@@ -365,6 +668,144 @@ class SquadScoreBoardTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.context["squads_erg_tests"]), 1)
 
+    def test_coach_scoreboard_positions_per_squad(self):
+        other_squad = Squad.objects.create(squad_name="Other Squad")
+        rower = User.objects.create_user(username="rower", password="rowerpass")
+        rower.member.squad = other_squad
+        rower.member.save()
+        other_erg = FinishedErg.objects.create(
+            completed_by=rower.member,
+            completed_at="2023-04-05",
+            distance=2000,
+            split_time=timezone.timedelta(seconds=200),
+            result_time=timezone.timedelta(seconds=800),
+            is_test=True,
+        )
+        coach_user = User.objects.create_user(
+            username="coach", email="coach@test.com", password="coachpass"
+        )
+        coach_user.member.is_coach = True
+        coach_user.member.save()
+        self.client.login(username="coach", password="coachpass")
+        url = reverse("logbook:squad-scoreboard", args=[2023, 4])
+        response = self.client.get(url)
+        squads_erg_tests = response.context["squads_erg_tests"]
+        self.assertEqual(squads_erg_tests["Other Squad"], [other_erg])
+        self.assertEqual(squads_erg_tests["Other Squad"][0].position, 1)
+        self.assertEqual(
+            [erg.position for erg in squads_erg_tests["Test Squad"]], [1, 2]
+        )
+
+    def test_coach_scoreboard_query_count_independent_of_squads(self):
+        coach_user = User.objects.create_user(
+            username="coach", email="coach@test.com", password="coachpass"
+        )
+        coach_user.member.is_coach = True
+        coach_user.member.save()
+        self.client.login(username="coach", password="coachpass")
+        url = reverse("logbook:squad-scoreboard", args=[2023, 4])
+        with CaptureQueriesContext(connection) as one_squad:
+            self.client.get(url)
+        for i in range(3):
+            squad = Squad.objects.create(squad_name=f"Squad {i}")
+            rower = User.objects.create_user(username=f"rower{i}", password="pass")
+            rower.member.squad = squad
+            rower.member.save()
+            FinishedErg.objects.create(
+                completed_by=rower.member,
+                completed_at="2023-04-05",
+                distance=2000,
+                split_time=timezone.timedelta(seconds=200),
+                is_test=True,
+            )
+        with CaptureQueriesContext(connection) as four_squads:
+            self.client.get(url)
+        self.assertEqual(len(one_squad), len(four_squads))
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "EXPLAIN output of postgres")
+class FinishedErgIndexTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        # The tables are tiny in the tests, so sequential scans would win.
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def prefer_sorted_index(self):
+        # Sorting a few rows is cheaper than any index, so the planner has to
+        # be told to avoid it to show which index provides the order.
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_sort = off")
+
+    def test_erg_history_uses_member_index(self):
+        self.prefer_sorted_index()
+        plan = (
+            FinishedErg.objects.filter(completed_by=self.user.member)
+            .order_by("-completed_at", "-id")
+            .explain()
+        )
+        self.assertIn("erg_member_history_idx", plan)
+
+    def test_keyset_page_uses_member_index(self):
+        erg = FinishedErg.objects.create(
+            completed_by=self.user.member,
+            completed_at=datetime.date(2023, 4, 10),
+            distance=2000,
+            split_time=datetime.timedelta(seconds=100),
+        )
+        cursor = encode_cursor(erg, NEXT)
+        self.prefer_sorted_index()
+        with CaptureQueriesContext(connection) as queries:
+            paginate_by_keyset(
+                FinishedErg.objects.filter(completed_by=self.user.member), 10, cursor
+            )
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN " + queries.captured_queries[0]["sql"])
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn("erg_member_history_idx", plan)
+        self.assertNotIn("OFFSET", queries.captured_queries[0]["sql"])
+
+    def create_analyzed_ergs(self, test_every, days):
+        # Which index wins depends on how many erg tests there are and over
+        # how many days. The table is analyzed, so the plan does not depend
+        # on the statistics left behind by earlier tests.
+        FinishedErg.objects.bulk_create(
+            FinishedErg(
+                completed_by=self.user.member,
+                completed_at=datetime.date(2023, 1, 1)
+                + datetime.timedelta(days=erg_number % days),
+                distance=2000,
+                split_time=datetime.timedelta(seconds=100),
+                result_time=datetime.timedelta(seconds=400),
+                is_test=erg_number % test_every == 0,
+            )
+            for erg_number in range(500)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE logbook_finishederg")
+
+    def test_recent_tests_use_partial_index(self):
+        self.create_analyzed_ergs(test_every=100, days=30)
+        plan = (
+            FinishedErg.objects.filter(completed_by=self.user.member, is_test=True)
+            .order_by("-completed_at")
+            .explain()
+        )
+        self.assertIn("erg_member_recent_test_idx", plan)
+
+    def test_month_of_tests_uses_partial_index(self):
+        self.create_analyzed_ergs(test_every=2, days=365)
+        plan = (
+            FinishedErg.objects.filter(
+                is_test=True,
+                completed_at__gte=datetime.date(2023, 4, 1),
+                completed_at__lt=datetime.date(2023, 5, 1),
+            )
+            .order_by("result_time")
+            .explain()
+        )
+        self.assertIn("erg_test_month_idx", plan)
+
 
 class APICalls(TestCase):
     def setUp(self):
@@ -406,8 +847,9 @@ class APICalls(TestCase):
         self.user2.profile.c2_api_key = "sadsdwSdadsqsdqwdsdasdw"
         self.user2.profile.c2_logbook_id = 1553112
         self.user2.save()
-        mock_c2_get_request = patch("logbook.views.send_get_request_to_c2_api")
+        mock_c2_get_request = patch("logbook.sync.send_get_request_to_c2_api")
         self.mock_c2_get_request = mock_c2_get_request.start()
+        self.addCleanup(mock_c2_get_request.stop)
 
         self.mock_ret_data = {
             "data": [
@@ -622,31 +1064,1413 @@ class APICalls(TestCase):
 
         _ = sync_c2_erg_data(self.request, "None")
         messages = list(get_messages(self.request))
-        self.assertEqual(
-            str(messages[0]),
-            f"{len(self.mock_ret_data['data'])} Erg Workouts "
-            f"from your Concept2 Logbook have been syncronised",
-        )
+        self.assertIn("is being syncronised", str(messages[0]))
+        self.assertFalse(self.mock_c2_get_request.called)
+        job = run_pending_sync_jobs()[0]
+        self.assertEqual(job.status, SyncJob.DONE)
+        self.assertEqual(job.stored_ergs, len(self.mock_ret_data["data"]))
         user_ergs = FinishedErg.objects.filter(completed_by=self.request.user.member)
         self.assertEqual(len(user_ergs), len(self.mock_ret_data["data"]))
 
+    def test_sync_c2_erg_data_twice(self):
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = self.mock_ret_data
+        self.mock_c2_get_request.return_value = mock_response
+
+        _ = sync_c2_erg_data(self.request, "None")
+        run_pending_sync_jobs()
+        _ = sync_c2_erg_data(self.request, "None")
+        job = run_pending_sync_jobs()[0]
+        self.assertEqual(job.stored_ergs, 0)
+        self.assertEqual(job.synced_workouts, 2 * len(self.mock_ret_data["data"]))
+        self.assertIsNotNone(Profile.objects.get(user=self.user).last_c2_sync)
+
+    def test_sync_c2_erg_data_queues_one_job(self):
+        _ = sync_c2_erg_data(self.request, "None")
+        _ = sync_c2_erg_data(self.request, "None")
+        self.assertEqual(SyncJob.objects.filter(member=self.user.member).count(), 1)
+
     def test_get_c2_erg_data_response_unauthorised_error(self):
         self.mock_c2_get_request.return_value.status_code = 401
         self.mock_c2_get_request.json.return_value = {"message": "Otto"}
         _ = sync_c2_erg_data(self.request, "None")
-        messages = list(get_messages(self.request))
+        job = run_pending_sync_jobs()[0]
         error_message = (
             "If this error persists try to delete the API Key in "
             "your profile and authorize yourself again."
         )
-        self.assertIn(error_message, str(messages[0]))
+        self.assertEqual(job.status, SyncJob.FAILED)
+        self.assertIn(error_message, job.error)
 
     def test_get_c2_erg_data_response_error(self):
         self.mock_c2_get_request.return_value.status_code = 404
         example_error = {"message": "This is an example error message"}
         self.mock_c2_get_request.return_value.json.return_value = example_error
         _ = sync_c2_erg_data(self.request, "None")
-        messages = list(get_messages(self.request))
+        job = run_pending_sync_jobs()[0]
+        self.assertEqual(job.status, SyncJob.FAILED)
+        self.assertEqual(job.error, f"Connection Error: {example_error['message']}.")
+
+    def test_server_error_is_retried_with_backoff(self):
+        self.mock_c2_get_request.return_value.status_code = 503
+        self.mock_c2_get_request.return_value.json.return_value = {
+            "message": "Unavailable"
+        }
+        _ = sync_c2_erg_data(self.request, "None")
+        job = run_pending_sync_jobs()[0]
+        self.assertEqual(job.status, SyncJob.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+        # The job is not due yet
+        self.assertEqual(run_pending_sync_jobs(), [])
+
+    def test_unexpected_error_fails_job(self):
+        _ = sync_c2_erg_data(self.request, "None")
+        with patch("logbook.jobs.sync_member", side_effect=ValueError("Bad data")):
+            with self.assertLogs("logbook.jobs", "ERROR"):
+                job = run_pending_sync_jobs()[0]
+        self.assertEqual(job.status, SyncJob.FAILED)
+        self.assertEqual(job.error, "Sync Error: Bad data")
+        # The member can sync again
+        _ = sync_c2_erg_data(self.request, "None")
+        self.assertEqual(SyncJob.objects.filter(member=self.user.member).count(), 2)
+
+    @override_settings(SYNC_JOB_TIMEOUT=60, SYNC_JOB_MAX_ATTEMPTS=3)
+    def test_stale_job_fails_after_max_attempts(self):
+        job = SyncJob.objects.create(
+            member=self.user.member, status=SyncJob.RUNNING, attempts=3
+        )
+        SyncJob.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - datetime.timedelta(minutes=5)
+        )
+        self.assertEqual(run_pending_sync_jobs(), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, SyncJob.FAILED)
+        self.assertEqual(job.attempts, 3)
+
+    def test_sync_status(self):
+        _ = sync_c2_erg_data(self.request, "None")
+        job = SyncJob.objects.get(member=self.user.member)
+        response = self.client.get(reverse("logbook:sync-status", args=[job.pk]))
+        self.assertEqual(response.json()["status"], SyncJob.QUEUED)
+        response = self.client.get(reverse("logbook:erg-history"))
+        self.assertContains(
+            response,
+            'data-status-url="{}"'.format(
+                reverse("logbook:sync-status", args=[job.pk])
+            ),
+        )
+        self.client.login(username="testuser2", password="testpass2")
+        response = self.client.get(reverse("logbook:sync-status", args=[job.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class C2PaginationTest(TestCase):
+    def setUp(self):
+        self.workouts = [make_c2_workout(workout_id) for workout_id in range(120)]
+        self.server = C2StubServer(self.workouts).start()
+        self.addCleanup(self.server.stop)
+        self.url = self.server.base_url + "/api/users/1553112/results?type=rower"
+        self.headers = {"Authorization": "Bearer TestToken"}
+
+    def test_follows_next_links(self):
+        pages = list(iter_c2_result_pages(self.url, self.headers, page_size=50))
+        self.assertEqual([len(page) for page in pages], [50, 50, 20])
+        self.assertEqual(len(self.server.requested_paths), 3)
+        self.assertEqual(
+            [workout["id"] for page in pages for workout in page], list(range(120))
+        )
+
+    def test_requests_pages_concurrently_in_order(self):
+        workouts = list(
+            iter_c2_workouts(self.url, self.headers, page_size=25, concurrency=3)
+        )
+        self.assertEqual([workout["id"] for workout in workouts], list(range(120)))
+        self.assertEqual(len(self.server.requested_paths), 5)
+
+    def test_error_response_raises(self):
+        self.server.status_code = 404
+        with self.assertRaises(C2APIError) as context:
+            list(iter_c2_workouts(self.url, self.headers))
+        self.assertEqual(context.exception.status_code, 404)
+        self.assertEqual(context.exception.message, "Stub error")
+
+    def test_sync_c2_erg_data_stores_all_pages(self):
+        user = User.objects.create_user(username="testuser", password="testpass")
+        user.profile.c2_logbook_id = 1553112
+        user.profile.c2_api_key = "TestToken"
+        user.profile.save()
+        self.client.login(username="testuser", password="testpass")
+        with override_settings(
+            C2_API_BASE_URL=self.server.base_url, C2_RESULTS_PAGE_SIZE=50
+        ):
+            response = self.client.get(reverse("logbook:sync_c2_erg_data"))
+            call_command("run_sync_worker", "--once", stdout=StringIO())
+        self.assertRedirects(response, reverse("logbook:erg-history"))
+        self.assertEqual(
+            FinishedErg.objects.filter(completed_by=user.member).count(), 120
+        )
+
+
+class C2DeltaSyncTest(TestCase):
+    def setUp(self):
+        self.workouts = [
+            make_c2_workout(workout_id, date="2023-04-{:02d} 09:00:00".format(day))
+            for workout_id, day in enumerate(range(10, 0, -1))
+        ]
+        self.server = C2StubServer(self.workouts, default_page_size=4).start()
+        self.addCleanup(self.server.stop)
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.profile = self.user.profile
+        self.profile.c2_logbook_id = 1553112
+        self.profile.c2_api_key = "TestToken"
+        self.profile.save()
+
+    def sync(self, latest=None):
+        with override_settings(
+            C2_API_BASE_URL=self.server.base_url, C2_RESULTS_PAGE_SIZE=4
+        ):
+            return sync_member(self.user.member, latest)
+
+    def test_full_sync_sets_high_water_mark(self):
+        self.assertEqual(self.sync(), (10, 10))
+        self.assertEqual(
+            self.profile.c2_synced_until,
+            datetime.datetime(2023, 4, 10, 9, tzinfo=datetime.timezone.utc),
+        )
+        self.assertEqual(len(self.server.requested_paths), 3)
+
+    def test_latest_sync_only_requests_workouts_after_the_mark(self):
+        self.sync()
+        self.server.workouts.insert(0, make_c2_workout(10, date="2023-04-12 18:30:00"))
+        self.server.requested_paths = []
+        self.assertEqual(self.sync("latest"), (1, 2))
+        self.assertEqual(len(self.server.requested_paths), 1)
+        self.assertIn("from=2023-04-10+09%3A00%3A00", self.server.requested_paths[0])
+        self.assertEqual(self.profile.c2_synced_until.day, 12)
+        self.assertEqual(
+            FinishedErg.objects.filter(completed_by=self.user.member).count(), 11
+        )
+
+    def test_sync_skips_workouts_without_distance(self):
+        self.server.workouts.insert(
+            0, make_c2_workout(10, distance=0, date="2023-04-12 18:30:00")
+        )
+        self.assertEqual(self.sync(), (10, 11))
+        self.assertFalse(FinishedErg.objects.filter(c2_logbook_id="10").exists())
+        self.assertEqual(self.profile.c2_synced_until.day, 12)
+
+    def test_interrupted_sync_keeps_the_mark(self):
+        self.sync()
+        synced_until = self.profile.c2_synced_until
+        self.server.workouts[:0] = [
+            make_c2_workout(workout_id, date="2023-05-{:02d} 09:00:00".format(day))
+            for workout_id, day in zip(range(10, 13), range(20, 17, -1))
+        ]
+
+        def interrupted_workouts():
+            # The newest workouts come first, so the mark must not move to
+            # them while the older ones are still missing
+            yield from self.server.workouts[:2]
+            raise C2APIError("Stub error", 503)
+
+        with self.assertRaises(C2APIError):
+            store_c2_workouts(
+                interrupted_workouts(),
+                self.user.member,
+                batch_size=1,
+                profile=self.profile,
+            )
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.c2_synced_until, synced_until)
+        self.assertEqual(
+            FinishedErg.objects.filter(completed_by=self.user.member).count(), 11
+        )
+        self.assertEqual(self.sync("latest"), (2, 4))
         self.assertEqual(
-            str(messages[0]), f"Connection Error: " f"{example_error['message']}."
+            self.profile.c2_synced_until.date(), datetime.date(2023, 5, 20)
+        )
+
+    def test_mark_never_moves_back(self):
+        newest = datetime.datetime(2023, 5, 1, tzinfo=datetime.timezone.utc)
+        advance_synced_until(self.profile, newest)
+        advance_synced_until(self.profile, newest - datetime.timedelta(days=3))
+        self.assertEqual(self.profile.c2_synced_until, newest)
+
+    def test_profiles_without_mark_fall_back_to_the_last_sync(self):
+        self.profile.last_c2_sync = datetime.datetime(
+            2023, 4, 5, 12, tzinfo=datetime.timezone.utc
+        )
+        url = get_results_api_call_url(self.profile, "latest")
+        self.assertTrue(url.endswith("&from=2023-04-05 12:00:00"))
+        self.profile.last_c2_sync = None
+        url = get_results_api_call_url(self.profile, "latest")
+        self.assertNotIn("from=", url)
+
+
+class SyncAllAccountsTest(TransactionTestCase):
+    def setUp(self):
+        self.server = C2StubServer(
+            {
+                "1": [make_c2_workout(workout_id) for workout_id in range(30)],
+                "2": [make_c2_workout(workout_id) for workout_id in range(100, 110)],
+            },
+            default_page_size=20,
+        ).start()
+        self.addCleanup(self.server.stop)
+        for c2_logbook_id in ["1", "2", "3"]:
+            user = User.objects.create_user(username=f"rower{c2_logbook_id}")
+            user.profile.c2_logbook_id = c2_logbook_id
+            user.profile.c2_api_key = "TestToken"
+            user.profile.save()
+        User.objects.create_user(username="not_connected")
+
+    def test_sync_all_c2(self):
+        out = StringIO()
+        with override_settings(C2_API_BASE_URL=self.server.base_url):
+            call_command("sync_all_c2", "--workers", "2", "--rate", "100", stdout=out)
+        self.assertIn("Synced 3 accounts", out.getvalue())
+        self.assertIn("40 new ergs from 40 workouts", out.getvalue())
+        self.assertEqual(FinishedErg.objects.count(), 40)
+        self.assertEqual(Profile.objects.filter(last_c2_sync__isnull=False).count(), 3)
+
+    def test_unexpected_error_only_fails_its_account(self):
+        def sync_member_or_fail(member, latest=None, **kwargs):
+            if member.user.username == "rower1":
+                raise ValueError("Bad data")
+            return sync_member(member, latest, **kwargs)
+
+        with override_settings(C2_API_BASE_URL=self.server.base_url):
+            with patch("logbook.sync.sync_member", side_effect=sync_member_or_fail):
+                with self.assertLogs("logbook.sync", "ERROR"):
+                    results = sync_all_accounts(workers=2, max_requests_per_second=100)
+        errors = {result.member.user.username: result.error for result in results}
+        self.assertEqual(errors["rower1"], "Sync Error: Bad data")
+        self.assertIsNone(errors["rower2"])
+        self.assertEqual(FinishedErg.objects.count(), 10)
+
+    def test_rate_limiter_spaces_requests(self):
+        rate_limiter = RateLimiter(20)
+        started_at = timezone.now()
+        for _ in range(5):
+            rate_limiter.wait()
+        elapsed = timezone.now() - started_at
+        self.assertGreaterEqual(elapsed, datetime.timedelta(seconds=0.19))
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        seed_benchmark_data(squads=2, members=6, ergs=300, seed=1)
+
+    def get_seeded_ergs(self):
+        return sorted(
+            FinishedErg.objects.values_list(
+                "completed_by__user__username",
+                "completed_at",
+                "distance",
+                "split_time",
+                "is_test",
+            )
+        )
+
+    def test_seed_benchmark_data(self):
+        self.assertEqual(
+            Squad.objects.filter(squad_name__startswith="Benchmark Squad").count(), 2
+        )
+        self.assertEqual(
+            User.objects.filter(username__startswith="benchmark-member").count(), 6
+        )
+        self.assertEqual(FinishedErg.objects.count(), 300)
+        self.assertTrue(FinishedErg.objects.filter(is_test=True).exists())
+        self.assertTrue(SquadMonthlyLeaderboard.objects.exists())
+
+    def test_seed_benchmark_data_is_deterministic(self):
+        seeded_ergs = self.get_seeded_ergs()
+        seed_benchmark_data(squads=2, members=6, ergs=300, seed=1)
+        self.assertEqual(self.get_seeded_ergs(), seeded_ergs)
+
+    def test_run_benchmarks_command(self):
+        # Syncs of other members are left to the worker
+        other_job = enqueue_sync_job(
+            User.objects.get(username="benchmark-member1").member
+        )
+        out = StringIO()
+        call_command(
+            "run_benchmarks", "--iterations", "2", "--workouts", "5", stdout=out
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(
+            set(report["results"]),
+            {
+                "index_member",
+                "index_coach",
+                "erg_history",
+                "erg_history_last_page",
+                "erg_history_deep_cursor",
+                "squad_scoreboard_member",
+                "squad_scoreboard_coach",
+                "club_leaderboard",
+                "sync_c2_erg_data",
+                "convert_c2_workouts_one_by_one",
+                "convert_c2_workouts_batch",
+            },
+        )
+        for name, result in report["results"].items():
+            self.assertEqual(result["runs"], 2)
+            if not name.startswith("convert_c2_workouts"):
+                self.assertGreater(result["queries"], 0)
+            self.assertLessEqual(result["p50_ms"], result["max_ms"])
+        sync_member = User.objects.get(username="benchmark-sync").member
+        self.assertEqual(
+            FinishedErg.objects.filter(completed_by=sync_member).count(), 5
+        )
+        other_job.refresh_from_db()
+        self.assertEqual(other_job.status, SyncJob.QUEUED)
+
+    def test_run_benchmarks_without_ergs(self):
+        FinishedErg.objects.all().delete()
+        report = run_benchmarks(iterations=1, workouts_per_sync=1)
+        self.assertNotIn("erg_history_deep_cursor", report["results"])
+        self.assertIn("erg_history", report["results"])
+
+
+class ConnectionOverheadBenchmarkTest(TransactionTestCase):
+    def setUp(self):
+        seed_benchmark_data(squads=1, members=2, ergs=20, seed=1)
+        self.client.force_login(User.objects.get(username="benchmark-member1"))
+
+    def test_benchmark_connection_overhead(self):
+        conn_max_age = connection.settings_dict["CONN_MAX_AGE"]
+        results = benchmark_connection_overhead(
+            self.client, reverse("logbook:index"), 3
+        )
+        self.assertEqual(results["new_connection"]["runs"], 3)
+        self.assertEqual(results["new_connection"]["connections"], 1)
+        self.assertEqual(results["persistent_connection"]["connections"], 0)
+        self.assertEqual(results["connect"]["runs"], 3)
+        self.assertEqual(connection.settings_dict["CONN_MAX_AGE"], conn_max_age)
+
+
+class ViewMetricsTest(QueryBudgetMixin, TestCase):
+    query_budgets = {
+        "logbook:index": 8,
+        "logbook:erg-history": 4,
+        "logbook:squad-scoreboard": 7,
+        "logbook:club-leaderboard": 4,
+        "logbook:progress": 3,
+        "logbook:log-erg": 2,
+        "logbook:erg-detail": 4,
+    }
+
+    def setUp(self):
+        cache.clear()
+        view_metrics.reset()
+        self.squad = Squad.objects.create(squad_name="Test Squad")
+        self.user = self.create_member("testuser")
+        self.coach = self.create_member("coach", is_coach=True)
+        for number in range(5):
+            teammate = self.create_member("teammate{}".format(number))
+            for distance in [2000, 1000]:
+                FinishedErg.objects.create(
+                    completed_by=teammate.member,
+                    completed_at=timezone.now().date(),
+                    distance=distance,
+                    split_time=timezone.timedelta(seconds=100 + number),
+                    result_time=timezone.timedelta(seconds=400 + number),
+                    is_test=True,
+                )
+        self.scoreboard_url = reverse(
+            "logbook:squad-scoreboard",
+            kwargs={"year": timezone.now().year, "month": timezone.now().month},
+        )
+
+    def create_member(self, username, is_coach=False):
+        user = User.objects.create_user(
+            username=username, email=f"{username}@test.com", password="testpass"
+        )
+        user.member.squad = self.squad
+        user.member.is_coach = is_coach
+        user.member.save()
+        return user
+
+    def test_query_budgets(self):
+        self.client.login(username="testuser", password="testpass")
+        self.get_within_query_budget(reverse("logbook:index"))
+        self.get_within_query_budget(reverse("logbook:erg-history"))
+        self.get_within_query_budget(self.scoreboard_url)
+        self.get_within_query_budget(reverse("logbook:club-leaderboard"))
+        self.get_within_query_budget(reverse("logbook:progress"))
+        self.get_within_query_budget(reverse("logbook:log-erg"))
+        erg = FinishedErg.objects.first()
+        self.get_within_query_budget(erg.get_absolute_url())
+        self.client.login(username="coach", password="testpass")
+        self.get_within_query_budget(
+            reverse("logbook:index") + "?squad={}".format(self.squad.id)
+        )
+        self.get_within_query_budget(self.scoreboard_url)
+
+    def test_coach_leaderboard_does_not_load_members_per_erg(self):
+        self.client.login(username="coach", password="testpass")
+        url = reverse("logbook:index") + "?squad={}".format(self.squad.id)
+        # The session, the user with its member, the recent ergs, the personal
+        # bests, the squads and the leaderboard
+        with self.assertNumQueries(7):
+            response = self.client.get(url)
+        self.assertContains(response, "teammate0")
+
+    def test_server_timing_header(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(self.scoreboard_url)
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;desc="\d+ queries";dur=[\d.]+, tpl;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+
+    @patch.dict(connection.settings_dict, {"DISABLE_SERVER_SIDE_CURSORS": True})
+    @patch("logbook.export.EXPORT_CHUNK_SIZE", 4)
+    def test_metrics_of_streaming_responses(self):
+        self.client.login(username="coach", password="testpass")
+        response = self.client.get(reverse("logbook:export-erg-tests"))
+        self.assertFalse(response.has_header("Server-Timing"))
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 11)
+        # The session, the user and three pages of the ten erg tests
+        self.assertIn(
+            'erganiser_view_queries_sum{view="logbook:export-erg-tests"} 5',
+            view_metrics.export(),
+        )
+
+    def test_metrics_are_only_shown_to_staff(self):
+        self.client.login(username="testuser", password="testpass")
+        self.client.get(self.scoreboard_url)
+        response = self.client.get(reverse("logbook:metrics"))
+        self.assertEqual(response.status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse("logbook:metrics"))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn("# TYPE erganiser_view_queries histogram", content)
+        self.assertIn(
+            'erganiser_view_duration_seconds_count{view="logbook:squad-scoreboard"} 1',
+            content,
+        )
+        self.assertRegex(
+            content,
+            r"erganiser_view_template_duration_seconds_sum"
+            r'\{view="logbook:squad-scoreboard"\} 0\.\d+',
         )
+
+
+C2_EXPORT_CSV = (
+    '"Log ID","Date","Description","Work Time (Formatted)","Work Time (Seconds)",'
+    '"Work Distance","Stroke Rate/Cadence","Avg Heart Rate","Type"\n'
+    '"71234","2023-04-10 09:00:00","2000m row","7:00.0","420.0","2000","28","178",'
+    '"RowErg"\n'
+    '"71235","2023-04-11 09:00:00","","40:00.0","2400.0","10000","20","",'
+    '"RowErg"\n'
+    '"71236","2023-04-12 09:00:00","","20:00.0","1200.0","10000","","","SkiErg"\n'
+)
+
+GENERIC_CSV = (
+    "completed_at,distance,result_time,split_time,name,is_test,avg_spm\n"
+    "{today},2000,0:07:00,,2k Test,true,30\n"
+    "{today},5000,0:19:00,0:01:54,,false,\n"
+    "not a date,2000,0:07:00,,,false,\n"
+)
+
+
+class ImportErgsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.squad = Squad.objects.create(squad_name="Test Squad")
+        self.user.member.squad = self.squad
+        self.user.member.save()
+        self.generic_csv = GENERIC_CSV.format(today=timezone.now().date())
+
+    def write_csv(self, content):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "ergs.csv")
+        with open(path, "w") as csv_file:
+            csv_file.write(content)
+        return path
+
+    def test_import_c2_export_with_command(self):
+        path = self.write_csv(C2_EXPORT_CSV)
+        out = StringIO()
+        call_command("import_ergs", path, "--user", "testuser", stdout=out)
+        self.assertIn("Imported 2 ergs from 3 rows, 0 duplicates", out.getvalue())
+        erg = FinishedErg.objects.get(c2_logbook_id="71234")
+        self.assertEqual(erg.completed_by, self.user.member)
+        self.assertEqual(erg.completed_at, datetime.date(2023, 4, 10))
+        self.assertEqual(erg.result_time, datetime.timedelta(minutes=7))
+        self.assertEqual(erg.split_time, datetime.timedelta(seconds=105))
+        self.assertEqual(erg.watts, 302)
+        self.assertEqual(erg.avg_spm, 28)
+        self.assertEqual(
+            FinishedErg.objects.get(c2_logbook_id="71235").name,
+            "Concept2 10000m. Row",
+        )
+        out = StringIO()
+        call_command("import_ergs", path, "--user", "testuser", stdout=out)
+        self.assertIn("Imported 0 ergs from 3 rows, 2 duplicates", out.getvalue())
+        self.assertEqual(FinishedErg.objects.count(), 2)
+
+    def test_imported_log_ids_do_not_block_the_sync_of_others(self):
+        import_ergs(StringIO(C2_EXPORT_CSV), self.user.member)
+        other = User.objects.create_user(username="other", password="testpass")
+        workouts = [make_c2_workout(71234), make_c2_workout(71235)]
+        self.assertEqual(store_c2_workouts(workouts, other.member), (2, 2))
+        self.assertEqual(FinishedErg.objects.filter(c2_logbook_id="71234").count(), 2)
+        # The importing member's own sync still skips them
+        self.assertEqual(store_c2_workouts(workouts, self.user.member), (0, 2))
+
+    def test_import_generic_csv(self):
+        result = import_ergs(StringIO(self.generic_csv), self.user.member, batch_size=1)
+        self.assertEqual((result.rows, result.stored_ergs, result.invalid), (3, 2, 1))
+        self.assertTrue(result.errors[0].startswith("Row 4: completed_at"))
+        erg_test = FinishedErg.objects.get(is_test=True)
+        self.assertEqual(erg_test.split_time, datetime.timedelta(seconds=105))
+        self.assertEqual(erg_test.name, "2k Test")
+        self.assertEqual(
+            FinishedErg.objects.get(distance=5000).split_time,
+            datetime.timedelta(seconds=114),
+        )
+        # The imported test is ranked although bulk_create sends no signals
+        self.assertEqual(
+            SquadMonthlyLeaderboard.objects.get(squad=self.squad).erg, erg_test
+        )
+        result = import_ergs(StringIO(self.generic_csv), self.user.member)
+        self.assertEqual((result.stored_ergs, result.duplicates), (0, 2))
+
+    def test_import_with_usernames(self):
+        other = User.objects.create_user(username="other", password="testpass")
+        content = "username,completed_at,distance,result_time\n" + "".join(
+            "{},2023-04-10,2000,0:07:00\n".format(username)
+            for username in ["testuser", "other", "nobody"]
+        )
+        result = import_ergs(StringIO(content), allow_usernames=True)
+        self.assertEqual((result.stored_ergs, result.invalid), (2, 1))
+        self.assertTrue(FinishedErg.objects.filter(completed_by=other.member).exists())
+
+    def test_upload_view(self):
+        self.client.login(username="testuser", password="testpass")
+        upload = SimpleUploadedFile("ergs.csv", C2_EXPORT_CSV.encode())
+        response = self.client.post(reverse("logbook:import-ergs"), {"file": upload})
+        self.assertRedirects(response, reverse("logbook:erg-history"))
+        self.assertEqual(
+            FinishedErg.objects.filter(completed_by=self.user.member).count(), 2
+        )
+
+    def test_upload_view_rejects_unknown_format(self):
+        self.client.login(username="testuser", password="testpass")
+        upload = SimpleUploadedFile("ergs.csv", b"foo,bar\n1,2\n")
+        response = self.client.post(reverse("logbook:import-ergs"), {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["form"].errors["file"])
+        self.assertFalse(FinishedErg.objects.exists())
+
+
+class ExportErgsTest(TestCase):
+    def setUp(self):
+        self.squad = Squad.objects.create(squad_name="Test Squad")
+        self.other_squad = Squad.objects.create(squad_name="Other Squad")
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.user.member.squad = self.squad
+        self.user.member.save()
+        self.coach = User.objects.create_user(username="coach", password="testpass")
+        self.coach.member.is_coach = True
+        self.coach.member.save()
+        self.teammate = User.objects.create_user(username="other", password="testpass")
+        self.teammate.member.squad = self.other_squad
+        self.teammate.member.save()
+        for member, completed_at, is_test in [
+            (self.user.member, datetime.date(2023, 4, 10), True),
+            (self.user.member, datetime.date(2023, 4, 12), False),
+            (self.user.member, datetime.date(2023, 5, 2), True),
+            (self.teammate.member, datetime.date(2023, 4, 11), True),
+        ]:
+            FinishedErg.objects.create(
+                completed_by=member,
+                completed_at=completed_at,
+                distance=2000,
+                result_time=datetime.timedelta(minutes=7),
+                split_time=datetime.timedelta(seconds=105),
+                is_test=is_test,
+            )
+
+    def get_content(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_history_as_csv(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(reverse("logbook:export-erg-history"))
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn("erg-history-testuser.csv", response["Content-Disposition"])
+        rows = list(csv.DictReader(StringIO(self.get_content(response))))
+        self.assertEqual(
+            [row["completed_at"] for row in rows],
+            ["2023-05-02", "2023-04-12", "2023-04-10"],
+        )
+        self.assertEqual(rows[0]["result_time"], "0:07:00")
+        self.assertEqual(rows[0]["avg_spm"], "")
+
+    def test_exported_history_can_be_imported(self):
+        self.client.login(username="testuser", password="testpass")
+        content = self.get_content(
+            self.client.get(reverse("logbook:export-erg-history"))
+        )
+        result = import_ergs(StringIO(content), self.coach.member)
+        self.assertEqual(result.stored_ergs, 3)
+
+    def test_export_history_as_ndjson(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(
+            reverse("logbook:export-erg-history") + "?format=ndjson"
+        )
+        rows = [json.loads(line) for line in self.get_content(response).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["distance"], 2000)
+        self.assertIs(rows[0]["is_test"], True)
+
+    def test_only_coaches_export_other_members(self):
+        self.client.login(username="testuser", password="testpass")
+        url = reverse("logbook:export-erg-history") + "?member={}".format(
+            self.teammate.pk
+        )
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.login(username="coach", password="testpass")
+        rows = self.get_content(self.client.get(url)).splitlines()
+        self.assertEqual(len(rows), 2)
+
+    def test_export_erg_tests_of_a_month(self):
+        self.client.login(username="coach", password="testpass")
+        url = reverse("logbook:export-erg-tests", kwargs={"year": 2023, "month": 4})
+        rows = list(csv.DictReader(StringIO(self.get_content(self.client.get(url)))))
+        self.assertEqual(
+            [(row["squad"], row["username"]) for row in rows],
+            [("Other Squad", "other"), ("Test Squad", "testuser")],
+        )
+        response = self.client.get(url + "?squad={}".format(self.squad.id))
+        self.assertIn("erg-tests-2023-04-test-squad", response["Content-Disposition"])
+        rows = list(csv.DictReader(StringIO(self.get_content(response))))
+        self.assertEqual([row["username"] for row in rows], ["testuser"])
+
+    def test_export_erg_tests_of_an_invalid_month(self):
+        self.client.login(username="coach", password="testpass")
+        url = reverse("logbook:export-erg-tests", kwargs={"year": 2023, "month": 13})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_export_history_of_an_invalid_member(self):
+        self.client.login(username="coach", password="testpass")
+        url = reverse("logbook:export-erg-history") + "?member=abc"
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_export_erg_tests_of_all_seasons(self):
+        self.client.login(username="coach", password="testpass")
+        response = self.client.get(reverse("logbook:export-erg-tests"))
+        self.assertEqual(len(self.get_content(response).splitlines()), 4)
+
+    def test_export_erg_tests_is_for_coaches(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(reverse("logbook:export-erg-tests"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_format(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(reverse("logbook:export-erg-history") + "?format=x")
+        self.assertEqual(response.status_code, 404)
+
+    @patch.dict(connection.settings_dict, {"DISABLE_SERVER_SIDE_CURSORS": True})
+    def test_export_without_server_side_cursors(self):
+        ergs = FinishedErg.objects.filter(completed_by=self.user.member).order_by(
+            "-completed_at"
+        )
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(iterate_values(ergs, ["completed_at", "is_test"], 2))
+        self.assertEqual(
+            rows,
+            [
+                (datetime.date(2023, 5, 2), True),
+                (datetime.date(2023, 4, 12), False),
+                (datetime.date(2023, 4, 10), True),
+            ],
+        )
+        # Two pages, the second one is not full
+        self.assertEqual(len(queries), 2)
+        self.client.login(username="testuser", password="testpass")
+        rows = self.get_content(
+            self.client.get(reverse("logbook:export-erg-history"))
+        ).splitlines()
+        self.assertEqual(len(rows), 4)
+
+    @patch.dict(connection.settings_dict, {"DISABLE_SERVER_SIDE_CURSORS": True})
+    def test_keyset_pages_keep_the_order(self):
+        FinishedErg.objects.filter(completed_at=datetime.date(2023, 4, 12)).update(
+            result_time=None, avg_spm=24
+        )
+        FinishedErg.objects.filter(completed_at=datetime.date(2023, 4, 11)).update(
+            result_time=None
+        )
+        fields = ["completed_at", "result_time", "avg_spm"]
+        for ordering in [
+            ["result_time", "completed_at"],
+            ["-result_time", "-completed_at"],
+            ["-avg_spm", "completed_by__squad__squad_name"],
+            ["distance"],
+        ]:
+            ergs = FinishedErg.objects.order_by(*ordering)
+            expected = [
+                row[: len(fields)]
+                for row in ergs.values_list(*fields, "id").order_by(
+                    *[
+                        F(field.lstrip("-")).desc(nulls_first=True)
+                        if field.startswith("-")
+                        else F(field).asc(nulls_last=True)
+                        for field in ordering
+                    ],
+                    "id",
+                )
+            ]
+            with self.subTest(ordering=ordering):
+                self.assertEqual(list(iterate_values(ergs, fields, 1)), expected)
+
+    @patch.dict(connection.settings_dict, {"DISABLE_SERVER_SIDE_CURSORS": True})
+    def test_export_skips_ergs_deleted_while_streaming(self):
+        ergs = FinishedErg.objects.filter(completed_by=self.user.member).order_by(
+            "-completed_at"
+        )
+        rows = iterate_values(ergs, ["completed_at"], 2)
+        self.assertEqual(next(rows), (datetime.date(2023, 5, 2),))
+        ergs.filter(completed_at=datetime.date(2023, 4, 10)).delete()
+        self.assertEqual(list(rows), [(datetime.date(2023, 4, 12),)])
+
+
+class ProgressAnalyticsTest(TestCase):
+    def setUp(self):
+        self.squad = Squad.objects.create(squad_name="Test Squad")
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.user.member.squad = self.squad
+        self.user.member.save()
+        self.teammate = User.objects.create_user(username="mate", password="testpass")
+        self.teammate.member.squad = self.squad
+        self.teammate.member.save()
+        for completed_at, distance, split_seconds, spm in [
+            (datetime.date(2023, 3, 1), 2000, 110, 28),
+            (datetime.date(2023, 3, 15), 6000, 120, None),
+            (datetime.date(2023, 3, 31), 2000, 108, 30),
+            (datetime.date(2023, 4, 30), 2000, 105, 32),
+        ]:
+            FinishedErg.objects.create(
+                completed_by=self.user.member,
+                completed_at=completed_at,
+                distance=distance,
+                split_time=datetime.timedelta(seconds=split_seconds),
+                avg_spm=spm,
+            )
+        FinishedErg.objects.create(
+            completed_by=self.teammate.member,
+            completed_at=datetime.date(2023, 4, 1),
+            distance=500,
+            split_time=datetime.timedelta(seconds=95),
+        )
+
+    def test_rolling_average_skips_missing_values(self):
+        averages = get_rolling_average(np.array([1.0, np.nan, 3.0, 5.0]), window=2)
+        self.assertEqual(averages.tolist(), [1.0, 1.0, 3.0, 4.0])
+
+    def test_progress_of_a_member(self):
+        progress = get_progress(load_erg_history(self.user.member.pk))
+        self.assertEqual(progress["ergs"], 4)
+        self.assertEqual(
+            progress["personal_bests"][2000],
+            {"split": 105.0, "pace": "1:45.0", "date": "2023-04-30"},
+        )
+        self.assertEqual(
+            progress["monthly_volume"],
+            {"months": ["2023-03", "2023-04"], "metres": [10000, 2000], "ergs": [3, 1]},
+        )
+        # 5 seconds faster in 60 days
+        self.assertEqual(progress["split_trends"][2000], -2.5)
+        self.assertNotIn(6000, progress["split_trends"])
+        self.assertEqual(progress["rolling_spm"][:2], [28.0, 28.0])
+
+    def test_histories_of_a_squad_are_loaded_in_one_query(self):
+        with self.assertNumQueries(1):
+            histories = load_erg_histories(
+                [self.user.member.pk, self.teammate.member.pk, 0]
+            )
+        self.assertEqual(len(histories[self.user.member.pk]), 4)
+        self.assertEqual(histories[self.teammate.member.pk].distances.tolist(), [500])
+        self.assertEqual(len(histories[0]), 0)
+
+    def test_progress_view(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(reverse("logbook:progress"))
+        self.assertContains(response, "1:45.0")
+        response = self.client.get(
+            reverse("logbook:progress-data") + "?squad={}".format(self.squad.id)
+        )
+        data = response.json()
+        self.assertEqual(data["progress"]["ergs"], 4)
+        # Only coaches see the squad
+        self.assertNotIn("squad_progress", data)
+
+    def test_squad_progress_for_coaches(self):
+        self.user.member.is_coach = True
+        self.user.member.save()
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(
+            reverse("logbook:progress-data") + "?squad={}".format(self.squad.id)
+        )
+        squad_progress = response.json()["squad_progress"]
+        self.assertEqual(
+            [(member["member"], member["metres"]) for member in squad_progress],
+            [("mate", 500), ("testuser", 12000)],
+        )
+
+
+class PersonalBestTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.member = self.user.member
+
+    def create_erg(self, split_seconds, distance=2000, **kwargs):
+        return FinishedErg.objects.create(
+            completed_by=self.member,
+            completed_at=kwargs.pop("completed_at", datetime.date(2023, 4, 10)),
+            distance=distance,
+            split_time=datetime.timedelta(seconds=split_seconds),
+            result_time=datetime.timedelta(seconds=split_seconds * distance / 500),
+            **kwargs,
+        )
+
+    def get_personal_best(self, distance=2000):
+        return PersonalBest.objects.get(member=self.member, distance=distance)
+
+    def test_personal_best_follows_saves_and_deletes(self):
+        slow = self.create_erg(110)
+        fast = self.create_erg(105)
+        self.assertEqual(self.get_personal_best().erg, fast)
+        fast.split_time = datetime.timedelta(seconds=115)
+        fast.save()
+        self.assertEqual(self.get_personal_best().erg, slow)
+        slow.delete()
+        self.assertEqual(self.get_personal_best().erg, fast)
+        fast.distance = 5000
+        fast.save()
+        self.assertFalse(PersonalBest.objects.filter(distance=2000).exists())
+        self.assertEqual(self.get_personal_best(5000).erg, fast)
+
+    def test_synced_and_imported_ergs_update_personal_bests(self):
+        self.create_erg(110)
+        store_c2_workouts([make_c2_workout(1, distance=2000, time=4000)], self.member)
+        self.assertEqual(self.get_personal_best().erg.c2_logbook_id, "1")
+        import_ergs(
+            StringIO("completed_at,distance,result_time\n2023-04-11,2000,0:06:20\n"),
+            self.member,
+        )
+        self.assertEqual(
+            self.get_personal_best().split_time, datetime.timedelta(seconds=95)
+        )
+
+    def test_rebuild_personal_bests(self):
+        self.create_erg(110)
+        self.create_erg(105, distance=5000)
+        expected = set(PersonalBest.objects.values_list("erg_id", "distance"))
+        PersonalBest.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_personal_bests", stdout=out)
+        self.assertIn("Rebuilt 2 personal bests", out.getvalue())
+        self.assertEqual(
+            set(PersonalBest.objects.values_list("erg_id", "distance")), expected
+        )
+        with patch.dict(
+            connection.settings_dict, {"DISABLE_SERVER_SIDE_CURSORS": True}
+        ), patch("logbook.personal_bests.REBUILD_CHUNK_SIZE", 1):
+            self.assertEqual(rebuild_personal_bests(), 2)
+        self.assertEqual(
+            set(PersonalBest.objects.values_list("erg_id", "distance")), expected
+        )
+
+    def test_detail_view_and_dashboard_show_personal_best(self):
+        slow = self.create_erg(110, completed_at=datetime.date(2023, 4, 1))
+        fast = self.create_erg(105)
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(reverse("logbook:erg-detail", args=[fast.pk]))
+        self.assertContains(response, "New PB!")
+        response = self.client.get(reverse("logbook:erg-detail", args=[slow.pk]))
+        self.assertNotContains(response, "New PB!")
+        response = self.client.get(reverse("logbook:index"))
+        self.assertEqual([pb.erg for pb in response.context["personal_bests"]], [fast])
+
+
+class ErgOwnershipTest(TestCase):
+    def setUp(self):
+        self.squad = Squad.objects.create(squad_name="Test Squad")
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.other = User.objects.create_user(username="other", password="testpass")
+        for user in [self.user, self.other]:
+            user.member.squad = self.squad
+            user.member.save()
+        self.ergs = [
+            self.create_erg(self.user, 105, is_test=True),
+            self.create_erg(self.user, 110),
+            self.create_erg(self.user, 115, distance=5000),
+        ]
+        self.other_erg = self.create_erg(self.other, 100, is_test=True)
+        self.client.login(username="testuser", password="testpass")
+
+    def create_erg(self, user, split_seconds, distance=2000, **kwargs):
+        return FinishedErg.objects.create(
+            completed_by=user.member,
+            completed_at=datetime.date(2023, 4, 10),
+            distance=distance,
+            split_time=datetime.timedelta(seconds=split_seconds),
+            result_time=datetime.timedelta(seconds=split_seconds * distance / 500),
+            **kwargs,
+        )
+
+    def bulk_edit(self, ergs, **data):
+        return self.client.post(
+            reverse("logbook:bulk-edit-ergs"),
+            {"ergs": [erg.pk for erg in ergs], **data},
+        )
+
+    def get_leaderboard(self):
+        return list(
+            SquadMonthlyLeaderboard.objects.filter(distance=2000).values_list(
+                "erg_id", "rank"
+            )
+        )
+
+    def test_update_and_delete_views_only_find_own_ergs(self):
+        for name in ["logbook:update-erg", "logbook:delete-erg"]:
+            url = reverse(name, args=[self.other_erg.pk])
+            self.assertEqual(self.client.get(url).status_code, 404)
+            self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertTrue(FinishedErg.objects.filter(pk=self.other_erg.pk).exists())
+
+    def test_update_view_fetches_the_erg_once(self):
+        url = reverse("logbook:update-erg", args=[self.ergs[1].pk])
+        # The session, the user and the erg
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.context["object"], self.ergs[1])
+
+    def test_delete_view(self):
+        response = self.client.post(
+            reverse("logbook:delete-erg", args=[self.ergs[1].pk])
+        )
+        self.assertRedirects(response, reverse("logbook:erg-history"))
+        self.assertFalse(FinishedErg.objects.filter(pk=self.ergs[1].pk).exists())
+
+    def test_bulk_delete(self):
+        with patch("logbook.signals.refresh_personal_bests") as refresh_per_erg, patch(
+            "logbook.bulk.refresh_personal_bests", wraps=refresh_personal_bests
+        ) as refresh_once:
+            response = self.bulk_edit(self.ergs[:2], action="delete")
+        # The leaderboards are refreshed once for all ergs, not per erg
+        refresh_per_erg.assert_not_called()
+        refresh_once.assert_called_once()
+        self.assertFalse(per_erg_updates_paused.get())
+        self.assertRedirects(response, reverse("logbook:erg-history"))
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            ["Deleted 2 Erg Workouts."],
+        )
+        self.assertEqual(
+            set(FinishedErg.objects.values_list("pk", flat=True)),
+            {self.ergs[2].pk, self.other_erg.pk},
+        )
+        self.assertEqual(self.get_leaderboard(), [(self.other_erg.pk, 1)])
+        self.assertEqual(
+            list(
+                PersonalBest.objects.filter(member=self.user.member).values_list(
+                    "erg_id", flat=True
+                )
+            ),
+            [self.ergs[2].pk],
+        )
+
+    def test_bulk_update(self):
+        self.bulk_edit(self.ergs[:2], action="update", is_test="false", effort="low")
+        self.assertEqual(
+            list(
+                FinishedErg.objects.filter(completed_by=self.user.member)
+                .order_by("split_time")
+                .values_list("is_test", "effort")
+            ),
+            [(False, "low"), (False, "low"), (False, None)],
+        )
+        self.assertEqual(self.get_leaderboard(), [(self.other_erg.pk, 1)])
+        self.bulk_edit(self.ergs[1:2], action="update", is_test="true")
+        self.assertEqual(
+            self.get_leaderboard(), [(self.other_erg.pk, 1), (self.ergs[1].pk, 2)]
+        )
+
+    def test_bulk_edit_rejects_ergs_of_other_members(self):
+        response = self.bulk_edit([self.ergs[0], self.other_erg], action="delete")
+        self.assertRedirects(response, reverse("logbook:erg-history"))
+        self.assertIn(
+            "Select a valid choice",
+            str(list(get_messages(response.wsgi_request))[0]),
+        )
+        self.assertEqual(FinishedErg.objects.count(), 4)
+
+    def test_bulk_update_needs_a_change(self):
+        response = self.bulk_edit(self.ergs, action="update")
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            ["Choose what to change."],
+        )
+        with self.assertRaises(ValueError):
+            update_ergs(self.user.pk, [self.ergs[0].pk], distance=1000)
+
+
+class ConditionalRequestTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.squad = Squad.objects.create(squad_name="Test Squad")
+        self.other_squad = Squad.objects.create(squad_name="Other Squad")
+        self.user = self.create_member("testuser", self.squad)
+        self.teammate = self.create_member("teammate", self.squad)
+        self.rival = self.create_member("rival", self.other_squad)
+        self.coach = self.create_member("coach", is_coach=True)
+        self.create_erg(self.teammate)
+        self.scoreboard_url = reverse(
+            "logbook:squad-scoreboard",
+            kwargs={"year": timezone.now().year, "month": timezone.now().month},
+        )
+        self.client.login(username="testuser", password="testpass")
+
+    def create_member(self, username, squad=None, is_coach=False):
+        user = User.objects.create_user(username=username, password="testpass")
+        user.member.squad = squad
+        user.member.is_coach = is_coach
+        user.member.save()
+        return user
+
+    def create_erg(self, user, is_test=True):
+        return FinishedErg.objects.create(
+            completed_by=user.member,
+            completed_at=timezone.now().date(),
+            distance=2000,
+            split_time=datetime.timedelta(seconds=105),
+            result_time=datetime.timedelta(seconds=420),
+            is_test=is_test,
+        )
+
+    def get_again(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_unchanged_dashboard_is_not_rendered_again(self):
+        url = reverse("logbook:index")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # The session and the user
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_again(url, response).status_code, 304)
+        self.create_erg(self.teammate)
+        self.assertEqual(self.get_again(url, response).status_code, 200)
+
+    def test_erg_history_changes_with_own_ergs_only(self):
+        url = reverse("logbook:erg-history")
+        response = self.client.get(url)
+        self.create_erg(self.teammate)
+        self.assertEqual(self.get_again(url, response).status_code, 304)
+        self.create_erg(self.user, is_test=False)
+        self.assertEqual(self.get_again(url, response).status_code, 200)
+        response = self.client.get(url)
+        enqueue_sync_job(self.user.member)
+        self.assertEqual(self.get_again(url, response).status_code, 200)
+
+    def test_scoreboards(self):
+        response = self.client.get(self.scoreboard_url)
+        self.create_erg(self.rival)
+        self.assertEqual(self.get_again(self.scoreboard_url, response).status_code, 304)
+        self.client.login(username="coach", password="testpass")
+        response = self.client.get(self.scoreboard_url)
+        self.assertEqual(self.get_again(self.scoreboard_url, response).status_code, 304)
+        self.create_erg(self.rival)
+        self.assertEqual(self.get_again(self.scoreboard_url, response).status_code, 200)
+
+    def test_etags_differ_between_users(self):
+        response = self.client.get(self.scoreboard_url)
+        self.client.login(username="teammate", password="testpass")
+        self.assertEqual(self.get_again(self.scoreboard_url, response).status_code, 200)
+
+    def test_pending_messages_are_shown(self):
+        url = reverse("logbook:erg-history")
+        response = self.client.get(url)
+        self.client.post(reverse("logbook:bulk-edit-ergs"), {"action": "delete"})
+        response = self.get_again(url, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "This field is required.")
+
+    def test_coach_dashboard_without_squad_is_always_rendered(self):
+        self.client.login(username="coach", password="testpass")
+        response = self.client.get(reverse("logbook:index"))
+        self.assertFalse(response.has_header("ETag"))
+        url = reverse("logbook:index") + "?squad={}".format(self.squad.id)
+        response = self.client.get(url)
+        self.assertEqual(self.get_again(url, response).status_code, 304)
+
+
+class ClubLeaderboardTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.squad_a = Squad.objects.create(squad_name="A")
+        self.squad_b = Squad.objects.create(squad_name="B")
+        self.anna = self.create_member("anna", "f", self.squad_a)
+        self.ben = self.create_member("ben", "m", self.squad_a)
+        self.cara = self.create_member("cara", "f", self.squad_b)
+        self.create_erg(self.anna, 95, days_ago=400)
+        self.create_erg(self.anna, 105)
+        self.create_erg(self.ben, 100)
+        self.create_erg(self.cara, 110, days_ago=60)
+        self.create_erg(self.cara, 115, distance=5000)
+        # Only ranked distances are on the leaderboards
+        self.create_erg(self.ben, 80, distance=1234)
+        refresh_club_leaderboards()
+
+    def create_member(self, username, sex, squad):
+        user = User.objects.create_user(username=username, password="testpass")
+        user.member.sex = sex
+        user.member.squad = squad
+        user.member.save()
+        return user.member
+
+    def create_erg(self, member, split_seconds, distance=2000, days_ago=0):
+        return FinishedErg.objects.create(
+            completed_by=member,
+            completed_at=self.today - datetime.timedelta(days=days_ago),
+            distance=distance,
+            split_time=datetime.timedelta(seconds=split_seconds),
+            result_time=datetime.timedelta(seconds=split_seconds * distance / 500),
+        )
+
+    def get_usernames(self, period, distance=2000, **kwargs):
+        return [
+            str(entry.member)
+            for entry in get_club_leaderboard(period, distance, **kwargs)
+        ]
+
+    def test_periods(self):
+        self.assertEqual(
+            self.get_usernames(ClubLeaderboardEntry.ALL_TIME), ["anna", "ben", "cara"]
+        )
+        self.assertEqual(
+            self.get_usernames(ClubLeaderboardEntry.LAST_90_DAYS),
+            ["ben", "anna", "cara"],
+        )
+        self.assertEqual(
+            self.get_usernames(ClubLeaderboardEntry.LAST_30_DAYS), ["ben", "anna"]
+        )
+        self.assertEqual(
+            get_club_leaderboard_distances(ClubLeaderboardEntry.ALL_TIME), [2000, 5000]
+        )
+
+    def test_filter_by_sex_and_squad(self):
+        self.assertEqual(
+            self.get_usernames(ClubLeaderboardEntry.ALL_TIME, sex="f"),
+            ["anna", "cara"],
+        )
+        self.assertEqual(
+            self.get_usernames(ClubLeaderboardEntry.ALL_TIME, squad_id=self.squad_b.id),
+            ["cara"],
+        )
+
+    def test_season_starts_in_september(self):
+        self.assertEqual(
+            get_season_start(datetime.date(2023, 9, 1)), datetime.date(2023, 9, 1)
+        )
+        self.assertEqual(
+            get_season_start(datetime.date(2024, 3, 15)), datetime.date(2023, 9, 1)
+        )
+
+    @unittest.skipUnless(
+        connection.vendor == "postgresql", "Compares with the materialized view"
+    )
+    def test_fallback_matches_materialized_view(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT CURRENT_DATE")
+            today = cursor.fetchone()[0]
+        rows = (
+            FinishedErg.objects.filter(
+                distance__in=RANKED_DISTANCES, completed_by__isnull=False
+            )
+            .order_by("completed_by_id", "distance", *PERSONAL_BEST_ORDERING)
+            .values_list(*ENTRY_FIELDS)
+        )
+        self.assertEqual(
+            {
+                (entry.id, entry.member_id, entry.split_time)
+                for entry in build_club_leaderboard_entries(rows, today)
+            },
+            set(
+                ClubLeaderboardEntry.objects.values_list(
+                    "id", "member_id", "split_time"
+                )
+            ),
+        )
+
+    def test_refresh_fallback_table(self):
+        if connection.vendor == "postgresql":
+            # The materialized view is swapped for the table of the other
+            # databases, which the rollback of the test undoes
+            with connection.cursor() as cursor:
+                cursor.execute("DROP MATERIALIZED VIEW logbook_clubleaderboardentry")
+            with connection.schema_editor() as schema_editor:
+                schema_editor.create_model(ClubLeaderboardEntry)
+        self.create_erg(self.cara, 90, days_ago=10)
+        with patch.object(connection, "vendor", "sqlite"):
+            refresh_club_leaderboards()
+        self.assertEqual(
+            self.get_usernames(ClubLeaderboardEntry.ALL_TIME), ["cara", "anna", "ben"]
+        )
+        self.assertEqual(
+            self.get_usernames(ClubLeaderboardEntry.LAST_30_DAYS),
+            ["cara", "ben", "anna"],
+        )
+        self.assertEqual(
+            get_club_leaderboard_distances(ClubLeaderboardEntry.ALL_TIME), [2000, 5000]
+        )
+        self.assertEqual(ClubLeaderboardEntry.objects.count(), 16)
+
+    def test_imported_and_synced_ergs_are_ranked(self):
+        import_ergs(
+            StringIO(
+                "completed_at,distance,result_time\n{},2000,0:06:00\n".format(
+                    self.today
+                )
+            ),
+            self.cara,
+        )
+        self.assertEqual(
+            self.get_usernames(ClubLeaderboardEntry.LAST_30_DAYS),
+            ["cara", "ben", "anna"],
+        )
+        self.ben.user.profile.c2_logbook_id = 1553112
+        self.ben.user.profile.c2_api_key = "TestToken"
+        self.ben.user.profile.save()
+        workout = make_c2_workout(1, time=3400, date="{} 09:00:00".format(self.today))
+        with C2StubServer([workout]) as server, override_settings(
+            C2_API_BASE_URL=server.base_url
+        ):
+            enqueue_sync_job(self.ben)
+            run_pending_sync_jobs()
+        self.assertEqual(
+            self.get_usernames(ClubLeaderboardEntry.LAST_30_DAYS),
+            ["ben", "cara", "anna"],
+        )
+
+    def test_refresh_command(self):
+        self.create_erg(self.cara, 90)
+        call_command("refresh_club_leaderboards", stdout=StringIO())
+        self.assertEqual(
+            self.get_usernames(ClubLeaderboardEntry.SEASON, sex="f")[0], "cara"
+        )
+
+    def test_view(self):
+        self.client.login(username="anna", password="testpass")
+        response = self.client.get(
+            reverse("logbook:club-leaderboard"),
+            {"period": "all-time", "sex": "f"},
+        )
+        self.assertTemplateUsed(response, "logbook/club-leaderboard.html")
+        self.assertEqual(response.context["distance"], 2000)
+        self.assertEqual(
+            [str(entry.member) for entry in response.context["entries"]],
+            ["anna", "cara"],
+        )
+        self.assertEqual(response.context["entries"][1].rank, 2)
+        response = self.client.get(
+            reverse("logbook:club-leaderboard"), {"squad": self.squad_b.id}
+        )
+        self.assertEqual(response.context["period"], ClubLeaderboardEntry.SEASON)
+        self.assertEqual(response.context["squad"], self.squad_b)
+        response = self.client.get(
+            reverse("logbook:club-leaderboard"), {"squad": "unknown"}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(C2_RESULTS_PAGE_SIZE=2, C2_API_RETRY_BACKOFF=0)
+class AsyncSyncViewTest(TestCase):
+    def setUp(self):
+        self.server = C2StubServer(
+            [make_c2_workout(workout_id) for workout_id in range(5)]
+        ).start()
+        self.addCleanup(self.server.stop)
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.user.profile.c2_logbook_id = 1553112
+        self.user.profile.c2_api_key = "TestToken"
+        self.user.profile.save()
+
+    def get_request(self, user=None):
+        request = AsyncRequestFactory().get("/sync_c2_erg_data/")
+        SessionMiddleware(get_response).process_request(request)
+        MessageMiddleware(get_response).process_request(request)
+        request.user = user or self.user
+        return request
+
+    def sync(self, request):
+        with override_settings(C2_API_BASE_URL=self.server.base_url):
+            return async_to_sync(sync_c2_erg_data_async)(request)
+
+    def test_sync_runs_right_away(self):
+        request = self.get_request()
+        response = self.sync(request)
+        self.assertEqual(response.url, reverse("logbook:erg-history"))
+        self.assertEqual(
+            FinishedErg.objects.filter(completed_by=self.user.member).count(), 5
+        )
+        self.assertEqual(len(self.server.requested_paths), 3)
+        job = SyncJob.objects.get()
+        self.assertEqual(job.status, SyncJob.DONE)
+        self.assertEqual((job.stored_ergs, job.synced_workouts), (5, 5))
+        self.user.profile.refresh_from_db()
+        self.assertIsNotNone(self.user.profile.last_c2_sync)
+        self.assertEqual(
+            self.user.profile.c2_synced_until,
+            datetime.datetime(2023, 4, 10, 9, tzinfo=datetime.timezone.utc),
+        )
+        self.assertIn("5 new Erg Workouts", str(list(get_messages(request))[0]))
+
+    def test_api_error_fails_job(self):
+        self.server.status_code = 401
+        request = self.get_request()
+        self.sync(request)
+        job = SyncJob.objects.get()
+        self.assertEqual(job.status, SyncJob.FAILED)
+        self.assertEqual(str(list(get_messages(request))[0]), job.error)
+
+    def test_server_error_is_left_to_worker(self):
+        self.server.status_code = 503
+        self.sync(self.get_request())
+        job = SyncJob.objects.get()
+        self.assertEqual(job.status, SyncJob.QUEUED)
+        self.assertGreater(job.run_after, timezone.now())
+
+    def test_running_job_is_not_synced_twice(self):
+        SyncJob.objects.create(member=self.user.member, status=SyncJob.RUNNING)
+        self.sync(self.get_request())
+        self.assertEqual(self.server.requested_paths, [])
+        self.assertFalse(FinishedErg.objects.exists())
+
+    def test_login_required(self):
+        response = self.sync(self.get_request(AnonymousUser()))
+        self.assertTrue(response.url.startswith(reverse("login")))
+
+    def test_metrics_middleware_counts_queries_of_async_views(self):
+        async def view(request):
+            return await sync_to_async(HttpResponse)(
+                str(await sync_to_async(FinishedErg.objects.count)())
+            )
+
+        request = self.get_request()
+        response = async_to_sync(ViewMetricsMiddleware(view))(request)
+        self.assertIn('db;desc="1 queries"', response["Server-Timing"])
@@ -1,24 +1,42 @@
+from django.conf import settings
 from django.urls import path
 
 from .views import (
+    BulkEditErgs,
+    ClubLeaderboard,
     ErgDeleteView,
     ErgDetailView,
     ErgUpdateView,
+    ImportErgs,
     Index,
     LogErg,
     LogErgTest,
     MyErgHistory,
+    Progress,
     SquadScoreBoard,
+    export_erg_history,
+    export_erg_tests,
+    metrics,
+    progress_data,
     sync_c2_erg_data,
+    sync_c2_erg_data_async,
+    sync_status,
 )
 
 app_name = "logbook"
 
+if settings.C2_ASYNC_VIEWS:
+    sync_c2_erg_data = sync_c2_erg_data_async  # noqa: F811
+
 urlpatterns = [
     path("", Index.as_view(), name="index"),
     path("log-erg", LogErg.as_view(), name="log-erg"),
     path("log-erg-test", LogErgTest.as_view(), name="log-erg-test"),
+    path("import-ergs", ImportErgs.as_view(), name="import-ergs"),
     path("erg-history", MyErgHistory.as_view(), name="erg-history"),
+    path("erg-history/bulk", BulkEditErgs.as_view(), name="bulk-edit-ergs"),
+    path("progress", Progress.as_view(), name="progress"),
+    path("progress/data", progress_data, name="progress-data"),
     path("erg-detail/<uuid:pk>", ErgDetailView.as_view(), name="erg-detail"),
     # path('erg-scores', SquadErgScores.as_view(), name='erg-scores'),
     path("update-erg/<uuid:pk>", ErgUpdateView.as_view(), name="update-erg"),
@@ -28,6 +46,16 @@ urlpatterns = [
         SquadScoreBoard.as_view(month_format="%m"),
         name="squad-scoreboard",
     ),
+    path("club-leaderboard", ClubLeaderboard.as_view(), name="club-leaderboard"),
     path("sync_c2_erg_data/", sync_c2_erg_data, name="sync_c2_erg_data"),
     path("sync_c2_erg_data/<str:latest>", sync_c2_erg_data, name="sync_c2_erg_data"),
+    path("sync-status/<uuid:pk>", sync_status, name="sync-status"),
+    path("export/erg-history", export_erg_history, name="export-erg-history"),
+    path("export/erg-tests", export_erg_tests, name="export-erg-tests"),
+    path(
+        "export/erg-tests/<int:year>/<int:month>",
+        export_erg_tests,
+        name="export-erg-tests",
+    ),
+    path("metrics", metrics, name="metrics"),
 ]
@@ -1,33 +1,76 @@
 import calendar
-import json
+import csv
+import io
 import random
-from datetime import timedelta
 
-import requests
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
 from django.core.exceptions import PermissionDenied
-from django.db import IntegrityError
-from django.http import HttpResponseRedirect
+from django.db.models import F, Window
+from django.db.models.functions import Rank
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.urls import reverse
-from django.utils.datetime_safe import datetime
+from django.utils.decorators import method_decorator
+from django.utils.text import slugify
 from django.utils.timezone import now
+from django.views.decorators.http import condition
 from django.views.generic import (
     CreateView,
     DeleteView,
     DetailView,
+    FormView,
     ListView,
     TemplateView,
     UpdateView,
 )
 from django.views.generic.dates import MonthArchiveView
 
-from logbook.forms import LogErgForm, LogErgTestForm, UpdateErgForm
-from users.models import Squad
-from .models import FinishedErg
-
-
+from logbook.forms import (
+    BulkEditErgsForm,
+    ImportErgsForm,
+    LogErgForm,
+    LogErgTestForm,
+    UpdateErgForm,
+)
+from users.models import Member
+from .analytics import (
+    STANDARD_DISTANCES,
+    get_progress,
+    get_squad_progress,
+    load_erg_history,
+)
+from .bulk import delete_ergs, update_ergs
+from .cache import (
+    get_cached_leaderboard_distance,
+    get_cached_squads,
+    get_cached_top_entries,
+)
+from .club_leaderboard import (
+    DEFAULT_DISTANCE,
+    get_club_leaderboard,
+    get_club_leaderboard_distances,
+)
+from .etags import (
+    get_erg_history_etag,
+    get_index_etag,
+    get_squad_scoreboard_etag,
+)
+from .export import CONTENT_TYPES, HISTORY_COLUMNS, SQUAD_COLUMNS, stream_ergs
+from .importer import CSVImportError, import_ergs
+from .jobs import claim_sync_job, enqueue_sync_job, run_sync_job_async
+from .leaderboard import get_member_entry, get_member_rank, get_month_range
+from .metrics import view_metrics
+from .pagination import paginate_by_keyset
+from .personal_bests import is_personal_best
+from .models import ClubLeaderboardEntry, FinishedErg, PersonalBest, SyncJob
+from .quotes import get_quotes
+
+
+@method_decorator(condition(etag_func=get_index_etag), name="get")
 class Index(TemplateView):
     def get_template_names(self):
         if self.request.user.is_authenticated:
@@ -49,6 +92,8 @@ class Index(TemplateView):
                 completed_by=self.request.user.member, is_test=True
             ).order_by("-completed_at")[:3]
 
+            current_year = now().year
+            current_month = now().month
             if self.request.user.member.is_coach:
                 # Squad selection given from the template
                 squad = self.request.GET.get("squad")
@@ -58,65 +103,67 @@ class Index(TemplateView):
                     squad = squad_obj.id
                     context["current_squad"] = squad_obj
                 else:
-                    context["current_squad"] = Squad.objects.get(id=squad)
+                    context["current_squad"] = get_squad_from_list(squad)
                 erg_dist_of_month = get_erg_dist_of_month(squad)
-                best_end_split_tests = get_best_erg_test_of_squad(
-                    erg_dist_of_month, squad
+                top_three_entries = get_cached_top_entries(
+                    squad, current_year, current_month, erg_dist_of_month
                 )
-                top_three_splits = best_end_split_tests[:3]
-                splits_to_display = top_three_splits
+                splits_to_display = [entry.erg for entry in top_three_entries]
 
             else:
                 # Identify which distance is given as test metrics for the
                 # month
-                if self.request.user.member.squad:
-                    erg_dist_of_month = get_erg_dist_of_month(
-                        self.request.user.member.squad.id
-                    )
-                    squad = self.request.user.member.squad.squad_name
+                member = self.request.user.member
+                users_entry = None
+                if member.squad_id:
+                    erg_dist_of_month = get_erg_dist_of_month(member.squad_id)
                     # Get the three best erg scores for that distance in that
-                    # month from the squad of the logged in user
-                    best_end_split_tests = get_best_erg_test_of_squad(
-                        erg_dist_of_month, self.request.user.member.squad.id
+                    # month from the squad of the logged in user, the entry
+                    # of the user only has to be looked up if it is not part
+                    # of them
+                    top_three_entries = get_cached_top_entries(
+                        member.squad_id,
+                        current_year,
+                        current_month,
+                        erg_dist_of_month,
                     )
-                    users_best_split = (
-                        FinishedErg.objects.filter(
-                            completed_by=self.request.user.member,
-                            is_test=True,
-                            completed_at__month=now().month,
-                            distance=erg_dist_of_month,
-                        )
-                        .order_by("split_time")
-                        .first()
+                    top_three_splits = [entry.erg for entry in top_three_entries]
+                    users_entry = next(
+                        (
+                            entry
+                            for entry in top_three_entries
+                            if entry.member_id == member.pk
+                        ),
+                        None,
                     )
-                    top_three_splits = best_end_split_tests[:3]
+                    if users_entry is None and erg_dist_of_month:
+                        users_entry = get_member_entry(
+                            member.squad_id,
+                            current_year,
+                            current_month,
+                            erg_dist_of_month,
+                            member,
+                        )
                 else:
-                    users_best_split = None
                     erg_dist_of_month = None
 
-                # Get the best split for that distance and month from the
-                # currently logged in user to then see if he is in the top 3
                 # Check if user is in top3, if so then just display the top3
                 # and highlight him in it, if not display his position under
                 # the top3 and highlight it in red
 
-                if not users_best_split:
+                if not users_entry:
                     # USER has not entered an erg test
+                    users_best_split = None
                     users_position = None
 
-                elif users_best_split in top_three_splits:
-                    # USERS test split is in the top 3 splits of the squad
-                    splits_to_display = top_three_splits
-                    users_position = list(splits_to_display).index(users_best_split) + 1
-
                 else:
-                    # USERS tests split is not in the top 3 splits of the squad
-                    splits_to_display += top_three_splits
-                    splits_to_display.append(users_best_split)
-                    # Get position of users split in leaderboard
-                    users_position = (
-                        list(best_end_split_tests).index(users_best_split) + 1
-                    )
+                    users_best_split = users_entry.erg
+                    users_position = users_entry.rank
+                    splits_to_display = top_three_splits
+                    if users_position > 3:
+                        # USERS tests split is not in the top 3 splits of the
+                        # squad
+                        splits_to_display.append(users_best_split)
                 context["users_best_split"] = users_best_split
                 context["users_position"] = users_position
                 context["quote"] = get_rndm_motiv_quote(users_position)
@@ -127,11 +174,15 @@ class Index(TemplateView):
                 my_last_ergs = my_last_tests
 
             context["my_last_ergs"] = my_last_ergs
+            context["personal_bests"] = PersonalBest.objects.filter(
+                member=self.request.user.member,
+                distance__in=STANDARD_DISTANCES,
+            )
             context["squads"] = get_list_of_squads()
             context["erg_dist_of_month"] = erg_dist_of_month
-            context["current_month"] = now().month
-            context["current_month_char"] = calendar.month_abbr[now().month]
-            context["current_year"] = now().year
+            context["current_month"] = current_month
+            context["current_month_char"] = calendar.month_abbr[current_month]
+            context["current_year"] = current_year
             context["splits_to_display"] = splits_to_display
             context["q"] = q
         return context
@@ -142,19 +193,25 @@ def get_rndm_motiv_quote(users_position):
     This function returns a winning related quote, if the user is at the first
     place in his squad, otherwise it returns a random motivational quote.
     """
-    with open("Erganiser/static/assets/data/quotes.json") as json_file:
-        data = json.load(json_file)
-        if users_position == "1":
-            quotes = data["winner_quotes"]
-        else:
-            quotes = data["motivational_quotes"]
-        quote = random.choice(quotes)
-        return quote
+    quotes = get_quotes()
+    if users_position == 1 and quotes.get("winner_quotes"):
+        return random.choice(quotes["winner_quotes"])
+    return random.choice(quotes["motivational_quotes"])
 
 
 def get_list_of_squads():
-    squads = Squad.objects.all()
-    return squads
+    return get_cached_squads()
+
+
+def get_squad_from_list(squad_id):
+    """
+    This function returns the squad with the given id from the cached list of
+    squads.
+    """
+    for squad in get_list_of_squads():
+        if str(squad.id) == str(squad_id):
+            return squad
+    raise Http404("Squad not found")
 
 
 def get_erg_dist_of_month(squad_id):
@@ -162,173 +219,163 @@ def get_erg_dist_of_month(squad_id):
     This function returns the distance of the erg test of the month for a given
     squad.
     """
-    ergs_of_the_month = FinishedErg.objects.filter(
-        completed_at__month=now().month, is_test=True, completed_by__squad__id=squad_id
-    )
-    if not ergs_of_the_month:
-        return None
-    this_month_dist = (
-        ergs_of_the_month.values_list("distance", flat=True)
-        .distinct()
-        .order_by("-distance")
-    )
-    erg_endurance_dist = this_month_dist.first()
-    return erg_endurance_dist
+    return get_cached_leaderboard_distance(squad_id, now().year, now().month)
 
 
-def get_best_erg_test_of_squad(dist_of_month, squad_id):
+@login_required
+def sync_c2_erg_data(request, latest=None):
     """
-    This orders the erg tests of the month by the split time to order the
-    fastest erg tests first.
+    This function is used to sync the erg data from the concept2 logbook api.
+    The sync itself is run by the run_sync_worker management command, this
+    view only queues it according to the user decision to sync all or just
+    the latest erg records from c2 and redirects right away. The progress can
+    be followed with the sync_status view.
     """
-    best_ergs = FinishedErg.objects.filter(
-        completed_at__month=now().month,
-        is_test=True,
-        completed_by__squad__id=squad_id,
-        distance=dist_of_month,
-    ).order_by("split_time")
-    return best_ergs
+    enqueue_sync_job(request.user.member, latest)
+    messages.add_message(
+        request,
+        messages.SUCCESS,
+        "Your Concept2 Logbook is being syncronised. Your Erg Workouts will "
+        "appear here in a moment.",
+    )
+    return HttpResponseRedirect(reverse("logbook:erg-history"))
 
 
-def convert_date_field(date):
-    """
-    This function converts a date string into a django datefield object.
-    """
-    date_object = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
-    django_datefield = date_object.date()
-    return django_datefield
+def get_sync_member(request):
+    if not request.user.is_authenticated:
+        return None
+    return Member.objects.select_related("user__profile").get(pk=request.user.pk)
 
 
-def calculate_split_time(total_time, distance):
+async def sync_c2_erg_data_async(request, latest=None):
     """
-    This function calculates the split time for a given distance and total time.
+    This function is the async version of sync_c2_erg_data, which is used if
+    C2_ASYNC_VIEWS is set. Instead of leaving the sync to the worker it runs
+    the queued job right away, but without blocking a thread while waiting for
+    the concept2 logbook api, so the ergs are there after the redirect.
+    Failures which are retried are left to the worker.
     """
-    split_in_sec = 500 * ((total_time * 0.1) / distance)
-    split = timedelta(seconds=round(split_in_sec))
-    return split
+    member = await sync_to_async(get_sync_member)(request)
+    if member is None:
+        return redirect_to_login(request.get_full_path())
+    job = await sync_to_async(enqueue_sync_job)(member, latest)
+    job = await sync_to_async(claim_sync_job)(job)
+    if job is None:
+        # The worker is already syncing the account
+        messages.success(
+            request,
+            "Your Concept2 Logbook is being syncronised. Your Erg Workouts will "
+            "appear here in a moment.",
+        )
+    else:
+        job = await run_sync_job_async(job)
+        if job.status == SyncJob.DONE:
+            messages.success(
+                request,
+                "Your Concept2 Logbook has been syncronised: {} new Erg "
+                "Workouts.".format(job.stored_ergs),
+            )
+        elif job.status == SyncJob.QUEUED:
+            messages.warning(request, "{} The sync will be retried.".format(job.error))
+        else:
+            messages.error(request, job.error)
+    return HttpResponseRedirect(reverse("logbook:erg-history"))
 
 
-def format_duration(time):
-    """
-    This function formats the duration of a workout into a timedelta object.
-    """
-    formatted_time = timedelta(seconds=round(time * 0.1))
-    return formatted_time
+def get_export_format(request):
+    export_format = request.GET.get("format", "csv")
+    if export_format not in CONTENT_TYPES:
+        raise Http404("Unknown export format")
+    return export_format
 
 
-def create_erg_object(workout, request):
+@login_required
+def export_erg_history(request):
     """
-    This function creates an erg object in the database. It is used to store
-    the results of an api call to get workouts done on a concept2 erg.
-    https://log.concept2.com/developers/documentation/#logbook-users-results
+    This function streams the erg history of the user as csv or ndjson file.
+    Coaches can export the history of any member with the member parameter.
     """
-    try:
-        erg = FinishedErg.objects.create(
-            name="Concept2 {distance}m. Row".format(distance=workout["distance"]),
-            c2_logbook_id=workout["id"],
-            completed_by=request.user.member,
-            distance=workout["distance"],
-            avg_spm=workout["stroke_rate"] if "stroke_rate" in workout else None,
-            completed_at=convert_date_field(workout["date"]),
-            result_time=format_duration(workout["time"]),
-            split_time=calculate_split_time(workout["time"], workout["distance"]),
-            avg_heartrate=workout["heart_rate"]["average"]
-            if "heart_rate" in workout and "average" in workout["heart_rate"]
-            else None,
-        )
-        erg.save()
-    except IntegrityError as e:
-        if "logbook_finishederg_c2_logbook_id_key" in e.args[0]:
-            messages.add_message(request, messages.INFO, "Already synced this Erg")
-            return messages
-    return erg
+    member = request.user.member
+    member_id = request.GET.get("member")
+    if member_id and member_id != str(member.pk):
+        if not member.is_coach:
+            raise PermissionDenied
+        if not member_id.isdigit():
+            raise Http404("Member not found")
+        member = get_object_or_404(Member.objects.select_related("user"), pk=member_id)
+    ergs = FinishedErg.objects.filter(completed_by=member).order_by(
+        "-completed_at", "-id"
+    )
+    return stream_ergs(
+        ergs,
+        HISTORY_COLUMNS,
+        get_export_format(request),
+        "erg-history-{}".format(member.user.username),
+    )
 
 
-def get_results_api_call_url(user_profile, has_latest):
+@login_required
+def export_erg_tests(request, year=None, month=None):
     """
-    This function returns the url for the api call to get either all the
-    workouts of a user or only the latest ones, which is determined by the
-    has_latest parameter. The last_sync param in the user profile is used to
-    determine the date from which the latest workouts should be synced.
+    This function streams the erg tests of all squads or, with the squad
+    parameter, of one squad as csv or ndjson file for coaches. Without a year
+    and month the tests of all seasons are exported.
     """
-    url = (
-        "https://log.concept2.com/api/users/{"
-        "c2_logbook_id}/results?type=rower".format(
-            c2_logbook_id=user_profile.c2_logbook_id
+    if not request.user.member.is_coach:
+        raise PermissionDenied
+    erg_tests = FinishedErg.objects.filter(
+        is_test=True, completed_by__squad__isnull=False
+    )
+    filename = "erg-tests"
+    if year and month:
+        if not 1 <= month <= 12:
+            raise Http404("Invalid month")
+        first_day, next_first_day = get_month_range(year, month)
+        erg_tests = erg_tests.filter(
+            completed_at__gte=first_day, completed_at__lt=next_first_day
         )
+        filename += "-{}-{:02d}".format(year, month)
+    squad_id = request.GET.get("squad")
+    if squad_id:
+        squad = get_squad_from_list(squad_id)
+        erg_tests = erg_tests.filter(completed_by__squad=squad)
+        filename += "-{}".format(slugify(squad.squad_name))
+    erg_tests = erg_tests.order_by(
+        "completed_by__squad__squad_name", "completed_at", "result_time"
     )
-    if has_latest is not None:
-        last_sync = user_profile.last_c2_sync.strftime("%Y-%m-%d %H:%M:%S")
-        url += "&from={last_sync}".format(last_sync=last_sync)
-    return url
+    return stream_ergs(erg_tests, SQUAD_COLUMNS, get_export_format(request), filename)
 
 
-def get_api_header(user_profile):
-    headers = {"Authorization": "Bearer {token}".format(token=user_profile.c2_api_key)}
-    return headers
-
-
-@login_required
-def sync_c2_erg_data(request, latest=None):
+def metrics(request):
     """
-    This function is used to sync the erg data from the concept2 logbook api.
-    It calls the get_results_api_call url function first which returns the
-    url according to the user decision to sync all or just the latest erg
-    records from c2.
-    It handles possible errors and displays an error message with the help
-    of the django messages framework.
-    If the api call is successful it calls a function to create and store the
-    erg object in the db. It also adds the respective time of the syncing to the
-    last synced parameter.
-    """
-    url = get_results_api_call_url(request.user.profile, latest)
-    headers = get_api_header(request.user.profile)
-    response = send_get_request_to_c2_api(url, headers)
-    if response.status_code == 401:
-        messages.add_message(
-            request,
-            messages.ERROR,
-            "Connection Error: {error}: If this error persists try to delete "
-            "the API Key in your profile and authorize yourself again."
-            "".format(error=response.json()["message"]),
-        )
-        return HttpResponseRedirect(reverse("logbook:log-erg"))
-    elif str(response.status_code).startswith("4") or str(
-        response.status_code
-    ).startswith("5"):
-        messages.add_message(
-            request,
-            messages.ERROR,
-            "Connection Error: {error}." "".format(error=response.json()["message"]),
-        )
-    data = response.json()
-    if "data" not in data:
-        messages.add_message(
-            request, messages.ERROR, "C2 API Error: No data in response"
-        )
-        return HttpResponseRedirect(reverse("logbook:log-erg"))
-    counter = 0
-    for workout in data["data"]:
-        erg = create_erg_object(workout, request)
-        if erg is not None:
-            request.user.profile.last_c2_sync = now()
-            request.user.profile.save()
-            counter += 1
-    messages.add_message(
-        request,
-        messages.SUCCESS,
-        "{} Erg Workouts "
-        "from your "
-        "Concept2 Logbook "
-        "have been "
-        "syncronised".format(counter),
+    This function returns the request metrics of this process in the
+    Prometheus text format. It is only available to staff users.
+    """
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(
+        view_metrics.export(), content_type="text/plain; version=0.0.4; charset=utf-8"
     )
-    return HttpResponseRedirect(reverse("logbook:erg-history"))
 
 
-def send_get_request_to_c2_api(url, headers):
-    response = requests.get(url, headers=headers, timeout=3)
-    return response
+@login_required
+def sync_status(request, pk):
+    """
+    This view reports the progress of a sync job of the current user as json.
+    """
+    job = get_object_or_404(SyncJob, pk=pk, member=request.user.member)
+    return JsonResponse(
+        {
+            "id": str(job.pk),
+            "status": job.status,
+            "attempts": job.attempts,
+            "synced_workouts": job.synced_workouts,
+            "stored_ergs": job.stored_ergs,
+            "error": job.error,
+            "created_at": job.created_at.isoformat(),
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+    )
 
 
 class LogErg(LoginRequiredMixin, CreateView):
@@ -364,6 +411,138 @@ class LogErgTest(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
+class ImportErgs(LoginRequiredMixin, FormView):
+    """
+    CBV to import the erg workouts of the user from the csv export of the
+    concept2 logbook or a generic csv file.
+    """
+
+    template_name = "logbook/import_ergs.html"
+    form_class = ImportErgsForm
+
+    def get_success_url(self):
+        return reverse("logbook:erg-history")
+
+    def form_valid(self, form):
+        # The upload is decoded while it is read, so it is never held in
+        # memory as a whole.
+        lines = io.TextIOWrapper(
+            form.cleaned_data["file"], encoding="utf-8-sig", newline=""
+        )
+        try:
+            result = import_ergs(lines, self.request.user.member)
+        except (CSVImportError, UnicodeDecodeError, csv.Error) as error:
+            form.add_error("file", str(error))
+            return self.form_invalid(form)
+        messages.add_message(
+            self.request,
+            messages.SUCCESS,
+            "Imported {stored} Erg Workouts, {duplicates} were already in your "
+            "logbook.".format(stored=result.stored_ergs, duplicates=result.duplicates),
+        )
+        if result.invalid:
+            messages.add_message(
+                self.request,
+                messages.WARNING,
+                "{invalid} rows could not be imported. {errors}".format(
+                    invalid=result.invalid, errors=" ".join(result.errors[:5])
+                ),
+            )
+        return super().form_valid(form)
+
+
+def get_progress_data(request):
+    """
+    This function returns the progress statistics of the user and, if a coach
+    selected a squad, those of every member of the squad.
+    """
+    member = request.user.member
+    data = {"progress": get_progress(load_erg_history(member.pk))}
+    squad_id = request.GET.get("squad")
+    if member.is_coach and squad_id:
+        squad = get_squad_from_list(squad_id)
+        members = Member.objects.filter(squad=squad).select_related("user")
+        data["squad"] = squad.squad_name
+        data["squad_progress"] = get_squad_progress(
+            list(members.order_by("user__username"))
+        )
+    return data
+
+
+class Progress(LoginRequiredMixin, TemplateView):
+    """
+    CBV to display the progress of the user: personal bests, split trends,
+    monthly volume and charts of the rolling averages. Coaches can compare
+    the members of a squad.
+    """
+
+    template_name = "logbook/progress.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(get_progress_data(self.request))
+        if self.request.user.member.is_coach:
+            context["squads"] = get_list_of_squads()
+        return context
+
+
+@login_required
+def progress_data(request):
+    """
+    This function returns the data of the progress view as JSON for the
+    charts.
+    """
+    return JsonResponse(get_progress_data(request))
+
+
+class ClubLeaderboard(LoginRequiredMixin, TemplateView):
+    """
+    CBV to display the fastest ergs of the club over all time, the season or
+    the last 30 or 90 days for one distance. The leaderboard can be
+    narrowed down to one sex or squad with the query string.
+    """
+
+    template_name = "logbook/club-leaderboard.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        periods = dict(ClubLeaderboardEntry.PERIOD_CHOICES)
+        period = self.request.GET.get("period")
+        if period not in periods:
+            period = ClubLeaderboardEntry.SEASON
+        distances = get_club_leaderboard_distances(period)
+        distance = self.request.GET.get("distance", "")
+        if distance.isdigit() and int(distance) in distances:
+            distance = int(distance)
+        elif DEFAULT_DISTANCE in distances or not distances:
+            distance = DEFAULT_DISTANCE
+        else:
+            distance = distances[-1]
+        sexes = dict(Member._meta.get_field("sex").choices)
+        sex = self.request.GET.get("sex")
+        if sex not in sexes:
+            sex = None
+        squad = None
+        if self.request.GET.get("squad"):
+            squad = get_squad_from_list(self.request.GET["squad"])
+        context.update(
+            {
+                "periods": periods,
+                "period": period,
+                "distances": distances,
+                "distance": distance,
+                "sexes": sexes,
+                "sex": sex,
+                "squads": get_list_of_squads(),
+                "squad": squad,
+                "entries": get_club_leaderboard(
+                    period, distance, sex, squad.id if squad else None
+                ),
+            }
+        )
+        return context
+
+
 class ErgDetailView(LoginRequiredMixin, DetailView):
     """
     CBV to display the details of a finished erg workout.
@@ -374,29 +553,91 @@ class ErgDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, *args, **kwargs):
         context = super(ErgDetailView, self).get_context_data(**kwargs)
+        context["is_personal_best"] = is_personal_best(self.object)
         return context
 
 
-class MyErgHistory(LoginRequiredMixin, ListView):
+class OwnErgsMixin:
+    """
+    Mixin limiting the ergs of a view to the ones of the current user. Ergs
+    of other members are not found, so their owner never has to be fetched
+    and compared.
+    """
+
+    def get_queryset(self):
+        # The pk of the member is the pk of its user
+        return super().get_queryset().filter(completed_by_id=self.request.user.pk)
+
+
+@method_decorator(condition(etag_func=get_erg_history_etag), name="get")
+class MyErgHistory(LoginRequiredMixin, OwnErgsMixin, ListView):
     """
     CBV to display the erg history of the current user.
     """
 
     template_name = "logbook/erg_history.html"
     model = FinishedErg
-    ordering = ["-completed_at"]
+    ordering = ["-completed_at", "-id"]
     paginate_by = 10
 
-    def get_queryset(self):
-        # Get the queryset for the ListView
-        queryset = super().get_queryset()
-        # Filter the queryset based on the current user
-        queryset = queryset.filter(completed_by_id=self.request.user.member)
-        # Return the filtered queryset
-        return queryset
+    def paginate_queryset(self, queryset, page_size):
+        # The history is paginated with cursors, so deep pages are as fast as
+        # the first one. Numbered pages are still served for old links.
+        if self.page_kwarg in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+        page = paginate_by_keyset(queryset, page_size, self.request.GET.get("cursor"))
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Show the progress of a sync which is still queued or running
+        context["sync_job"] = (
+            SyncJob.objects.filter(
+                member=self.request.user.member,
+                status__in=[SyncJob.QUEUED, SyncJob.RUNNING],
+            )
+            .order_by("-created_at")
+            .first()
+        )
+        context["bulk_form"] = BulkEditErgsForm(member=self.request.user.member)
+        return context
+
+
+class BulkEditErgs(LoginRequiredMixin, FormView):
+    """
+    CBV to delete or update the ergs selected in the erg history of the
+    current user at once.
+    """
+
+    form_class = BulkEditErgsForm
+    http_method_names = ["post"]
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["member"] = self.request.user.member
+        return kwargs
+
+    def get_success_url(self):
+        return reverse("logbook:erg-history")
+
+    def form_valid(self, form):
+        erg_ids = [erg.pk for erg in form.cleaned_data["ergs"]]
+        if form.cleaned_data["action"] == form.DELETE:
+            count = delete_ergs(self.request.user.pk, erg_ids)
+            message = "Deleted {} Erg Workouts."
+        else:
+            count = update_ergs(self.request.user.pk, erg_ids, **form.get_changes())
+            message = "Updated {} Erg Workouts."
+        messages.add_message(self.request, messages.SUCCESS, message.format(count))
+        return super().form_valid(form)
+
+    def form_invalid(self, form):
+        for errors in form.errors.values():
+            messages.add_message(self.request, messages.ERROR, " ".join(errors))
+        return HttpResponseRedirect(self.get_success_url())
 
 
-class ErgDeleteView(LoginRequiredMixin, DeleteView):
+class ErgDeleteView(LoginRequiredMixin, OwnErgsMixin, DeleteView):
     """
     CBV to delete an erg workout.
     """
@@ -407,15 +648,8 @@ class ErgDeleteView(LoginRequiredMixin, DeleteView):
     def get_success_url(self):
         return reverse("logbook:erg-history")
 
-    def dispatch(self, request, *args, **kwargs):
-        erg = self.get_object()
-        owner = erg.completed_by
-        if owner != self.request.user.member:
-            raise PermissionDenied
-        return super().dispatch(request, *args, **kwargs)
-
 
-class ErgUpdateView(LoginRequiredMixin, UpdateView):
+class ErgUpdateView(LoginRequiredMixin, OwnErgsMixin, UpdateView):
     """
     CBV to update an erg workout.
     """
@@ -428,19 +662,8 @@ class ErgUpdateView(LoginRequiredMixin, UpdateView):
     def get_success_url(self):
         return reverse("logbook:erg-detail", kwargs={"pk": self.object.pk})
 
-    def form_valid(self, form):
-        form.instance.completed_by = self.request.user.member
-        form.save()
-        return super().form_valid(form)
-
-    def dispatch(self, request, *args, **kwargs):
-        erg = self.get_object()
-        owner = erg.completed_by
-        if owner != self.request.user.member:
-            raise PermissionDenied
-        return super().dispatch(request, *args, **kwargs)
-
 
+@method_decorator(condition(etag_func=get_squad_scoreboard_etag), name="get")
 class SquadScoreBoard(LoginRequiredMixin, MonthArchiveView):
     """
     This CBV is used to display the squad scoreboard. It is a subclass of the
@@ -462,43 +685,30 @@ class SquadScoreBoard(LoginRequiredMixin, MonthArchiveView):
     def get_context_data(self, *, object_list=None, **kwargs):
         current_month = self.get_month()
         current_year = self.get_year()
+        first_day, next_first_day = get_month_range(
+            int(current_year), int(current_month)
+        )
         distances = []
         context = super(SquadScoreBoard, self).get_context_data(**kwargs)
         if self.request.user.member.is_coach is False:
             erg_tests = FinishedErg.objects.filter(
-                completed_at__year=current_year,
-                completed_at__month=current_month,
+                completed_at__gte=first_day,
+                completed_at__lt=next_first_day,
                 is_test=True,
                 completed_by__squad=self.request.user.member.squad,
-            ).order_by("result_time")
+            ).order_by("result_time", "split_time")
         else:
             # If user is coach get all erg tests
             # -------------------------------------
             erg_tests = FinishedErg.objects.filter(
-                completed_at__year=current_year,
-                completed_at__month=current_month,
+                completed_at__gte=first_day,
+                completed_at__lt=next_first_day,
                 is_test=True,
-            ).order_by("result_time")
-            squads = Squad.objects.all()
-            squads_erg_tests = {}
+            ).order_by("result_time", "split_time")
             q = self.request.GET.get("distance")
-            for squad in squads:
-                if q:
-                    squads_erg_tests[squad.squad_name] = FinishedErg.objects.filter(
-                        completed_at__year=current_year,
-                        completed_at__month=current_month,
-                        completed_by__squad=squad,
-                        distance=q,
-                        is_test=True,
-                    ).order_by("result_time")
-                else:
-                    squads_erg_tests[squad.squad_name] = FinishedErg.objects.filter(
-                        completed_at__year=current_year,
-                        completed_at__month=current_month,
-                        is_test=True,
-                        completed_by__squad=squad,
-                    ).order_by("result_time")
-            context["squads_erg_tests"] = squads_erg_tests
+            context["squads_erg_tests"] = get_squads_erg_tests(
+                first_day, next_first_day, q
+            )
         # ------------------------------------------------------------------------------------
         if not erg_tests:
             # If no erg tests are logged for the month, return empty context
@@ -516,13 +726,53 @@ class SquadScoreBoard(LoginRequiredMixin, MonthArchiveView):
         context["distances"] = distances
         context["erg_tests"] = erg_tests
         q = self.request.GET.get("distance")
+        member = self.request.user.member
+        if not member.is_coach and member.squad_id:
+            context["users_position"] = get_member_rank(
+                member.squad_id,
+                int(current_year),
+                int(current_month),
+                int(q) if q else greatest_distance,
+                member,
+            )
         if q:
             queryset = FinishedErg.objects.filter(
-                completed_at__year=current_year,
-                completed_at__month=current_month,
+                completed_at__gte=first_day,
+                completed_at__lt=next_first_day,
                 completed_by__squad=self.request.user.member.squad,
                 distance=q,
                 is_test=True,
-            ).order_by("result_time")
+            ).order_by("result_time", "split_time")
             context["erg_tests"] = queryset
         return context
+
+
+def get_squads_erg_tests(first_day, next_first_day, distance=None):
+    """
+    This function returns the erg tests of every squad for the given date
+    range, ordered by result time and annotated with their position in the
+    squad. All tests are fetched in one query and grouped by squad here.
+    """
+    squads_erg_tests = {squad.squad_name: [] for squad in get_cached_squads()}
+    erg_tests = FinishedErg.objects.filter(
+        completed_at__gte=first_day,
+        completed_at__lt=next_first_day,
+        is_test=True,
+        completed_by__squad__isnull=False,
+    )
+    if distance:
+        erg_tests = erg_tests.filter(distance=distance)
+    erg_tests = (
+        erg_tests.select_related("completed_by__user", "completed_by__squad")
+        .annotate(
+            position=Window(
+                expression=Rank(),
+                partition_by=F("completed_by__squad"),
+                order_by=[F("result_time").asc(), F("split_time").asc()],
+            )
+        )
+        .order_by("completed_by__squad__squad_name", "position")
+    )
+    for erg in erg_tests:
+        squads_erg_tests[erg.completed_by.squad.squad_name].append(erg)
+    return squads_erg_tests
@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class MemberBackend(ModelBackend):
+    """
+    Authentication backend loading the member, its squad and the profile
+    together with the user of a request. Nearly every page reads
+    request.user.member, so they are fetched in the one query the session
+    needs anyway instead of lazily one after another.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = (
+                get_user_model()
+                ._default_manager.select_related("member__squad", "profile")
+                .get(pk=user_id)
+            )
+        except get_user_model().DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
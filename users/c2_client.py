@@ -0,0 +1,149 @@
+"""
+Shared http client for all calls to the concept2 logbook api. It keeps one
+requests session per process, so the connections (and their TLS handshakes)
+are reused between calls, retries rate limited and failed requests with a
+backoff and always sets a timeout.
+
+The async views use an httpx client with the same settings instead, one per
+event loop, which is one per process under an ASGI server.
+https://log.concept2.com/developers/documentation/
+"""
+import asyncio
+import threading
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+_session = None
+_session_lock = threading.Lock()
+# An httpx client can only be used in the event loop it was created in
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def create_session():
+    retry = Retry(
+        total=settings.C2_API_RETRIES,
+        backoff_factor=settings.C2_API_RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUS_CODES,
+        respect_retry_after_header=True,
+        # Hand the last error response back instead of raising, so the
+        # callers can report the message of the api.
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.C2_API_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept"] = "application/vnd.c2logbook.v1+json"
+    return session
+
+
+def get_session():
+    """
+    This function returns the session of this process and creates it on the
+    first call.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def reset_session():
+    """
+    This function closes the session, e.g. after the settings changed. The
+    next call creates a new one.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+    _async_clients.clear()
+
+
+def get_timeout():
+    return settings.C2_API_CONNECT_TIMEOUT, settings.C2_API_READ_TIMEOUT
+
+
+def get(url, headers=None, **kwargs):
+    kwargs.setdefault("timeout", get_timeout())
+    return get_session().get(url, headers=headers, **kwargs)
+
+
+def post(url, data=None, headers=None, **kwargs):
+    # POST requests are only retried if the connection could not be made,
+    # an authorisation code must not be sent twice.
+    kwargs.setdefault("timeout", get_timeout())
+    return get_session().post(url, data=data, headers=headers, **kwargs)
+
+
+def create_async_client():
+    # The transport only retries failed connections, rate limited and failed
+    # requests are retried by aget.
+    transport = httpx.AsyncHTTPTransport(
+        retries=settings.C2_API_RETRIES,
+        limits=httpx.Limits(
+            max_connections=settings.C2_API_POOL_SIZE,
+            max_keepalive_connections=settings.C2_API_POOL_SIZE,
+        ),
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(
+            settings.C2_API_READ_TIMEOUT, connect=settings.C2_API_CONNECT_TIMEOUT
+        ),
+        headers={"Accept": "application/vnd.c2logbook.v1+json"},
+    )
+
+
+def get_async_client():
+    """
+    This function returns the async client of the running event loop and
+    creates it on the first call.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = create_async_client()
+    return client
+
+
+def get_retry_delay(response, attempt):
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return int(retry_after)
+    return settings.C2_API_RETRY_BACKOFF * 2**attempt
+
+
+async def aget(url, headers=None, **kwargs):
+    """
+    This function is the async version of get. Rate limited and failed
+    requests are retried with the same backoff, the last error response is
+    returned.
+    """
+    client = get_async_client()
+    for attempt in range(settings.C2_API_RETRIES + 1):
+        response = await client.get(url, headers=headers, **kwargs)
+        if (
+            response.status_code not in RETRY_STATUS_CODES
+            or attempt == settings.C2_API_RETRIES
+        ):
+            return response
+        await asyncio.sleep(get_retry_delay(response, attempt))
+
+
+async def apost(url, data=None, headers=None, **kwargs):
+    return await get_async_client().post(url, data=data, headers=headers, **kwargs)
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.3 on 2026-10-18 07:38
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def set_c2_synced_until(apps, schema_editor):
+    # Only the day of the synced ergs is stored, so the latest workouts are
+    # synced from the start of the day of the newest one.
+    Profile = apps.get_model("users", "Profile")
+    FinishedErg = apps.get_model("logbook", "FinishedErg")
+    newest_days = (
+        FinishedErg.objects.filter(c2_logbook_id__isnull=False)
+        .values_list("completed_by_id")
+        .annotate(newest_day=Max("completed_at"))
+    )
+    for member_id, newest_day in newest_days:
+        Profile.objects.filter(user_id=member_id, last_c2_sync__isnull=False).update(
+            c2_synced_until=datetime.datetime.combine(
+                newest_day, datetime.time(), tzinfo=datetime.timezone.utc
+            )
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0001_initial"),
+        ("logbook", "0009_clubleaderboardentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="c2_synced_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_c2_synced_until, migrations.RunPython.noop),
+    ]
@@ -26,6 +26,9 @@ class Profile(models.Model):
     c2_refresh_key = models.CharField(max_length=250, blank=True, null=True)
     c2_logbook_id = models.CharField(max_length=250, blank=True, null=True)
     last_c2_sync = models.DateTimeField(blank=True, null=True)
+    # Date of the newest workout of the last complete concept2 sync, from
+    # which the next sync of the latest workouts starts
+    c2_synced_until = models.DateTimeField(blank=True, null=True)
 
     def __str__(self):
         return f"Profile {self.user.username}"
@@ -1,11 +1,28 @@
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
-from django.contrib.auth.models import User
-from django.test import Client, RequestFactory, TestCase
+import httpx
+from asgiref.sync import async_to_sync
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages import get_messages
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory,
+    Client,
+    RequestFactory,
+    TestCase,
+    override_settings,
+)
 from django.urls import reverse
 
+from logbook.testing import C2StubServer, make_c2_workout
+from users import c2_client
+from users.backends import MemberBackend
 from users.forms import UserRegisterForm
-from users.views import get_access_key, refresh_access_key
+from users.models import Squad
+from users.views import get_access_key, oauth_with_c2_async, refresh_access_key
 
 
 class RegisterViewTest(TestCase):
@@ -60,6 +77,36 @@ class RegisterViewTest(TestCase):
         self.assertIn(expected_error, form.errors["username"])
 
 
+class MemberBackendTest(TestCase):
+    def setUp(self):
+        self.squad = Squad.objects.create(squad_name="Test Squad")
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.user.member.squad = self.squad
+        self.user.member.save()
+
+    def test_user_is_loaded_with_member_squad_and_profile(self):
+        with self.assertNumQueries(1):
+            user = MemberBackend().get_user(self.user.pk)
+            self.assertEqual(user.member.squad.squad_name, "Test Squad")
+            self.assertIsNone(user.profile.c2_logbook_id)
+
+    def test_inactive_and_unknown_users(self):
+        self.assertIsNone(MemberBackend().get_user(0))
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(MemberBackend().get_user(self.user.pk))
+
+    def test_requests_use_the_backend(self):
+        self.client.login(username="testuser", password="testpass")
+        response = self.client.get(reverse("logbook:log-erg"))
+        self.assertEqual(
+            self.client.session[BACKEND_SESSION_KEY], "users.backends.MemberBackend"
+        )
+        with self.assertNumQueries(0):
+            response.wsgi_request.user.member.squad
+            response.wsgi_request.user.profile
+
+
 class TestAPI(TestCase):
     def setUp(self):
         self.client = Client()
@@ -155,3 +202,100 @@ class TestAPI(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(str(messages[0]), "Your C2 API key has been refreshed")
         self.assertTemplateUsed(response, "users/profile.html")
+
+
+class C2ClientTest(TestCase):
+    def setUp(self):
+        c2_client.reset_session()
+        self.addCleanup(c2_client.reset_session)
+
+    def test_session_is_shared(self):
+        self.assertIs(c2_client.get_session(), c2_client.get_session())
+
+    def test_default_timeout(self):
+        with patch.object(c2_client.get_session(), "request") as mock_request:
+            c2_client.get("https://log.concept2.com/api/users/me")
+        _, kwargs = mock_request.call_args
+        self.assertEqual(kwargs["timeout"], c2_client.get_timeout())
+
+    @override_settings(C2_API_RETRY_BACKOFF=0)
+    def test_retries_server_errors(self):
+        with C2StubServer([make_c2_workout(1)], failures=2) as server:
+            response = c2_client.get(server.base_url + "/api/users/1/results")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(server.requested_paths), 3)
+
+    @override_settings(C2_API_RETRY_BACKOFF=0, C2_API_RETRIES=1)
+    def test_returns_last_error_response(self):
+        with C2StubServer([], failures=5) as server:
+            response = c2_client.get(server.base_url + "/api/users/1/results")
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json()["message"], "Stub error")
+
+
+class AsyncOAuthTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        patcher = patch("users.views.c2_client.apost", new_callable=AsyncMock)
+        self.mock_apost = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_request(self, user=None):
+        request = AsyncRequestFactory().get("/oauth_with_c2", {"code": "testcode"})
+        SessionMiddleware(HttpResponse).process_request(request)
+        MessageMiddleware(HttpResponse).process_request(request)
+        request.user = user or self.user
+        return request
+
+    def test_oauth_with_c2_initial(self):
+        self.mock_apost.return_value = httpx.Response(
+            200,
+            json={"access_token": "TestAccessKEY", "refresh_token": "TestRefresh"},
+        )
+        request = self.get_request()
+        response = async_to_sync(oauth_with_c2_async)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            str(list(get_messages(request))[0]), "Your C2 API key has been saved"
+        )
+        _, kwargs = self.mock_apost.call_args
+        self.assertEqual(kwargs["data"]["code"], "testcode")
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.c2_api_key, "TestAccessKEY")
+
+    def test_oauth_with_c2_refresh_error(self):
+        self.user.profile.c2_api_key = "TestAPIKey"
+        self.user.profile.save()
+        self.mock_apost.return_value = httpx.Response(400, content=b"Bad request")
+        request = self.get_request()
+        async_to_sync(oauth_with_c2_async)(request)
+        _, kwargs = self.mock_apost.call_args
+        self.assertEqual(kwargs["data"]["grant_type"], "refresh_token")
+        self.assertEqual(str(list(get_messages(request))[0]), "b'Bad request'")
+
+    def test_login_required(self):
+        response = async_to_sync(oauth_with_c2_async)(self.get_request(AnonymousUser()))
+        self.assertTrue(response.url.startswith(reverse("login")))
+        self.mock_apost.assert_not_called()
+
+
+class AsyncC2ClientTest(TestCase):
+    def setUp(self):
+        c2_client.reset_session()
+        self.addCleanup(c2_client.reset_session)
+
+    @override_settings(C2_API_RETRY_BACKOFF=0)
+    def test_retries_server_errors_with_one_client(self):
+        async def get_twice(url):
+            first = await c2_client.aget(url)
+            second = await c2_client.aget(url)
+            return first, second, c2_client.get_async_client()
+
+        with C2StubServer([make_c2_workout(1)], failures=2) as server:
+            first, second, client = async_to_sync(get_twice)(
+                server.base_url + "/api/users/1/results"
+            )
+            self.assertEqual((first.status_code, second.status_code), (200, 200))
+            self.assertEqual(len(server.requested_paths), 4)
+        self.assertEqual(first.json()["data"][0]["id"], 1)
+        self.assertEqual(client.headers["Accept"], "application/vnd.c2logbook.v1+json")
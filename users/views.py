@@ -1,12 +1,14 @@
-import requests
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
 from django.shortcuts import redirect, render
 from verify_email.email_handler import send_verification_email
 
 from Erganiser import settings
+from . import c2_client
 from .forms import MemberUpdateForm, ProfileUpdateForm, UserRegisterForm, UserUpdateForm
 
 
@@ -83,13 +85,8 @@ def profile(request):
     return render(request, "users/profile.html", context)
 
 
-def refresh_access_key(request):
-    """
-    This function refreshes the access key for the C2 API. It is called when
-    the user already has an access key and wants to refresh it.
-    https://log.concept2.com/developers/documentation/oauth
-    """
-    data = {
+def get_refresh_token_data(request):
+    return {
         "client_id": settings.C2_CLIENT_ID,
         "client_secret": settings.C2_CLIENT_SECRET,
         "grant_type": "refresh_token",
@@ -97,18 +94,11 @@ def refresh_access_key(request):
         "redirect_uri": request.get_host() + "/oauth_with_c2",
         "scope": "user:read,results:read",
     }
-    response = call_c2_oauth_api(data)
-    return response
 
 
-def get_access_key(request, auth_code):
-    """
-    This function gets the access key for the C2 API. It is called the first
-    time the user authorises the app to access their C2 data.
-    https://log.concept2.com/developers/documentation/oauth
-    """
+def get_authorization_code_data(request, auth_code):
     base_url = request.build_absolute_uri("/")[:-1]
-    data = {
+    return {
         "client_id": settings.C2_CLIENT_ID,
         "client_secret": settings.C2_CLIENT_SECRET,
         "code": auth_code,
@@ -116,7 +106,25 @@ def get_access_key(request, auth_code):
         "redirect_uri": f"{base_url}/oauth_with_c2",
         "scope": "user:read,results:read",
     }
-    response = call_c2_oauth_api(data)
+
+
+def refresh_access_key(request):
+    """
+    This function refreshes the access key for the C2 API. It is called when
+    the user already has an access key and wants to refresh it.
+    https://log.concept2.com/developers/documentation/oauth
+    """
+    response = call_c2_oauth_api(get_refresh_token_data(request))
+    return response
+
+
+def get_access_key(request, auth_code):
+    """
+    This function gets the access key for the C2 API. It is called the first
+    time the user authorises the app to access their C2 data.
+    https://log.concept2.com/developers/documentation/oauth
+    """
+    response = call_c2_oauth_api(get_authorization_code_data(request, auth_code))
     return response
 
 
@@ -133,22 +141,34 @@ def save_oauth_keys(response, request):
     user.save()
 
 
+C2_OAUTH_HEADERS = {
+    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+    "Accept": "application/vnd.c2logbook.v1+json",
+}
+
+
 def call_c2_oauth_api(data):
     """
     This function calls the C2 API to get the access key. It is called by both
     the get_access_key and refresh_access_key functions.
     https://log.concept2.com/developers/documentation/oauth
     """
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-        "Accept": "application/vnd.c2logbook.v1+json",
-    }
-    response = requests.post(
-        "https://log.concept2.com/oauth/access_token", headers=headers, data=data
+    response = c2_client.post(
+        settings.C2_API_BASE_URL + "/oauth/access_token",
+        headers=C2_OAUTH_HEADERS,
+        data=data,
     )
     return response
 
 
+async def call_c2_oauth_api_async(data):
+    return await c2_client.apost(
+        settings.C2_API_BASE_URL + "/oauth/access_token",
+        headers=C2_OAUTH_HEADERS,
+        data=data,
+    )
+
+
 def oauth_with_c2(request):
     """
     This view handles the different responses from the OAuth2 authorisation
@@ -178,3 +198,40 @@ def oauth_with_c2(request):
         elif str(response.status_code).startswith("4"):
             messages.error(request, response.content)
             return render(request, "users/profile.html")
+
+
+def get_oauth_profile(request):
+    # Loads the user and the profile, which the async view cannot do lazily
+    if not request.user.is_authenticated:
+        return None
+    return request.user.profile
+
+
+def render_oauth_result(request, response, success_message):
+    if response.status_code == 200:
+        save_oauth_keys(response, request)
+        messages.success(request, success_message)
+    else:
+        messages.error(request, response.content)
+    return render(request, "users/profile.html")
+
+
+async def oauth_with_c2_async(request):
+    """
+    This view is the async version of oauth_with_c2, which is used if
+    C2_ASYNC_VIEWS is set. No thread is blocked while the concept2 api is
+    asked for the keys, only saving them and rendering the profile run
+    through sync_to_async.
+    """
+    profile = await sync_to_async(get_oauth_profile)(request)
+    if profile is None:
+        return redirect_to_login(request.get_full_path())
+    if profile.c2_api_key:
+        response = await call_c2_oauth_api_async(get_refresh_token_data(request))
+        success_message = "Your C2 API key has been refreshed"
+    else:
+        response = await call_c2_oauth_api_async(
+            get_authorization_code_data(request, request.GET.get("code"))
+        )
+        success_message = "Your C2 API key has been saved"
+    return await sync_to_async(render_oauth_result)(request, response, success_message)